@@ -1,10 +1,28 @@
 # app/__init__.py
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
 import os # Needed by routes now if it wasn't imported already there
+from .models import InternedStrings
+from .metrics import timed
+
+
+class AppJSONProvider(DefaultJSONProvider):
+    """Flask's JSON encoding plus the compact containers processed app records use (see app.models)."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, InternedStrings):
+            return o.tolist() # Decoded to strings only here, when a response is written
+        return DefaultJSONProvider.default(o)
+
+    def response(self, *args, **kwargs):
+        with timed('serialize'): # jsonify() of every API response
+            return super().response(*args, **kwargs)
 
 def create_app(app_config=None):
     # Changed base path calculation slightly for robustness if instance folder needed relative paths
     app = Flask(__name__, instance_relative_config=False) # False if config is in project root, True if in instance/
+    app.json = AppJSONProvider(app)
 
     # Load configuration
     if app_config:
@@ -32,6 +50,10 @@ def create_app(app_config=None):
         from . import routes
         app.register_blueprint(routes.bp)
 
+        if app.config.get('BACKGROUND_REFRESH'):
+            from .processing import start_background_refresh
+            start_background_refresh(app)
+
         # Could Initialize extensions (DB, Login Manager etc.) here
         # Example: db.init_app(app)
 
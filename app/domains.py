@@ -0,0 +1,65 @@
+# app/domains.py
+# Subdomain rollup: traffic to a subdomain of a known app's domain (api.dropbox.com, eu.files.box.com)
+# is attributed to that app instead of showing up as a separate unknown one. The catalog domains are
+# kept in a trie of their labels from the TLD down; each distinct destination domain is matched once.
+import numpy as np
+import pandas as pd
+
+
+class DomainSuffixIndex:
+    """
+    Reversed-label suffix trie over the known-apps catalog domains. A destination domain rolls up to
+    the longest catalog domain it equals or is a subdomain of, comparing whole labels (surrounding
+    whitespace ignored): app.dropbox.com -> dropbox.com, but not mydropbox.com.
+    """
+    _APP = None # Trie key holding the catalog domain that ends at a node (labels are strings)
+
+    def __init__(self, domains):
+        self._root = {}
+        self._size = 0
+        for domain in domains:
+            if not isinstance(domain, str) or domain.strip() == '':
+                continue
+            node = self._root
+            for label in reversed(domain.strip().split('.')):
+                node = node.setdefault(label, {})
+            if self._APP not in node:
+                node[self._APP] = domain.strip()
+                self._size += 1
+
+    def __len__(self):
+        return self._size
+
+    def app_for(self, domain):
+        """The catalog domain `domain` rolls up to, None if it isn't one of them or a subdomain of one."""
+        if not isinstance(domain, str):
+            return None
+        node, app = self._root, None
+        for label in reversed(domain.strip().split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            app = node.get(self._APP, app)
+        return app
+
+    def rollup(self, domains):
+        """
+        Object array with the app domain of each of `domains` (pass the distinct values): the catalog
+        domain it rolls up to, or the domain itself, as is, when there is none.
+        """
+        return np.array([self.app_for(domain) or domain for domain in domains], dtype=object)
+
+    def members(self, app, domains):
+        """The domains among `domains` (e.g. every logged one) that roll up to the catalog domain `app`."""
+        suffix = '.' + app
+        return [domain for domain in domains
+                if (domain == app or domain.endswith(suffix)) and self.app_for(domain) == app]
+
+
+def rolled_up_codes(codes, values, domain_index):
+    """
+    Re-codes factorized domains (codes into `values`, -1 for missing) by the app they roll up to.
+    Returns (codes, app values), the app values in sorted order.
+    """
+    app_codes, app_values = pd.factorize(domain_index.rollup(values), sort=True)
+    return np.append(app_codes, -1)[codes], np.asarray(app_values, dtype=object)
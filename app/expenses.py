@@ -0,0 +1,92 @@
+# app/expenses.py
+# Expense linking index: matches app expense keywords against vendor names once per data load
+# instead of running a regex over the whole expense table for every app.
+import re
+
+import numpy as np
+import pandas as pd
+
+# Keywords and vendor names made only of ASCII letters/digits/underscore can be matched through the
+# token lookup: `\bkw\b` then simply means "kw is one of the name's \w+ runs", case-insensitively.
+_ASCII_WORD = re.compile(r'[A-Za-z0-9_]+')
+_TOKEN = re.compile(r'\w+')
+
+
+class ExpenseIndex:
+    """
+    Resolves expense keywords to linked expense rows with the same semantics as
+    vendor_name.astype(str).str.contains(r'\\b(?:kw1|kw2)\\b', case=False, na=False).
+    """
+
+    def __init__(self, expenses_df):
+        self.usable = (not expenses_df.empty and 'vendor_name' in expenses_df.columns
+                       and 'amount' in expenses_df.columns)
+        self._keyword_cache = {}
+        if not self.usable:
+            return
+
+        # Work on distinct vendor names; missing names never match (na=False)
+        name_codes, names = pd.factorize(expenses_df['vendor_name'].astype(str))
+        self._names = [str(name) for name in names]
+        self._amounts = expenses_df['amount'].to_numpy()
+        if self._amounts.dtype.kind == 'f':
+            self._amounts = np.where(np.isnan(self._amounts), 0.0, self._amounts) # Series.sum() skips NaN
+
+        # Expense rows of each distinct name, in original row order (CSR layout)
+        valid_rows = np.flatnonzero(name_codes >= 0)
+        order = np.argsort(name_codes[valid_rows], kind='stable')
+        self._rows = valid_rows[order]
+        counts = np.bincount(name_codes[valid_rows], minlength=len(self._names))
+        self._row_starts = np.concatenate(([0], np.cumsum(counts)))
+
+        # Lower-cased \w+ token -> codes of the ASCII names containing it. Non-ASCII names
+        # (whose case folding differs from str.lower()) are left to the regex fallback.
+        self._token_names = {}
+        self._non_ascii_names = []
+        for code, name in enumerate(self._names):
+            if not name.isascii():
+                self._non_ascii_names.append(code)
+                continue
+            for token in set(_TOKEN.findall(name.lower())):
+                self._token_names.setdefault(token, []).append(code)
+
+    def _names_matching(self, keyword):
+        """Codes of the vendor names containing `keyword` as a whole word (cached per keyword)."""
+        codes = self._keyword_cache.get(keyword)
+        if codes is not None:
+            return codes
+
+        pattern = re.compile(r'\b' + re.escape(keyword) + r'\b', re.IGNORECASE)
+        if _ASCII_WORD.fullmatch(keyword):
+            codes = set(self._token_names.get(keyword.lower(), ()))
+            candidates = self._non_ascii_names
+        else:
+            codes = set()
+            candidates = range(len(self._names))
+        codes.update(code for code in candidates if pattern.search(self._names[code]))
+        self._keyword_cache[keyword] = codes
+        return codes
+
+    def link(self, keywords):
+        """Returns (linked_count, linked_total) of the expenses matching any of the keywords."""
+        if not keywords or not self.usable:
+            return 0, 0.0
+        name_codes = set()
+        for keyword in keywords:
+            name_codes |= self._names_matching(keyword)
+        if not name_codes:
+            return 0, 0.0
+
+        rows = np.concatenate([self._rows[self._row_starts[code]:self._row_starts[code + 1]] for code in name_codes])
+        rows.sort() # Sum in original row order so totals match summing the filtered DataFrame
+        total = self._amounts[rows].sum()
+        return len(rows), (float(total) if pd.notna(total) else 0.0)
+
+    def link_all(self, keyword_lists):
+        """Linked (counts, totals) arrays for a sequence of keyword lists, e.g. every app's expense_keywords."""
+        counts = np.zeros(len(keyword_lists), dtype=np.int64)
+        totals = np.zeros(len(keyword_lists), dtype=float)
+        for i, keywords in enumerate(keyword_lists):
+            if keywords:
+                counts[i], totals[i] = self.link(keywords)
+        return counts, totals
@@ -0,0 +1,190 @@
+# app/frame_cache.py
+# On-disk cache of the cleaned input frames, so a process start or cache expiry doesn't re-parse
+# unchanged CSVs. Each frame is stored column by column as .npy files (memory-mapped on load)
+# next to a JSON manifest. Text columns are stored dictionary-encoded: int32 codes + the distinct values.
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from . import metrics
+
+CACHE_FORMAT = 2 # Bump when the on-disk layout or a reader's cleaning changes
+_NA_CODES = {-1: None, -2: np.nan} # Missing values in dictionary-encoded columns
+
+
+class UncacheableFrame(Exception):
+    """The frame holds values the cache can't store exactly, it is just read from source every time."""
+
+
+def load_frame(path, reader, cache_dir):
+    """
+    Returns reader(path), served from the cache in cache_dir while the source file is unchanged
+    (same size and mtime). With no cache_dir this is simply reader(path).
+    """
+    if not cache_dir:
+        return reader(path)
+
+    signature = _source_signature(path)
+    entry_dir = os.path.join(cache_dir, _entry_name(path, reader, signature))
+    if os.path.isdir(entry_dir):
+        try:
+            frame = _read_entry(entry_dir)
+            metrics.inc('cache_requests_total', cache='frame', result='hit')
+            return frame
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable frame cache entry {entry_dir}: {e}")
+
+    metrics.inc('cache_requests_total', cache='frame', result='miss')
+    frame = reader(path)
+    if _source_signature(path) == signature: # Don't cache a file that changed while we read it
+        try:
+            _write_entry(frame, cache_dir, entry_dir)
+        except UncacheableFrame as e:
+            print(f"Note: Not caching {os.path.basename(path)}: {e}")
+        except OSError as e:
+            print(f"Warning: Could not write frame cache for {path}: {e}")
+    return frame
+
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_size, stat.st_mtime_ns]
+
+
+def _entry_name(path, reader, signature):
+    # <source hash>-<version hash>: older versions of the same source are found by the prefix and removed
+    source = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+    version = hashlib.sha1(json.dumps([CACHE_FORMAT, reader.__qualname__, signature]).encode('utf-8')).hexdigest()[:16]
+    return f"{source}-{version}"
+
+
+# --- Encoding ---
+def _write_entry(frame, cache_dir, entry_dir):
+    columns = [(name, frame[name]) for name in frame.columns]
+    if not isinstance(frame.index, pd.RangeIndex) or frame.index.start != 0 or frame.index.step != 1:
+        columns.append((None, frame.index.to_series(index=pd.RangeIndex(len(frame)))))
+    if len(set(frame.columns)) != len(frame.columns) or not all(isinstance(name, str) for name in frame.columns):
+        raise UncacheableFrame("column names must be unique strings")
+
+    tmp_dir = f"{entry_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    try:
+        manifest = {'rows': len(frame), 'columns': [], 'index': None}
+        for position, (name, series) in enumerate(columns):
+            spec = _write_column(series, os.path.join(tmp_dir, f"c{position}"))
+            if name is None:
+                spec['name'] = series.name
+                manifest['index'] = spec
+            else:
+                spec['name'] = name
+                manifest['columns'].append(spec)
+        with open(os.path.join(tmp_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+
+        # Drop stale entries of the same source, then publish the new one atomically
+        prefix = os.path.basename(entry_dir).split('-')[0] + '-'
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix) and '.tmp-' not in name:
+                shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _write_column(series, base_path):
+    dtype = series.dtype
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        values = series.dt.tz_convert('UTC').dt.tz_localize(None).to_numpy()
+        np.save(base_path + '.npy', values)
+        return {'kind': 'datetime_tz', 'tz': str(dtype.tz), 'file': os.path.basename(base_path) + '.npy'}
+    if isinstance(dtype, np.dtype) and dtype.kind in 'biufmM':
+        np.save(base_path + '.npy', series.to_numpy())
+        return {'kind': 'array', 'file': os.path.basename(base_path) + '.npy'}
+    if isinstance(dtype, pd.CategoricalDtype):
+        # Already dictionary-encoded: store the codes as they are
+        categories = dtype.categories.tolist()
+        if not all(type(value) in (str, bool, int, float) for value in categories):
+            raise UncacheableFrame(f"unsupported categories in column {series.name!r}")
+        np.save(base_path + '.npy', series.cat.codes.to_numpy())
+        return {'kind': 'categorical', 'categories': categories, 'ordered': bool(dtype.ordered),
+                'categories_dtype': str(dtype.categories.dtype), 'file': os.path.basename(base_path) + '.npy'}
+    if isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in 'iu':
+        # Nullable integers (e.g. packed IPs): values plus a missing-value mask
+        np.save(base_path + '.npy', series.to_numpy(dtype=dtype.numpy_dtype, na_value=0))
+        np.save(base_path + '.mask.npy', series.isna().to_numpy())
+        return {'kind': 'masked', 'dtype': str(dtype), 'file': os.path.basename(base_path) + '.npy',
+                'mask_file': os.path.basename(base_path) + '.mask.npy'}
+    if dtype == object or pd.api.types.is_string_dtype(dtype):
+        codes, categories = _dictionary_encode(series)
+        np.save(base_path + '.npy', codes)
+        return {'kind': 'dictionary', 'dtype': str(dtype), 'categories': categories,
+                'file': os.path.basename(base_path) + '.npy'}
+    raise UncacheableFrame(f"unsupported dtype {dtype} in column {series.name!r}")
+
+
+def _dictionary_encode(series):
+    codes, uniques = pd.factorize(series)
+    categories = uniques.tolist()
+    for value in categories:
+        # Exact JSON round trip only: bool is checked by type since it's an int subclass
+        if type(value) not in (str, bool, int, float):
+            raise UncacheableFrame(f"value of type {type(value).__name__} in column {series.name!r}")
+    codes = codes.astype(np.int32)
+    missing = np.flatnonzero(codes < 0)
+    if len(missing):
+        # factorize lumps None and NaN together, keep which one each row held
+        na_values = series.to_numpy(dtype=object)[missing]
+        is_none = np.array([value is None for value in na_values], dtype=bool)
+        is_nan = np.array([isinstance(value, float) for value in na_values], dtype=bool)
+        if not (is_none | is_nan).all():
+            raise UncacheableFrame(f"unsupported missing value in column {series.name!r}")
+        codes[missing[is_nan]] = -2
+    return codes, categories
+
+
+# --- Decoding ---
+def _read_entry(entry_dir):
+    with open(os.path.join(entry_dir, 'manifest.json'), encoding='utf-8') as f:
+        manifest = json.load(f)
+    index = None
+    if manifest['index'] is not None:
+        values, dtype = _read_column(entry_dir, manifest['index'])
+        index = pd.Index(values, dtype=dtype, name=manifest['index']['name'])
+    # Explicit dtypes: pandas would otherwise re-infer object columns holding strings
+    data = {}
+    for spec in manifest['columns']:
+        values, dtype = _read_column(entry_dir, spec)
+        data[spec['name']] = pd.Series(values, index=index, dtype=dtype, copy=False)
+    frame = pd.DataFrame(data, index=index, columns=[spec['name'] for spec in manifest['columns']], copy=False)
+    if len(frame) != manifest['rows']:
+        raise ValueError("row count mismatch")
+    return frame
+
+
+def _read_column(entry_dir, spec):
+    """(values, dtype) of a stored column."""
+    # Copy-on-write mapping: pages are read lazily and in-place edits stay private to the process
+    values = np.load(os.path.join(entry_dir, spec['file']), mmap_mode='c', allow_pickle=False).view(np.ndarray)
+    if spec['kind'] == 'array':
+        return values, values.dtype
+    if spec['kind'] == 'datetime_tz':
+        values = pd.DatetimeIndex(values).tz_localize('UTC').tz_convert(spec['tz'])
+        return values, values.dtype
+    if spec['kind'] == 'categorical':
+        categories = pd.Index(spec['categories'], dtype=spec['categories_dtype'])
+        values = pd.Categorical.from_codes(values, categories=categories, ordered=spec['ordered'])
+        return values, values.dtype
+    if spec['kind'] == 'masked':
+        mask = np.load(os.path.join(entry_dir, spec['mask_file']), allow_pickle=False)
+        values = pd.arrays.IntegerArray(values, mask)
+        return values, spec['dtype']
+    # Dictionary-encoded: codes -1/-2 index the missing values appended after the categories
+    lookup = np.empty(len(spec['categories']) + 2, dtype=object)
+    lookup[:len(spec['categories'])] = spec['categories']
+    lookup[-2], lookup[-1] = _NA_CODES[-2], _NA_CODES[-1]
+    return lookup[values], spec['dtype']
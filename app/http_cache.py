@@ -0,0 +1,60 @@
+# app/http_cache.py
+# HTTP caching of the JSON API. GET responses carry a weak ETag naming the data version they were
+# built from, so a client revalidating with If-None-Match gets a 304 without the response being built
+# again. Large JSON bodies are gzip-compressed for clients that accept it.
+import functools
+import gzip
+import os
+
+from flask import request, current_app
+
+from . import metrics
+
+_PROCESS_TAG = os.urandom(4).hex() # Data versions are counted per process, so are the ETags
+
+
+def etag_for(version):
+    return f'{_PROCESS_TAG}-{version}'
+
+
+def conditional_get(version_of):
+    """
+    Decorator for JSON GET views whose response only depends on the request and the data version
+    returned by version_of(). Answers a matching If-None-Match with 304 instead of calling the view.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                tag = etag_for(version_of())
+            except Exception:
+                return view(*args, **kwargs) # The view reports the error
+            if request.if_none_match.contains_weak(tag):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            # The view may have seen a newer version than the tag (never an older one), costing one extra fetch at most
+            response.set_etag(tag, weak=True)
+            response.headers['Cache-Control'] = 'no-cache' # Cache, but revalidate before every use
+            return response
+        return wrapper
+    return decorator
+
+
+def compress_response(response):
+    """after_request hook: gzips JSON bodies of at least RESPONSE_GZIP_MIN_BYTES for clients accepting gzip."""
+    if (response.status_code != 200 or response.direct_passthrough or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'gzip' not in request.accept_encodings:
+        return response
+    body = response.get_data()
+    if len(body) < current_app.config.get('RESPONSE_GZIP_MIN_BYTES', 1024):
+        return response
+    with metrics.timed('gzip'):
+        response.set_data(gzip.compress(body, compresslevel=current_app.config.get('RESPONSE_GZIP_LEVEL', 6), mtime=0))
+    response.headers['Content-Encoding'] = 'gzip'
+    return response
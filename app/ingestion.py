@@ -0,0 +1,789 @@
+# app/ingestion.py
+# Streaming ingestion of the network log. Rows are read in bounded chunks and folded into running
+# per-domain and per-(domain, user) aggregates, then dropped - memory follows the number of
+# domains and users seen, not the size of the log. Large logs can be split into byte ranges folded by
+# a pool of worker processes, whose partial aggregates are then merged in log order. A log can also
+# be a directory or glob of rotated segments (plain, .gz or .zst), folded one segment at a time.
+# The aggregates are also kept per hour (see NetworkAggregates.window), to answer time-window queries:
+# those grow with the time span of the log too, up to one row per (domain, user) active in each hour.
+import copy
+import glob
+import gzip
+import io
+import ipaddress
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .models import InternedStrings
+from . import metrics
+from .rollups import UsageRollups
+from .frame_cache import load_frame
+from .windows import bucket_range
+
+NETWORK_COLUMNS = ['timestamp', 'user_id', 'destination_domain', 'data_uploaded_mb', 'data_downloaded_mb']
+
+MIN_RANGE_BYTES = 32 * 1024 * 1024 # Smallest part of the log worth handing to a worker process
+
+# How each aggregate column is combined when partial aggregates are merged
+_MERGE_RULES = {
+    'access_count': 'sum', 'uploaded_mb': 'sum', 'downloaded_mb': 'sum',
+    'first_seen': 'min', 'last_seen': 'max', 'first_row': 'min',
+}
+
+
+class Vocabulary:
+    """Interning table handing out stable integer codes to values in the order they are first seen."""
+
+    def __init__(self):
+        self._codes = {}
+        self.values = []
+
+    def __len__(self):
+        return len(self.values)
+
+    def copy(self):
+        """An independent copy: values interned by either later don't show up in the other."""
+        vocabulary = Vocabulary()
+        vocabulary._codes = dict(self._codes)
+        vocabulary.values = list(self.values)
+        return vocabulary
+
+    def encode(self, values, as_str=False):
+        """
+        Codes for a column of values. Only the distinct values are looked up. With as_str=True values are
+        interned by their astype(str) form, so e.g. 1 and '1' share a code. Missing values get a code too.
+        """
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        uniques = pd.Series(uniques)
+        if as_str:
+            uniques = uniques.astype(str)
+        mapping = np.fromiter((self._code_for(value) for value in uniques), dtype=np.int64, count=len(uniques))
+        return mapping[codes]
+
+    def _code_for(self, value):
+        key = None if not isinstance(value, str) and pd.isna(value) else value # All NaN flavours share one code
+        code = self._codes.get(key)
+        if code is None:
+            code = self._codes[key] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class NetworkAggregates:
+    """
+    Running aggregates of network log rows, keyed by interned domain and user codes:
+    per domain and per (domain, user) access counts, upload/download MB, first/last seen, plus the
+    position of the first row of each (domain, user) so user lists keep their first-seen order.
+    Hourly/daily usage rollups (see app.rollups) are filled from the same chunks. With window_hours set,
+    the (domain, user) aggregates are also kept per bucket of that many hours of the log, ordered by
+    bucket, for time windows (see window). They grow with the number of buckets the log spans.
+    """
+
+    def __init__(self, window_hours=None):
+        self.window_hours = window_hours # Hours per time-window bucket, None keeps no buckets
+        self.domains = Vocabulary()
+        self.users = Vocabulary()
+        self.rows_ingested = 0
+        self.rollups = UsageRollups()
+        self._domain_stats = None
+        self._pair_stats = None
+        self._pending = [] # (domain_part, pair_part) tuples not merged into the stats yet
+        self._pending_rows = 0
+        self._bucket_stats = None # Per-(bucket, domain, user) aggregates, buckets counted since the epoch
+        self._bucket_pending = []
+        self._bucket_pending_rows = 0
+        self._buckets = None # Bucket of each row of the bucket stats (sorted), for binary searches
+        self._app_domains = (None, np.array([], dtype=object)) # (DomainSuffixIndex, app domain of each domain code)
+        self._lock = threading.RLock() # Incremental refreshes fold while requests may be reading
+
+    def __getstate__(self):
+        # Pickled when a worker process returns its partial aggregates: merged stats, no lock
+        with self._lock:
+            self._compact()
+            self._compact_buckets()
+            state = self.__dict__.copy()
+        del state['_lock']
+        state['_buckets'] = None
+        state['_app_domains'] = (None, np.array([], dtype=object)) # Matched again where it's needed
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def copy(self):
+        """
+        A copy to fold new rows into while this one keeps being read (see follow_network_log). The merged
+        stats frames are shared: folding and merging replace them, they are never changed in place.
+        """
+        with self._lock:
+            aggregates = NetworkAggregates.__new__(NetworkAggregates)
+            aggregates.__dict__.update(self.__dict__)
+            aggregates.domains, aggregates.users = self.domains.copy(), self.users.copy()
+            aggregates.rollups = self.rollups.copy()
+            aggregates._pending = list(self._pending)
+            aggregates._bucket_pending = list(self._bucket_pending)
+            aggregates._lock = threading.RLock()
+        return aggregates
+
+    def fold(self, chunk):
+        """
+        Folds a chunk of cleaned log rows (parsed timestamps, see clean_network_chunk) into the aggregates.
+        Returns the codes of the domains the chunk touched.
+        """
+        with self._lock:
+            return self._fold(chunk)
+
+    def _fold(self, chunk):
+        row_numbers = np.arange(self.rows_ingested, self.rows_ingested + len(chunk))
+        self.rows_ingested += len(chunk)
+
+        # Invalid domains (NaN, non-strings, blanks) are dropped per distinct value, same as discovery
+        domain_codes, domain_values = pd.factorize(chunk['destination_domain'])
+        valid_domain = np.array([isinstance(d, str) and d.strip() != '' for d in domain_values] + [False], dtype=bool)
+        row_mask = valid_domain[domain_codes]
+        if not row_mask.any():
+            return np.array([], dtype=np.int64)
+        chunk = chunk[row_mask]
+        self.rollups.add(chunk['destination_domain'], chunk['timestamp'], chunk['data_uploaded_mb'])
+
+        rows = pd.DataFrame({
+            'domain': self.domains.encode(chunk['destination_domain']),
+            'user': self.users.encode(chunk['user_id'], as_str=True),
+            'timestamp': chunk['timestamp'].to_numpy(),
+            'uploaded_mb': chunk['data_uploaded_mb'].to_numpy(),
+            'downloaded_mb': chunk['data_downloaded_mb'].to_numpy(),
+            'row': row_numbers[row_mask],
+        })
+        aggs = dict(access_count=('timestamp', 'size'), uploaded_mb=('uploaded_mb', 'sum'),
+                    downloaded_mb=('downloaded_mb', 'sum'), first_seen=('timestamp', 'min'), last_seen=('timestamp', 'max'))
+        domain_part = rows.groupby('domain').agg(**aggs)
+        pair_part = rows.groupby(['domain', 'user']).agg(first_row=('row', 'min'), **aggs)
+        self._pending.append((domain_part, pair_part))
+        self._pending_rows += len(pair_part)
+        if self.window_hours:
+            stamps = rows['timestamp'].to_numpy()
+            timed = ~np.isnat(stamps) # Rows without a timestamp fall in no window
+            buckets = stamps[timed].astype('datetime64[h]').astype(np.int64) // self.window_hours
+            self._add_buckets(rows[timed].assign(bucket=buckets).groupby(['bucket', 'domain', 'user']).agg(first_row=('row', 'min'), **aggs))
+
+        # Merge once the pending parts outgrow the merged state, keeping folding amortized O(rows)
+        if self._pair_stats is None or self._pending_rows > len(self._pair_stats):
+            self._compact()
+        return domain_part.index.to_numpy()
+
+    def merge(self, other):
+        """
+        Folds in the aggregates of a later part of the same log, e.g. read by a worker process.
+        Its codes are re-mapped to ours and its rows numbered after the rows folded so far.
+        """
+        with self._lock:
+            domain_map = self.domains.encode(pd.Series(other.domains.values, dtype=object))
+            user_map = self.users.encode(pd.Series(other.users.values, dtype=object), as_str=True)
+            domain_part = other.domain_stats().copy()
+            domain_part.index = pd.Index(domain_map[domain_part.index.to_numpy()], name='domain')
+            pair_part = other.pair_stats().copy()
+            pair_part.index = pd.MultiIndex.from_arrays(
+                [domain_map[pair_part.index.get_level_values('domain').to_numpy()],
+                 user_map[pair_part.index.get_level_values('user').to_numpy()]], names=['domain', 'user'])
+            pair_part['first_row'] += self.rows_ingested
+            if self.window_hours: # Both read with the same bucket size
+                bucket_part = other.bucket_stats().copy()
+                bucket_part.index = pd.MultiIndex.from_arrays(
+                    [bucket_part.index.get_level_values('bucket').to_numpy(),
+                     domain_map[bucket_part.index.get_level_values('domain').to_numpy()],
+                     user_map[bucket_part.index.get_level_values('user').to_numpy()]], names=['bucket', 'domain', 'user'])
+                bucket_part['first_row'] += self.rows_ingested
+                self._add_buckets(bucket_part)
+            self.rows_ingested += other.rows_ingested
+            self.rollups.merge(other.rollups)
+            self._pending.append((domain_part, pair_part))
+            self._pending_rows += len(pair_part)
+            if self._pair_stats is None or self._pending_rows > len(self._pair_stats):
+                self._compact()
+
+    def _compact(self):
+        if not self._pending:
+            return
+        domain_parts = [part for part, _ in self._pending]
+        pair_parts = [part for _, part in self._pending]
+        if self._domain_stats is not None:
+            domain_parts.insert(0, self._domain_stats)
+            pair_parts.insert(0, self._pair_stats)
+        self._domain_stats = _merge_parts(domain_parts, 'domain')
+        self._pair_stats = _merge_parts(pair_parts, ['domain', 'user'])
+        self._pending = []
+        self._pending_rows = 0
+
+    def _add_buckets(self, part):
+        self._bucket_pending.append(part)
+        self._bucket_pending_rows += len(part)
+        # Merged on its own schedule: the bucket stats outgrow the (domain, user) ones as the log spans more buckets
+        if self._bucket_stats is None or self._bucket_pending_rows > len(self._bucket_stats):
+            self._compact_buckets()
+
+    def _compact_buckets(self):
+        if not self._bucket_pending:
+            return
+        parts = self._bucket_pending if self._bucket_stats is None else [self._bucket_stats] + self._bucket_pending
+        self._bucket_stats = _merge_parts(parts, ['bucket', 'domain', 'user']) # Sorted by bucket first
+        self._bucket_pending = []
+        self._bucket_pending_rows = 0
+        self._buckets = None
+
+    def domain_stats(self):
+        """Merged per-domain aggregates, indexed by domain code."""
+        with self._lock:
+            self._compact()
+            return self._domain_stats if self._domain_stats is not None else _empty_stats('domain')
+
+    def pair_stats(self):
+        """Merged per-(domain, user) aggregates, indexed by (domain code, user code)."""
+        with self._lock:
+            self._compact()
+            return self._pair_stats if self._pair_stats is not None else _empty_stats(['domain', 'user'])
+
+    def bucket_stats(self):
+        """
+        Merged per-(bucket, domain, user) aggregates, indexed by (bucket since the epoch, domain code, user code),
+        a bucket being window_hours hours. Empty without window_hours.
+        """
+        with self._lock:
+            self._compact_buckets()
+            return self._bucket_stats if self._bucket_stats is not None else _empty_stats(['bucket', 'domain', 'user'])
+
+    def latest_access(self):
+        """Timestamp of the latest folded access, NaT if there is none."""
+        stats = self.domain_stats()
+        return stats['last_seen'].max() if len(stats) else pd.NaT
+
+    def window(self, start=None, stop=None):
+        """
+        NetworkAggregates of the rows logged from start until stop (datetime64, None: unbounded), bounds
+        rounded out to whole buckets (see bucket_range). Summed from the bucket stats found by binary
+        search, so the cost follows the buckets and pairs inside the window. Shares this one's
+        vocabularies; read-only. Needs window_hours.
+        """
+        if not self.window_hours:
+            raise ValueError("time windows need aggregates kept per bucket (window_hours)")
+        start_bucket, stop_bucket = bucket_range(start, stop, self.window_hours)
+        with self._lock:
+            buckets = self.bucket_stats()
+            if self._buckets is None:
+                self._buckets = buckets.index.get_level_values('bucket').to_numpy()
+            lo = 0 if start_bucket is None else np.searchsorted(self._buckets, start_bucket)
+            hi = len(self._buckets) if stop_bucket is None else np.searchsorted(self._buckets, stop_bucket)
+            window = NetworkAggregates()
+            window.domains, window.users = self.domains, self.users
+            window._app_domains = self._app_domains
+        pair_stats = _merge_parts([buckets.iloc[lo:hi].droplevel('bucket')], ['domain', 'user'])
+        window._pair_stats = pair_stats
+        window._domain_stats = _merge_parts([pair_stats.drop(columns='first_row').droplevel('user')], 'domain')
+        window.rows_ingested = int(pair_stats['access_count'].sum())
+        return window
+
+    def domain_names(self, codes):
+        """Stripped domain names of the given domain codes."""
+        return {str(self.domains.values[code]).strip() for code in codes}
+
+    def app_domains(self, domain_index):
+        """
+        The app domain of every domain code (see DomainSuffixIndex.rollup). Each domain is matched
+        once per index; domains interned later are matched on the next call.
+        """
+        with self._lock:
+            index, app_domains = self._app_domains
+            if index is not domain_index:
+                app_domains = np.array([], dtype=object)
+            if len(app_domains) < len(self.domains.values):
+                app_domains = np.concatenate([app_domains, domain_index.rollup(self.domains.values[len(app_domains):])])
+            self._app_domains = (domain_index, app_domains)
+            return app_domains
+
+    def domain_summary(self, only_domains=None, domain_index=None):
+        """
+        Per-domain discovery inputs in sorted domain order: (stats, users), where stats has the raw
+        'domain' plus discovery's column names and users holds each domain's user values in first-seen order.
+        With a domain_index (see app.domains) subdomains are first rolled up into their app's domain.
+        only_domains limits the summary to a set of (stripped) domain names, app domains when rolled up.
+        """
+        with self._lock:
+            stats = self.domain_stats()
+            pairs = self.pair_stats()
+            domain_names = np.asarray(self.domains.values, dtype=object)
+            if domain_index:
+                stats, pairs, domain_names = _rolled_up_stats(stats, pairs, self.app_domains(domain_index), only_domains)
+        if only_domains is not None:
+            wanted = np.array([str(d).strip() in only_domains for d in domain_names], dtype=bool)
+            stats = stats[wanted[stats.index.to_numpy()]]
+            pairs = pairs[wanted[pairs.index.get_level_values('domain').to_numpy()]]
+        domain_order = np.argsort(domain_names[stats.index.to_numpy()], kind='stable')
+        stats = stats.iloc[domain_order]
+
+        # Rank of every domain code in sorted order, then users sorted by (domain rank, first row)
+        rank = np.empty(len(domain_names), dtype=np.int64)
+        rank[stats.index.to_numpy()] = np.arange(len(stats))
+        pair_domains = pairs.index.get_level_values('domain').to_numpy()
+        pair_users = pairs.index.get_level_values('user').to_numpy()
+        order = np.lexsort((pairs['first_row'].to_numpy(), rank[pair_domains]))
+        user_counts = np.bincount(rank[pair_domains], minlength=len(stats))
+        user_names = np.asarray(self.users.values, dtype=object)
+        user_codes = pair_users[order].astype(np.int32)
+        # np.split would still give one (empty) group without any domain
+        users = [InternedStrings(codes, user_names) for codes in np.split(user_codes, np.cumsum(user_counts)[:-1])] if len(stats) else []
+
+        summary = pd.DataFrame({
+            'domain': domain_names[stats.index.to_numpy()],
+            'network_access_count': stats['access_count'].to_numpy(),
+            'user_count': user_counts,
+            'total_data_uploaded_mb': stats['uploaded_mb'].to_numpy(),
+            'total_data_downloaded_mb': stats['downloaded_mb'].to_numpy(),
+            'first_seen': stats['first_seen'].to_numpy(),
+            'last_seen': stats['last_seen'].to_numpy(),
+        })
+        return summary, users
+
+
+def _rolled_up_stats(stats, pairs, app_domains, only_domains):
+    """Domain and (domain, user) stats merged per app domain: (stats, pairs, app domain names), coded by app."""
+    app_codes, app_names = pd.factorize(app_domains)
+    stat_domains = stats.index.to_numpy()
+    pair_domains = pairs.index.get_level_values('domain').to_numpy()
+    if only_domains is not None: # Only the apps asked for are merged
+        wanted = np.array([str(name).strip() in only_domains for name in app_names], dtype=bool)[app_codes]
+        stats, stat_domains = stats[wanted[stat_domains]], stat_domains[wanted[stat_domains]]
+        pairs, pair_domains = pairs[wanted[pair_domains]], pair_domains[wanted[pair_domains]]
+    stats = stats.set_axis(pd.Index(app_codes[stat_domains], name='domain'))
+    pairs = pairs.set_axis(pd.MultiIndex.from_arrays(
+        [app_codes[pair_domains], pairs.index.get_level_values('user').to_numpy()], names=['domain', 'user']))
+    # Only the apps with more than one domain have rows to merge
+    shared = np.bincount(app_codes, minlength=len(app_names))[app_codes] > 1
+    stats = _merge_shared(stats, shared[stat_domains], 'domain')
+    pairs = _merge_shared(pairs, shared[pair_domains], ['domain', 'user'])
+    return stats, pairs, np.asarray(app_names, dtype=object)
+
+
+def _merge_shared(stats, shared, keys):
+    if not shared.any():
+        return stats
+    return pd.concat([stats[~shared], _merge_parts([stats[shared]], keys)])
+
+
+def _merge_parts(parts, keys):
+    merged = pd.concat(parts)
+    rules = {col: rule for col, rule in _MERGE_RULES.items() if col in merged.columns}
+    return merged.groupby(level=keys).agg(rules)
+
+
+def _empty_stats(keys):
+    columns = ['access_count', 'uploaded_mb', 'downloaded_mb', 'first_seen', 'last_seen']
+    if isinstance(keys, list):
+        index = pd.MultiIndex.from_arrays([np.array([], dtype=np.int64)] * len(keys), names=keys)
+        columns = ['first_row'] + columns
+    else:
+        index = pd.Index(np.array([], dtype=np.int64), name=keys)
+    stats = pd.DataFrame(index=index, columns=columns)
+    return stats.astype({'first_seen': 'datetime64[ns]', 'last_seen': 'datetime64[ns]'})
+
+
+def clean_network_chunk(chunk):
+    """
+    Same cleaning load_and_cache_data applies to the full log, for one chunk. Volume values that
+    aren't numbers (e.g. 'abc') become NaN here, so they are skipped like missing ones when summed.
+    """
+    if 'timestamp' in chunk.columns:
+        with metrics.timed('parse_timestamps'):
+            chunk['timestamp'] = pd.to_datetime(chunk['timestamp']).dt.tz_localize(None)
+    for col in ['data_uploaded_mb', 'data_downloaded_mb']:
+        if col in chunk.columns and chunk[col].dtype.kind not in 'fiu':
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+    return chunk
+
+
+def intern_network_columns(network_df):
+    """
+    Replaces the repetitive text columns of a parsed network log with compact codes: user_id and
+    destination_domain become categoricals (categories in sorted order), source_ip a nullable
+    UInt32 column of packed addresses when they are all IPv4 (see pack_ipv4), else a categorical too.
+    """
+    for col in ['user_id', 'destination_domain']:
+        if col in network_df.columns:
+            network_df[col] = network_df[col].astype('category')
+    if 'source_ip' in network_df.columns:
+        packed = pack_ipv4(network_df['source_ip'])
+        network_df['source_ip'] = packed if packed is not None else network_df['source_ip'].astype('category')
+    return network_df
+
+
+def factorize_as_str(values):
+    """
+    Integer-codes a column by its astype(str) representation.
+    Only the distinct values are converted; values that collapse to the same string share a code.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    as_str = pd.Series(uniques).astype(str)
+    str_codes, str_uniques = pd.factorize(as_str, use_na_sentinel=False)
+    return str_codes[codes], np.asarray(str_uniques, dtype=object)
+
+
+def pack_ipv4(addresses):
+    """
+    Dotted-quad IPv4 addresses as a nullable UInt32 array (missing values stay missing).
+    None if any present value isn't an IPv4 address. Only the distinct addresses are parsed.
+    """
+    codes, uniques = pd.factorize(addresses)
+    try:
+        packed = np.fromiter((int(ipaddress.IPv4Address(str(value))) for value in uniques),
+                             dtype=np.uint32, count=len(uniques))
+    except ValueError:
+        return None
+    values = packed[codes] if len(packed) else np.zeros(len(codes), dtype=np.uint32)
+    return pd.arrays.IntegerArray(values, codes < 0)
+
+
+def unpack_ipv4(packed):
+    """Dotted-quad strings (None for missing) of values produced by pack_ipv4."""
+    return [str(ipaddress.IPv4Address(int(value))) if pd.notna(value) else None for value in packed]
+
+
+def stream_network_log(path, chunk_rows, workers=1, min_range_bytes=MIN_RANGE_BYTES, window_hours=None):
+    """
+    Reads the network log in chunks of chunk_rows rows. Returns (aggregates, tail): the folded
+    NetworkAggregates and the LogTail to continue from on the next incremental refresh (None if
+    the log can't be used). With workers > 1 a log of at least 2 * min_range_bytes is split at line
+    boundaries and the parts are folded in parallel processes (quoted fields must not span lines).
+    window_hours: as in NetworkAggregates.
+    """
+    aggregates = NetworkAggregates(window_hours)
+    columns = pd.read_csv(path, nrows=0).columns.tolist()
+    with open(path, 'rb') as log_file:
+        size = os.fstat(log_file.fileno()).st_size # Stop here even if the log grows while we read it
+        missing = [col for col in NETWORK_COLUMNS if col not in columns]
+        if missing:
+            print(f"Warning: Network log missing required columns {missing}. Streaming ingestion skipped.")
+            return aggregates, None
+        ranges = _split_lines(log_file, size, min(workers, size // max(1, min_range_bytes))) if workers > 1 else []
+        if len(ranges) > 1:
+            _fold_parallel(aggregates, path, columns, ranges, chunk_rows, window_hours)
+        else:
+            log_file.seek(0)
+            _fold_csv(aggregates, _ByteRange(log_file, size), chunk_rows, header=0)
+        return aggregates, LogTail(path, columns, log_file, size)
+
+
+def _split_lines(log_file, size, parts):
+    """Splits the data lines (after the header) into up to `parts` (start, end) byte ranges of whole lines."""
+    log_file.seek(0)
+    line = log_file.readline()
+    while line and not line.strip(): # pandas skips blank lines before the header too
+        line = log_file.readline()
+    data_start = log_file.tell()
+    if parts < 2 or data_start >= size:
+        return []
+    cuts = [data_start]
+    for i in range(1, parts):
+        log_file.seek(max(cuts[-1], data_start + (size - data_start) * i // parts - 1))
+        log_file.readline() # Move on to the start of the next line
+        cut = min(log_file.tell(), size)
+        if cut > cuts[-1]:
+            cuts.append(cut)
+    if cuts[-1] < size:
+        cuts.append(size)
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def _fold_parallel(aggregates, path, columns, ranges, chunk_rows, window_hours):
+    # Spawned (not forked) workers: the web server may be running other threads holding locks
+    with ProcessPoolExecutor(max_workers=len(ranges), mp_context=multiprocessing.get_context('spawn')) as pool:
+        parts = pool.map(_fold_byte_range, [path] * len(ranges), [columns] * len(ranges),
+                         [start for start, _ in ranges], [end for _, end in ranges], [chunk_rows] * len(ranges),
+                         [window_hours] * len(ranges))
+        for part in parts: # In log order, so row numbers and first-seen values match a sequential read
+            aggregates.merge(part)
+
+
+def _fold_byte_range(path, columns, start, end, chunk_rows, window_hours=None):
+    """Worker process: NetworkAggregates of the log lines between two byte offsets."""
+    aggregates = NetworkAggregates(window_hours)
+    with open(path, 'rb') as log_file:
+        log_file.seek(start)
+        _fold_csv(aggregates, _ByteRange(log_file, end), chunk_rows, header=None, names=columns)
+    return aggregates
+
+
+def follow_network_log(aggregates, tail, chunk_rows):
+    """
+    Reads the lines appended to the log since `tail`. Returns (aggregates, tail, domains): a copy of the
+    aggregates with the new lines folded in, the tail advanced past them and the set of (stripped) domains
+    that received new rows - or the given aggregates and tail when nothing was appended. The given ones
+    are never changed, requests may still be reading them. None when the log can't be continued
+    (truncated, rotated or rewritten) and has to be reloaded from scratch.
+    """
+    state = tail.state()
+    if state == 'unchanged':
+        return aggregates, tail, set()
+    if state == 'reset':
+        return None
+
+    aggregates, tail = aggregates.copy(), copy.copy(tail)
+
+    with open(tail.path, 'rb') as log_file:
+        size = os.fstat(log_file.fileno()).st_size
+        log_file.seek(tail.offset)
+        if tail.ends_mid_line:
+            # The last line we read had no newline yet: new data must start a new line,
+            # otherwise that line was still being written and what we folded was incomplete.
+            lead = log_file.read(2)
+            if lead.startswith(b'\r\n'):
+                log_file.seek(tail.offset + 2)
+            elif lead.startswith(b'\n'):
+                log_file.seek(tail.offset + 1)
+            else:
+                return None
+        changed_codes = _fold_csv(aggregates, _ByteRange(log_file, size), chunk_rows, header=None, names=tail.columns)
+        tail.advance(log_file, size)
+    return aggregates, tail, aggregates.domain_names(changed_codes)
+
+
+def _fold_csv(aggregates, source, chunk_rows, **read_options):
+    """
+    Parses CSV rows from a binary stream (e.g. a _ByteRange) chunk by chunk into the aggregates.
+    Returns the touched domain codes.
+    """
+    if isinstance(source, io.RawIOBase):
+        source = io.BufferedReader(source)
+    touched = []
+    try:
+        reader = pd.read_csv(source, chunksize=chunk_rows, usecols=lambda col: col in NETWORK_COLUMNS, **read_options)
+        for chunk in reader:
+            missing = [col for col in NETWORK_COLUMNS if col not in chunk.columns]
+            if missing:
+                raise ValueError(f"missing required columns {missing}")
+            touched.append(aggregates.fold(clean_network_chunk(chunk)))
+    except pd.errors.EmptyDataError:
+        pass # Nothing but blank lines
+    return np.unique(np.concatenate(touched)) if touched else np.array([], dtype=np.int64)
+
+
+# --- Rotated Log Segments ---
+def is_segmented_log(path):
+    """True if the configured log path is a directory or a glob of segment files rather than one file."""
+    return os.path.isdir(path) or glob.has_magic(path)
+
+
+def list_log_segments(path):
+    """Segment files of a directory (hidden files excluded) or glob, in name order."""
+    if os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in os.listdir(path) if not name.startswith('.')]
+    else:
+        paths = glob.glob(path)
+    return sorted(p for p in paths if os.path.isfile(p))
+
+
+def open_log_segment(path):
+    """Binary stream of a segment's CSV text, decompressed on the fly for .gz and .zst files."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith(('.zst', '.zstd')):
+        try:
+            import zstandard # Optional, only needed for zstd-compressed segments
+        except ImportError:
+            raise RuntimeError("reading .zst log segments needs the 'zstandard' package")
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def read_log_segments(path, retention=None, cache_dir=None):
+    """
+    The rows of every segment as one DataFrame (frame ingest mode), in segment order, timestamps parsed.
+    With a cache_dir each segment is parsed once and then served from the frame cache (see app.frame_cache)
+    while it is unchanged. With a retention timedelta, segments whose newest row is older than that
+    before the newest row of all are left out.
+    """
+    frames, newest = [], []
+    for segment in list_log_segments(path):
+        try:
+            frame = load_frame(segment, read_log_segment, cache_dir)
+        except pd.errors.EmptyDataError:
+            continue
+        except Exception as e:
+            print(f"Warning: Skipping unreadable log segment {segment}: {e}")
+            continue
+        frames.append(frame)
+        newest.append(frame['timestamp'].max() if retention is not None and 'timestamp' in frame.columns else pd.NaT)
+    if retention is not None and frames and pd.notna(max(newest, default=pd.NaT)):
+        cutoff = max(t for t in newest if pd.notna(t)) - retention
+        frames = [frame for frame, last in zip(frames, newest) if pd.isna(last) or last >= cutoff]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+def read_log_segment(path):
+    """The rows of one segment, timestamps parsed to naive UTC like the rest of the log."""
+    with open_log_segment(path) as stream:
+        frame = pd.read_csv(stream)
+    if 'timestamp' in frame.columns:
+        frame['timestamp'] = pd.to_datetime(frame['timestamp']).dt.tz_localize(None)
+    return frame
+
+
+class SegmentedLog:
+    """
+    A network log made of rotated segment files. Every segment is folded into its own NetworkAggregates
+    and `aggregates` holds them merged in segment (name) order. refresh() only reads new or changed
+    segments; segments deleted from disk or whose newest row falls outside the retention window
+    (measured back from the newest row of all segments) are dropped by re-merging the remaining
+    per-segment aggregates, without parsing anything again.
+    """
+
+    def __init__(self, path, chunk_rows, retention=None, workers=1, window_hours=None):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.retention = retention # datetime.timedelta or None to keep everything
+        self.workers = workers
+        self.window_hours = window_hours # As in NetworkAggregates
+        self.aggregates = NetworkAggregates(window_hours)
+        self._segments = {} # Segment path -> (file signature, NetworkAggregates, newest row timestamp)
+        self._skipped = {} # Segment path -> file signature of unreadable and expired segments, until they change
+
+    def refresh(self):
+        """Brings the aggregates up to date with the segments on disk. Returns the (stripped) domains that changed."""
+        current = {}
+        for segment in list_log_segments(self.path):
+            signature = _file_signature(segment)
+            if signature is not None:
+                current[segment] = signature
+        self._skipped = {p: s for p, s in self._skipped.items() if current.get(p) == s}
+        stale = [p for p, (signature, _, _) in self._segments.items() if current.get(p) != signature]
+        fresh = [p for p in current if (p not in self._segments or p in stale) and p not in self._skipped]
+
+        changed = set()
+        merged = [p for p in self._segments if p not in stale]
+        for segment in stale:
+            changed |= _all_domain_names(self._segments.pop(segment)[1])
+        for segment, aggregates in zip(fresh, _fold_segments(fresh, self.chunk_rows, self.workers, self.window_hours)):
+            if aggregates is None:
+                self._skipped[segment] = current[segment] # Unreadable, tried again when it changes
+                continue
+            stats = aggregates.domain_stats()
+            newest = stats['last_seen'].max() if len(stats) else pd.NaT
+            self._segments[segment] = (current[segment], aggregates, newest)
+            changed |= _all_domain_names(aggregates)
+        expired = self._expire()
+        for segment in expired:
+            changed |= _all_domain_names(self._segments.pop(segment)[1])
+            self._skipped[segment] = current[segment]
+
+        added = sorted(p for p in fresh if p in self._segments)
+        if stale or any(p in merged for p in expired) or (added and merged and added[0] < max(merged)):
+            self._rebuild()
+        elif added: # All sort after the merged segments: appended to a copy, the current aggregates may still be read
+            aggregates = self.aggregates.copy()
+            for segment in added:
+                aggregates.merge(self._segments[segment][1])
+            self.aggregates = aggregates
+        return changed
+
+    def _expire(self):
+        if self.retention is None:
+            return []
+        newest = [last for _, _, last in self._segments.values() if pd.notna(last)]
+        if not newest:
+            return []
+        cutoff = max(newest) - self.retention
+        return [p for p, (_, _, last) in self._segments.items() if pd.notna(last) and last < cutoff]
+
+    def _rebuild(self):
+        aggregates = NetworkAggregates(self.window_hours)
+        for segment in sorted(self._segments):
+            aggregates.merge(self._segments[segment][1])
+        self.aggregates = aggregates
+
+
+def _all_domain_names(aggregates):
+    return aggregates.domain_names(range(len(aggregates.domains)))
+
+
+def _fold_segments(paths, chunk_rows, workers, window_hours=None):
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths)), mp_context=multiprocessing.get_context('spawn')) as pool:
+            return list(pool.map(_fold_segment, paths, [chunk_rows] * len(paths), [window_hours] * len(paths)))
+    return [_fold_segment(path, chunk_rows, window_hours) for path in paths]
+
+
+def _fold_segment(path, chunk_rows, window_hours=None):
+    """NetworkAggregates of one segment, None if it can't be read (possibly in a worker process)."""
+    aggregates = NetworkAggregates(window_hours)
+    try:
+        with open_log_segment(path) as stream:
+            _fold_csv(aggregates, stream, chunk_rows, header=0)
+    except Exception as e:
+        print(f"Warning: Skipping unreadable log segment {path}: {e}")
+        return None
+    return aggregates
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+class _ByteRange(io.RawIOBase):
+    """Read-only view of an open binary file from its current position up to `end`."""
+
+    def __init__(self, raw_file, end):
+        self._file = raw_file
+        self._remaining = max(0, end - raw_file.tell())
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        data = self._file.read(size)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+
+class LogTail:
+    """
+    How far an append-only log has been read: byte offset, the file's inode and the bytes just
+    before the offset, which together tell an append apart from truncation, rotation or a rewrite.
+    """
+    FINGERPRINT_BYTES = 64
+
+    def __init__(self, path, columns, log_file, offset):
+        self.path = path
+        self.columns = columns
+        self.inode = os.fstat(log_file.fileno()).st_ino
+        self.advance(log_file, offset)
+
+    def advance(self, log_file, offset):
+        self.offset = offset
+        log_file.seek(max(0, offset - self.FINGERPRINT_BYTES))
+        self.fingerprint = log_file.read(offset - log_file.tell())
+        self.ends_mid_line = offset > 0 and not self.fingerprint.endswith(b'\n')
+
+    def state(self):
+        """'unchanged', 'appended' or 'reset' (file truncated, replaced or rewritten)."""
+        try:
+            stat = os.stat(self.path)
+            if stat.st_ino != self.inode or stat.st_size < self.offset:
+                return 'reset'
+            with open(self.path, 'rb') as log_file:
+                log_file.seek(self.offset - len(self.fingerprint))
+                if log_file.read(len(self.fingerprint)) != self.fingerprint:
+                    return 'reset'
+        except OSError:
+            return 'reset'
+        return 'unchanged' if stat.st_size == self.offset else 'appended'
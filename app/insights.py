@@ -0,0 +1,80 @@
+# app/insights.py
+# Aggregates behind the behavior insights. The per-(domain, user) access counts are built once per
+# loaded data version; the top shadow-IT users are then tallied from the pairs of the current
+# shadow domains only, so the result follows resolution status changes without re-reading log rows.
+import heapq
+
+import numpy as np
+import pandas as pd
+
+from .domains import rolled_up_codes
+from .ingestion import factorize_as_str
+
+
+class UserDomainAccess:
+    """
+    Access counts per (raw domain, user) of the network log, grouped by domain (CSR layout).
+    Users are interned by their astype(str) form; rows without a domain or user are left out.
+    With a domain_index (see app.domains) subdomains count as their app's domain.
+    """
+
+    def __init__(self, domain_values, pair_domains, pair_users, pair_counts, user_names):
+        order = np.argsort(pair_domains, kind='stable')
+        self._users = np.asarray(pair_users)[order]
+        self._counts = np.asarray(pair_counts, dtype=np.int64)[order]
+        counts_per_domain = np.bincount(np.asarray(pair_domains, dtype=np.int64), minlength=len(domain_values))
+        self._starts = np.concatenate(([0], np.cumsum(counts_per_domain)))
+        self._domain_codes = {domain: code for code, domain in enumerate(domain_values) if isinstance(domain, str)}
+        self.user_names = np.asarray(user_names, dtype=object)
+
+    @classmethod
+    def from_frame(cls, network_df, domain_index=None):
+        """Built from a loaded network log DataFrame (frame ingest mode)."""
+        domain_codes, domain_values = pd.factorize(network_df['destination_domain'])
+        if domain_index:
+            domain_codes, domain_values = rolled_up_codes(domain_codes, domain_values, domain_index)
+        user_codes, user_names = factorize_as_str(network_df['user_id'])
+        valid_user = ~pd.isna(user_names)
+        keep = (domain_codes >= 0) & valid_user[user_codes]
+        keys = domain_codes[keep].astype(np.int64) * len(user_names) + user_codes[keep]
+        pairs, counts = np.unique(keys, return_counts=True)
+        return cls(np.asarray(domain_values, dtype=object), pairs // len(user_names), pairs % len(user_names),
+                   counts, user_names)
+
+    @classmethod
+    def from_aggregates(cls, network_aggregates, domain_index=None):
+        """Built from streamed NetworkAggregates (see app.ingestion)."""
+        pairs = network_aggregates.pair_stats()
+        user_names = np.asarray(network_aggregates.users.values, dtype=object)
+        pair_users = pairs.index.get_level_values('user').to_numpy()
+        keep = ~pd.isna(user_names[pair_users]) if len(pair_users) else np.array([], dtype=bool)
+        domain_values = np.asarray(network_aggregates.domains.values, dtype=object)
+        pair_domains, pair_users = pairs.index.get_level_values('domain').to_numpy()[keep], pair_users[keep]
+        pair_counts = pairs['access_count'].to_numpy()[keep]
+        if domain_index: # Pairs of the subdomains of one app are summed
+            app_codes, domain_values = pd.factorize(network_aggregates.app_domains(domain_index))
+            keys = app_codes[pair_domains].astype(np.int64) * len(user_names) + pair_users
+            keys, inverse = np.unique(keys, return_inverse=True)
+            pair_counts = np.bincount(inverse, weights=pair_counts, minlength=len(keys)).astype(np.int64)
+            pair_domains, pair_users = keys // len(user_names), keys % len(user_names)
+        return cls(np.asarray(domain_values, dtype=object), pair_domains, pair_users, pair_counts, user_names)
+
+    def top_users(self, domains, limit):
+        """
+        Top users over the given (raw) domains: (by distinct domain count, by access count),
+        each a list of up to `limit` (user, count) pairs, ties broken by user.
+        """
+        slices = [slice(self._starts[code], self._starts[code + 1])
+                  for code in (self._domain_codes.get(domain) for domain in domains) if code is not None]
+        if not slices:
+            return [], []
+        users = np.concatenate([self._users[s] for s in slices])
+        counts = np.concatenate([self._counts[s] for s in slices])
+        app_counts = np.bincount(users, minlength=len(self.user_names))
+        access_counts = np.bincount(users, weights=counts, minlength=len(self.user_names)).astype(np.int64)
+        candidates = np.flatnonzero(app_counts)
+        return (self._largest(candidates, app_counts, limit), self._largest(candidates, access_counts, limit))
+
+    def _largest(self, candidates, totals, limit):
+        top = heapq.nsmallest(limit, candidates.tolist(), key=lambda user: (-totals[user], str(self.user_names[user])))
+        return [(str(self.user_names[user]), int(totals[user])) for user in top]
@@ -0,0 +1,77 @@
+# app/live.py
+# Live dashboard updates. Every new processed snapshot is compared with the previous one and the
+# difference (new and removed apps, risk level and resolution changes, the changed app records) is
+# kept in a short in-memory feed. Clients follow the feed over Server-Sent Events and only fetch
+# everything again when they fell too far behind.
+import collections
+import threading
+
+
+def snapshot_delta(previous, current, changed_apps):
+    """
+    Differences between two ProcessedSnapshots as a JSON-ready dict: domains added/removed, risk level
+    and resolution changes ({domain, from, to}) and the positions in `current` of every app whose record
+    changed (added ones included). changed_apps(positions) turns those positions into app records.
+    """
+    previous_apps = {app['domain']: app for app in previous.apps} if previous is not None else {}
+    added, risk_changed, resolution_changed, positions = [], [], [], []
+    for position, app in enumerate(current.apps):
+        domain = app['domain']
+        old = previous_apps.pop(domain, None)
+        if old is None:
+            added.append(domain)
+        elif old is app or old == app: # Unchanged apps keep their record across incremental updates
+            continue
+        else:
+            if old.get('calculated_risk_level') != app.get('calculated_risk_level'):
+                risk_changed.append({'domain': domain, 'from': old.get('calculated_risk_level'),
+                                     'to': app.get('calculated_risk_level')})
+            if old.get('resolution_status') != app.get('resolution_status'):
+                resolution_changed.append({'domain': domain, 'from': old.get('resolution_status'),
+                                           'to': app.get('resolution_status')})
+        positions.append(position)
+    return {'version': current.version, 'previous_version': previous.version if previous is not None else None,
+            'added': added, 'removed': sorted(previous_apps), 'risk_changed': risk_changed,
+            'resolution_changed': resolution_changed, 'apps': changed_apps(positions) if positions else []}
+
+
+class ChangeFeed:
+    """
+    The latest `history` snapshot deltas, serialized once when published, and a condition that
+    wakes the clients waiting for the next one.
+    """
+
+    def __init__(self, history=256):
+        self._events = collections.deque(maxlen=history) # (version, previous version, payload)
+        self._changed = threading.Condition()
+        self.version = None # Version of the latest snapshot published
+
+    def publish(self, version, previous_version, payload):
+        with self._changed:
+            self._events.append((version, previous_version, payload))
+            self.version = version
+            self._changed.notify_all()
+
+    def reset(self, version):
+        """Starts over at `version` without a delta (e.g. the first snapshot), clients behind it reload."""
+        with self._changed:
+            self._events.clear()
+            self.version = version
+            self._changed.notify_all()
+
+    def events_since(self, version, timeout=None):
+        """
+        [(version, payload), ...] published after `version`, waiting up to timeout seconds for one if
+        there are none yet ([] on timeout). None when the deltas since `version` are no longer
+        all kept (or it is unknown), the client has to reload everything.
+        """
+        with self._changed:
+            if version == self.version and timeout:
+                self._changed.wait_for(lambda: version != self.version, timeout)
+            if version == self.version:
+                return []
+            versions = [event[0] for event in self._events]
+            if version not in versions and not (self._events and self._events[0][1] == version):
+                return None
+            start = versions.index(version) + 1 if version in versions else 0
+            return [(event_version, payload) for event_version, _, payload in list(self._events)[start:]]
@@ -0,0 +1,136 @@
+# app/metrics.py
+# Built-in instrumentation of the processing pipeline: a histogram of the seconds spent in each stage
+# (CSV parsing, timestamp parsing, discovery, expense linking, scoring, insights, JSON serialization...),
+# counters and gauges. Kept in process memory, exposed in the Prometheus text format at /metrics.
+# The stages run while handling a request are also reported in its Server-Timing response header.
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context
+
+PREFIX = 'shadowit_'
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0) # Upper bounds, seconds
+
+# Metric name (without PREFIX) -> (type, help)
+METRICS = {
+    'stage_seconds': ('histogram', 'Seconds spent in a processing stage (stages may nest, e.g. link_expenses in score).'),
+    'rows_ingested_total': ('counter', 'Network log rows read, including the rows re-read by full reloads.'),
+    'cache_requests_total': ('counter', 'Cache lookups by cache (data, snapshot, frame, window) and result (hit, miss).'),
+    'reloads_total': ('counter', 'Data source reloads by kind (full, incremental).'),
+    'last_reload_seconds': ('gauge', 'Duration of the latest data source reload.'),
+    'network_rows': ('gauge', 'Network log rows behind the loaded data version.'),
+    'domains_discovered': ('gauge', 'Apps (distinct destination domains) in the served snapshot.'),
+    'data_version': ('gauge', 'Loaded data version.'),
+    'snapshot_age_seconds': ('gauge', 'Seconds since the served data was last loaded or found up to date.'),
+}
+
+
+class MetricsRegistry:
+    """Thread-safe store of the METRICS samples. Gauges can also be read from a callback at scrape time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {} # Stage -> [count per bucket (last one: +Inf), sum of seconds]
+        self._values = {} # (name, sorted label pairs) -> counter or gauge value
+        self._callbacks = {} # Gauge name -> function returning its value (None: no sample)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = [[0] * (len(STAGE_BUCKETS) + 1), 0.0]
+            histogram[0][bisect.bisect_left(STAGE_BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] = value
+
+    def gauge_callback(self, name, callback):
+        self._callbacks[name] = callback
+
+    def render(self):
+        """All samples in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            stages = {stage: (list(counts), total) for stage, (counts, total) in self._stages.items()}
+            values = dict(self._values)
+        for name, callback in self._callbacks.items():
+            try:
+                value = callback()
+            except Exception as e:
+                print(f"Warning: Could not read metric {name}: {e}")
+                continue
+            if value is not None:
+                values[(name, ())] = value
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines += [f'# HELP {PREFIX}{name} {help_text}', f'# TYPE {PREFIX}{name} {kind}']
+            if kind == 'histogram':
+                for stage, (counts, total) in sorted(stages.items()):
+                    cumulative = 0
+                    for bound, count in zip(STAGE_BUCKETS + ('+Inf',), counts):
+                        cumulative += count
+                        lines.append(f'{PREFIX}{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{PREFIX}{name}_sum{{stage="{stage}"}} {total!r}')
+                    lines.append(f'{PREFIX}{name}_count{{stage="{stage}"}} {cumulative}')
+                continue
+            for (sample_name, labels), value in sorted(values.items()):
+                if sample_name == name:
+                    label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+                    lines.append(f'{PREFIX}{name}{{{label_text}}} {float(value)!r}' if labels
+                                 else f'{PREFIX}{name} {float(value)!r}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def observe(stage, seconds):
+    """Records `seconds` spent in `stage`, in the histogram and in the current request's Server-Timing."""
+    registry.observe(stage, seconds)
+    if has_request_context():
+        timings = g.setdefault('stage_timings', {})
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage):
+    """Times the enclosed block as one run of `stage` (see observe), also when it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def inc(name, value=1, **labels):
+    registry.inc(name, value, **labels)
+
+
+def set_gauge(name, value, **labels):
+    registry.set(name, value, **labels)
+
+
+# --- Server-Timing ---
+def start_request_timer():
+    """before_request hook: starts the clock of the request's total in Server-Timing."""
+    g.request_started = time.perf_counter()
+
+
+def add_server_timing(response):
+    """after_request hook: Server-Timing header with the seconds (as ms) each stage took in this request, and the total."""
+    timings = [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in g.get('stage_timings', {}).items()]
+    started = g.get('request_started')
+    if started is not None:
+        timings.append(f'total;dur={(time.perf_counter() - started) * 1000:.2f}')
+    if timings:
+        response.headers['Server-Timing'] = ', '.join(timings)
+    return response
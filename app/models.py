@@ -1,3 +1,100 @@
-# Currently empty. Could define classes like Application, UserActivityLog etc. later
-# if the logic becomes complex enough to warrant ORM-like structures.
-# For now, dictionaries and Pandas DataFrames suffice for the PoC.
\ No newline at end of file
+# app/models.py
+# Lightweight data containers shared between processing and the API layer.
+# Still no ORM - dictionaries and Pandas DataFrames do the heavy lifting, these
+# classes just give the processed results a stable, read-only shape.
+import datetime
+from dataclasses import dataclass, field
+
+
+class FrozenDict(dict):
+    """A dict that refuses in-place modification. Still JSON-serializable like a plain dict."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Processed app records are read-only; copy with dict(app) before modifying.")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self): # Allow pickling/copying back into a frozen dict
+        return (FrozenDict, (dict(self),))
+
+
+class InternedStrings:
+    """
+    Read-only sequence of strings stored as integer codes into a shared vocabulary array, e.g. the
+    users of an app. Strings are only materialized when iterated or serialized; the app's JSON
+    provider (see app/__init__.py) writes it out as a plain list.
+    """
+    __slots__ = ('codes', 'vocabulary')
+
+    def __init__(self, codes, vocabulary):
+        self.codes = codes
+        self.vocabulary = vocabulary
+
+    def tolist(self):
+        return self.vocabulary[self.codes].tolist()
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return InternedStrings(self.codes[position], self.vocabulary)
+        return self.vocabulary[self.codes[position]]
+
+    def __eq__(self, other):
+        if isinstance(other, (InternedStrings, list, tuple)):
+            return self.tolist() == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"InternedStrings({self.tolist()!r})"
+
+
+def freeze_app(app_dict):
+    """Returns a read-only copy of a processed app dict (lists become tuples)."""
+    return FrozenDict({k: tuple(v) if isinstance(v, list) else v for k, v in app_dict.items()})
+
+
+@dataclass(frozen=True)
+class ProcessedSnapshot:
+    """
+    Result of the full discovery + risk pipeline for one loaded data version.
+    With columnar scoring the apps carry empty risk_factors; `factor_source` builds them
+    (one list per app, in order, or per app at the given positions) when a caller asks for them.
+    """
+    version: int
+    apps: tuple = ()
+    frame: object = None # Scored DataFrame behind the apps, if the columnar engine produced them
+    factor_source: object = None
+    user_access: object = None # Builds the UserDomainAccess of a time window's rows (None: the loaded data's)
+    created_at: datetime.datetime = field(default_factory=datetime.datetime.now)
+    _memo: dict = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def memoized(self, key, build):
+        """Value derived from this snapshot, built by build() the first time `key` is asked for."""
+        if key not in self._memo:
+            self._memo[key] = build()
+        return self._memo[key]
+
+    def with_risk_factors(self):
+        """The apps with risk_factors filled in. Materialized once per snapshot."""
+        if self.factor_source is None:
+            return self.apps
+        return self.memoized('detailed_apps', lambda: tuple(
+            freeze_app({**app, 'risk_factors': app_factors})
+            for app, app_factors in zip(self.apps, self.factor_source())))
+
+    def apps_at(self, positions, include_risk_factors=True):
+        """The apps at the given positions. Risk factors are built for these apps only, unless all already are."""
+        if not include_risk_factors or self.factor_source is None:
+            return [self.apps[i] for i in positions]
+        if 'detailed_apps' in self._memo:
+            return [self._memo['detailed_apps'][i] for i in positions]
+        return [freeze_app({**self.apps[i], 'risk_factors': app_factors})
+                for i, app_factors in zip(positions, self.factor_source(positions))]
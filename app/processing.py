@@ -2,74 +2,145 @@
 import pandas as pd
 import os
 import datetime
-from collections import Counter, defaultdict
+from collections import Counter, OrderedDict, defaultdict
 import numpy as np  # Import numpy to check types if needed, or just cast
 from flask import current_app
 import traceback # For detailed error logging
+import threading
+import functools
+import dataclasses
+import time
+from . import metrics
+from .models import ProcessedSnapshot, InternedStrings, freeze_app
+from .expenses import ExpenseIndex
+from .domains import DomainSuffixIndex, rolled_up_codes
+from .ingestion import (stream_network_log, follow_network_log, intern_network_columns, factorize_as_str,
+                        is_segmented_log, list_log_segments, read_log_segments, SegmentedLog)
+from .frame_cache import load_frame
+from .queries import AppIndex, AppQuery, QueryError, FILTER_FIELDS, project
+from .insights import UserDomainAccess
+from .rollups import UsageRollups, TrendQuery, trend_series
+from .windows import TimeIndex
+from .users import UserAppIndex, UserExpenseIndex
+from .resolutions import ResolutionStore, ResolutionError, apply_overrides
+from .refresher import BackgroundRefresher
+from .live import ChangeFeed, snapshot_delta
+import sqlite3
 
 # --- Data Caching (Simple simulation for PoC) ---
 _cached_data = None
 _data_load_time = None
 _cache_ttl = datetime.timedelta(minutes=5) # Cache data for 5 mins
+_data_version = 0 # Generation counter, bumped every time fresh raw data is loaded
+_data_lock = threading.RLock() # Only one request reloads the CSVs, the others wait for it
 
 def load_and_cache_data(force_reload=False):
-    """Loads data from sources, using a simple time-based cache."""
-    global _cached_data, _data_load_time
+    """
+    Loads data from sources, using a simple time-based cache. While the background refresher runs
+    (see start_background_refresh) the cache lasts MAX_SNAPSHOT_AGE_S instead, the refresher keeps it current.
+    """
+    if not force_reload and _is_cache_fresh():
+        metrics.inc('cache_requests_total', cache='data', result='hit')
+        return _sync_resolutions(_cached_data)
+
+    with _data_lock:
+        # Another request may have reloaded while we waited for the lock
+        if not force_reload and _is_cache_fresh():
+            metrics.inc('cache_requests_total', cache='data', result='hit')
+            return _sync_resolutions(_cached_data)
+        metrics.inc('cache_requests_total', cache='data', result='miss')
+        return _reload_data_sources(force_reload)
+
+def _reload_data_sources(force_reload=False):
+    """Re-reads the changed sources (everything if force_reload). Call with _data_lock held."""
+    started = time.perf_counter()
+    reloaded, kind = None, 'incremental'
+    if not force_reload and _cached_data and current_app.config.get('INCREMENTAL_REFRESH', True):
+        reloaded = _refresh_data_sources()
+    if reloaded is None:
+        reloaded, kind = _load_data_sources(), 'full'
+    else:
+        reloaded = _sync_resolutions(reloaded)
+    seconds = time.perf_counter() - started
+    metrics.observe('reload_data', seconds)
+    metrics.inc('reloads_total', kind=kind)
+    metrics.set_gauge('last_reload_seconds', seconds)
+    return reloaded
+
+def _is_cache_fresh():
+    age = snapshot_age()
+    if age is None:
+        return False
+    if _background_refresh_running():
+        return age < current_app.config.get('MAX_SNAPSHOT_AGE_S', 600)
+    return age < _cache_ttl.total_seconds()
 
-    now = datetime.datetime.now()
-    if not force_reload and _cached_data and _data_load_time and (now - _data_load_time < _cache_ttl):
-        return _cached_data
+def snapshot_age():
+    """Seconds since the served data was last loaded or found up to date with its sources, None before the first load."""
+    load_time = _data_load_time
+    if _cached_data is None or load_time is None:
+        return None
+    return (datetime.datetime.now() - load_time).total_seconds()
+
+def _load_data_sources():
+    """Reads and cleans all data sources, replacing the cached copy. Call with _data_lock held."""
+    global _cached_data, _data_load_time, _data_version
 
+    now = datetime.datetime.now()
     try:
         cfg = current_app.config
-        network_df = pd.read_csv(cfg['NETWORK_LOG_FILE'])
-        expenses_df = pd.read_csv(cfg['EXPENSES_FILE'])
-        known_apps_df = pd.read_csv(cfg['KNOWN_APPS_FILE'], keep_default_na=False, na_values=['']) # Read blank as NaN
-
-        # --- Basic Data Cleaning/Preparation ---
-        if 'timestamp' in network_df.columns:
-            network_df['timestamp'] = pd.to_datetime(network_df['timestamp']).dt.tz_localize(None)
-        if 'date' in expenses_df.columns:
-            expenses_df['date'] = pd.to_datetime(expenses_df['date'])
-
-        # Drop duplicates in known_apps_df if any, keeping the first entry for a domain
-        if 'domain' in known_apps_df.columns:
-            known_apps_df = known_apps_df.drop_duplicates(subset='domain', keep='first')
-
-            # Handle boolean cols potentially read as objects - ensure they are real bools or None
-            for col in ['compliance_gdpr', 'compliance_hipaa', 'known_breach']:
-                if col in known_apps_df.columns:
-                    # Map various 'truthy'/'falsy' representations to bool, keeping NaN/None as None
-                    map_dict = {
-                        'True': True, 'true': True, 'TRUE': True, True: True, 1: True, '1': True,
-                        'False': False, 'false': False, 'FALSE': False, False: False, 0: False, '0': False,
-                        np.nan: None, None: None, '': None # Map blanks/NaN/None to None
-                    }
-                    known_apps_df[col] = known_apps_df[col].map(map_dict)
-                    # Explicitly convert to nullable boolean only if necessary, None is usually sufficient
-                    # try:
-                    #     known_apps_df[col] = known_apps_df[col].astype('boolean')
-                    # except Exception: # Handle mixed types or other conversion errors
-                    #     pass # Keep original or map to None on error if desired
-
-
-            # Set index *after* potential type conversion
-            known_apps_df.set_index('domain', inplace=True, drop=False)
-
-            # Handle resolution_status potential NaN/None correctly
-            if 'resolution_status' not in known_apps_df.columns:
-                known_apps_df['resolution_status'] = pd.Series(dtype='object')
-            # Ensure it's treated as string or None, replace NaN from read with None
-            known_apps_df['resolution_status'] = known_apps_df['resolution_status'].fillna(value=np.nan).replace([np.nan], [None]).astype(object)
-
+        cache_dir = cfg.get('DATA_CACHE_DIR') # Cleaned frames are reused from here while the CSVs are unchanged
+        network_aggregates = network_tail = network_segments = None
+        log_path = cfg['NETWORK_LOG_FILE']
+        workers = cfg.get('NETWORK_INGEST_WORKERS', 1) or os.cpu_count() or 1
+        if cfg.get('NETWORK_INGEST_MODE', 'frame') == 'stream':
+            # Only per-domain / per-user aggregates are kept, the raw rows are dropped chunk by chunk
+            with metrics.timed('load_network'):
+                if is_segmented_log(log_path):
+                    network_segments = SegmentedLog(log_path, cfg.get('NETWORK_LOG_CHUNK_ROWS', 250000),
+                                                    retention=_log_retention(cfg), workers=workers,
+                                                    window_hours=cfg.get('NETWORK_WINDOW_BUCKET_HOURS'))
+                    network_segments.refresh()
+                    network_aggregates = network_segments.aggregates
+                else:
+                    network_aggregates, network_tail = stream_network_log(log_path, cfg.get('NETWORK_LOG_CHUNK_ROWS', 250000),
+                                                                          workers=workers,
+                                                                          window_hours=cfg.get('NETWORK_WINDOW_BUCKET_HOURS'))
+            network_df = pd.DataFrame()
+            usage_rollups = network_aggregates.rollups
+            metrics.inc('rows_ingested_total', network_aggregates.rows_ingested)
         else:
-             print("Warning: 'domain' column missing from known_apps.csv. Index not set.")
-
-
+            with metrics.timed('load_network'):
+                if is_segmented_log(log_path):
+                    network_df = _clean_network_log(read_log_segments(log_path, _log_retention(cfg), cache_dir))
+                else:
+                    network_df = load_frame(log_path, _read_network_log, cache_dir)
+            with metrics.timed('build_rollups'):
+                usage_rollups = UsageRollups.from_frame(network_df)
+            metrics.inc('rows_ingested_total', len(network_df))
+        with metrics.timed('load_expenses'):
+            expenses_df = load_frame(cfg['EXPENSES_FILE'], _read_expenses, cache_dir)
+        with metrics.timed('load_known_apps'):
+            known_apps_df = load_frame(cfg['KNOWN_APPS_FILE'], _read_known_apps, cache_dir)
+        resolution_revision = _apply_stored_resolutions(known_apps_df)
+
+        _data_version += 1
         _cached_data = {
             'network': network_df,
+            'network_aggregates': network_aggregates, # Set instead of the raw rows in streaming mode
+            'network_tail': network_tail, # Where an incremental refresh continues reading the log
+            'network_segments': network_segments, # SegmentedLog of a segmented log (streaming mode)
+            'usage_rollups': usage_rollups, # Hourly/daily access buckets behind the usage trend chart
             'expenses': expenses_df,
-            'known_apps': known_apps_df
+            'expense_index': ExpenseIndex(expenses_df), # Built once per load, shared by every scoring run
+            'user_expense_index': UserExpenseIndex(expenses_df), # Expenses by user, for /api/users
+            'known_apps': known_apps_df, # Catalog with the resolution store's overrides applied
+            'domain_index': _domain_index(cfg, known_apps_df), # Rolls subdomains up to catalog apps (None: off)
+            'resolution_revision': resolution_revision, # Latest resolution store change applied to it
+            'source_signatures': _source_signatures(cfg),
+            'source_versions': dict.fromkeys(DATA_SOURCES, _data_version), # Data version each source last changed in
+            'change_log': {}, # version -> (domains rediscovered, domains only rescored), None: all of them
+            'version': _data_version
         }
         _data_load_time = now
         return _cached_data
@@ -81,6 +152,278 @@ def load_and_cache_data(force_reload=False):
         print(f"An unexpected error occurred loading data: {e}\n{traceback.format_exc()}")
         raise
 
+_CHANGE_LOG_VERSIONS = 32 # Incremental updates remembered for catching up an older snapshot
+
+DATA_SOURCES = ['network', 'expenses', 'known_apps', 'resolutions']
+
+def _refresh_data_sources():
+    """
+    Brings the cached data up to date source by source instead of reloading everything. Each source
+    is re-read only if its file changed on disk, and only the apps depending on the change are rescored:
+    - network log: streamed mode folds in the appended lines (or the new and changed segments of a
+      segmented log, dropping deleted and expired ones) and rediscovers the domains they touch
+      (frame mode re-reads the whole log, returning None);
+    - expenses: spend is re-linked, the apps whose linked spend changed are rescored;
+    - known apps: the catalog rows are compared, the apps of added, removed or edited rows are rescored.
+    Returns None when a full reload is needed instead (log truncated, rotated or rewritten).
+    Call with _data_lock held.
+    """
+    global _cached_data, _data_load_time, _data_version
+
+    now = datetime.datetime.now()
+    cached = _cached_data
+    try:
+        cfg = current_app.config
+        signatures = _source_signatures(cfg)
+        previous_signatures = cached.get('source_signatures', {})
+        updates, changed_sources = {}, []
+        rediscover, rescore = set(), set()
+
+        if cached.get('network_tail') is not None:
+            with metrics.timed('load_network'):
+                # Folded into a copy: the published version keeps reading its own aggregates and rollups
+                followed = follow_network_log(cached['network_aggregates'], cached['network_tail'],
+                                              cfg.get('NETWORK_LOG_CHUNK_ROWS', 250000))
+            if followed is None:
+                print("Network log was truncated, rotated or rewritten. Reloading all data sources.")
+                return None
+            network_aggregates, network_tail, rediscover = followed
+            metrics.inc('rows_ingested_total', network_aggregates.rows_ingested - cached['network_aggregates'].rows_ingested)
+            if network_tail is not cached['network_tail']: # Lines were read, even if none had a valid domain
+                changed_sources.append('network')
+                updates.update(network_aggregates=network_aggregates, network_tail=network_tail,
+                               usage_rollups=network_aggregates.rollups)
+            if rediscover:
+                updates.update(user_domain_access=None, user_app_index=None) # Rebuilt from the grown aggregates on next use
+        elif cached.get('network_segments') is not None:
+            segments = cached['network_segments']
+            rows_before = segments.aggregates.rows_ingested
+            with metrics.timed('load_network'):
+                rediscover = segments.refresh()
+            # Approximate when segments also expired: dropped rows offset the new ones
+            metrics.inc('rows_ingested_total', max(0, segments.aggregates.rows_ingested - rows_before))
+            if rediscover:
+                changed_sources.append('network')
+                # New aggregates either way: added segments are merged into a copy, dropping one re-merges the others
+                updates.update(network_aggregates=segments.aggregates, usage_rollups=segments.aggregates.rollups,
+                               user_domain_access=None, user_app_index=None)
+        elif signatures.get('network') != previous_signatures.get('network'):
+            return None # Frame mode holds the parsed log, it is read again in full
+
+        if signatures['expenses'] != previous_signatures.get('expenses'):
+            with metrics.timed('load_expenses'):
+                expenses_df = load_frame(cfg['EXPENSES_FILE'], _read_expenses, cfg.get('DATA_CACHE_DIR'))
+            expense_index = ExpenseIndex(expenses_df)
+            updates.update(expenses=expenses_df, expense_index=expense_index, user_expense_index=UserExpenseIndex(expenses_df))
+            rescore |= _relinked_domains(cached['known_apps'], cached['expense_index'], expense_index)
+            changed_sources.append('expenses')
+        if signatures['known_apps'] != previous_signatures.get('known_apps'):
+            with metrics.timed('load_known_apps'):
+                known_apps_df = load_frame(cfg['KNOWN_APPS_FILE'], _read_known_apps, cfg.get('DATA_CACHE_DIR'))
+            updates.update(known_apps=known_apps_df, resolution_revision=_apply_stored_resolutions(known_apps_df),
+                           domain_index=_domain_index(cfg, known_apps_df))
+            changed_rows = _changed_catalog_domains(cached['known_apps'], known_apps_df)
+            regrouped = bool(updates['domain_index']) and set(cached['known_apps'].index) != set(known_apps_df.index)
+            if regrouped: # Subdomains roll up differently, apps merge or split
+                updates.update(user_domain_access=None, user_app_index=None)
+            if changed_rows is None or regrouped:
+                rescore = None # Columns changed or apps regrouped, every app is rescored
+            elif rescore is not None:
+                rescore |= changed_rows # Edited keywords included, unchanged rows were re-linked above
+            changed_sources.append('known_apps')
+
+        _data_load_time = now
+        if not changed_sources:
+            return cached # Nothing new, keep serving the current version
+
+        change = (rediscover, rescore) if rescore is not None else None
+        source_versions = {**cached.get('source_versions', {}), **dict.fromkeys(changed_sources, _data_version + 1)}
+        return _publish_change(cached, change, **updates, source_signatures=signatures, source_versions=source_versions)
+
+    except Exception as e:
+        # Nothing was published, the current version is intact; a full reload starts over from the files
+        print(f"Incremental refresh failed, reloading all data sources: {e}\n{traceback.format_exc()}")
+        return None
+
+def _publish_change(cached, change, **updates):
+    """
+    Publishes a new data version made of `cached` plus `updates`, recording which apps it changed:
+    (domains to rediscover from the network data, domains to rescore only), or None for all of them.
+    Call with _data_lock held.
+    """
+    global _cached_data, _data_version
+    _data_version += 1
+    change_log = {v: c for v, c in cached['change_log'].items() if v > _data_version - _CHANGE_LOG_VERSIONS}
+    change_log[_data_version] = change
+    _cached_data = {**cached, **updates, 'change_log': change_log, 'version': _data_version}
+    return _cached_data
+
+# --- Resolution Overrides (see app.resolutions) ---
+_resolution_store = None
+
+def get_resolution_store():
+    """The ResolutionStore at RESOLUTION_STORE_FILE, opened on first use. None if not configured or unusable."""
+    global _resolution_store
+    path = current_app.config.get('RESOLUTION_STORE_FILE')
+    if not path:
+        return None
+    store = _resolution_store
+    if store is not None and store.path == path:
+        return store
+    with _data_lock:
+        if _resolution_store is None or _resolution_store.path != path:
+            try:
+                _resolution_store = ResolutionStore(path)
+            except (sqlite3.Error, OSError) as e:
+                print(f"Warning: Could not open resolution store {path}: {e}")
+                return None
+        return _resolution_store
+
+def _apply_stored_resolutions(known_apps_df):
+    """Applies every stored resolution override to a freshly read catalog. Returns the store revision applied."""
+    store = get_resolution_store()
+    if store is None:
+        return 0
+    overrides, revision = store.changes_since(0)
+    apply_overrides(known_apps_df, overrides)
+    return revision
+
+def _sync_resolutions(cached):
+    """
+    Applies the resolution changes recorded since `cached` was built, by this or another worker process.
+    Only the apps whose resolution changed are rescored for the new version.
+    """
+    store = get_resolution_store()
+    if store is None or cached is None or store.revision() <= cached.get('resolution_revision', 0):
+        return cached
+    with _data_lock:
+        cached = _cached_data # The latest version, another request may have synced already
+        if cached is None:
+            return None
+        overrides, revision = store.changes_since(cached.get('resolution_revision', 0))
+        if revision <= cached.get('resolution_revision', 0):
+            return cached
+        # Applied to a copy: requests and window snapshots of the published version keep reading its catalog
+        known_apps_df = cached['known_apps'].copy()
+        applied = apply_overrides(known_apps_df, overrides)
+        source_versions = {**cached.get('source_versions', {}), 'resolutions': _data_version + 1}
+        return _publish_change(cached, (set(), applied), known_apps=known_apps_df, resolution_revision=revision,
+                               source_versions=source_versions)
+
+def _file_signature(path):
+    """(inode, size, mtime) of a file, used to tell whether it changed since it was read."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+def _source_signatures(cfg):
+    return {'network': _network_signature(cfg['NETWORK_LOG_FILE']),
+            'expenses': _file_signature(cfg['EXPENSES_FILE']),
+            'known_apps': _file_signature(cfg['KNOWN_APPS_FILE'])}
+
+def _network_signature(path):
+    """Signature of the network log file, or of every segment of a segmented log."""
+    if is_segmented_log(path):
+        return tuple((segment, _file_signature(segment)) for segment in list_log_segments(path))
+    return _file_signature(path)
+
+def _log_retention(cfg):
+    days = cfg.get('NETWORK_LOG_RETENTION_DAYS')
+    return datetime.timedelta(days=days) if days else None
+
+def _relinked_domains(known_apps_df, old_index, new_index):
+    """Catalog domains whose expense keywords link to different spend with new_index than with old_index."""
+    if known_apps_df.empty or 'domain' not in known_apps_df.columns or 'expense_keywords' not in known_apps_df.columns:
+        return set()
+    keyword_lists = [_parse_expense_keywords(value) for value in known_apps_df['expense_keywords'].tolist()]
+    old_counts, old_totals = old_index.link_all(keyword_lists)
+    new_counts, new_totals = new_index.link_all(keyword_lists)
+    changed = (old_counts != new_counts) | (old_totals != new_totals)
+    return set(known_apps_df.index[changed])
+
+def _domain_index(cfg, known_apps_df):
+    """DomainSuffixIndex of the catalog domains, None when SUBDOMAIN_ROLLUP is off or the catalog has none."""
+    if not cfg.get('SUBDOMAIN_ROLLUP', True) or 'domain' not in known_apps_df.columns or known_apps_df.empty:
+        return None
+    return DomainSuffixIndex(known_apps_df.index)
+
+def _changed_catalog_domains(old_df, new_df):
+    """Domains whose known-apps row was added, removed or edited. None if the catalog's columns changed."""
+    if list(old_df.columns) != list(new_df.columns) or 'domain' not in new_df.columns:
+        return None
+    old_rows = dict(zip(old_df.index, old_df.itertuples(index=False, name=None)))
+    changed = set()
+    for domain, row in zip(new_df.index, new_df.itertuples(index=False, name=None)):
+        old_row = old_rows.pop(domain, None)
+        if old_row is None or not all(_same_value(a, b) for a, b in zip(old_row, row)):
+            changed.add(domain)
+    return changed | set(old_rows)
+
+def _same_value(a, b):
+    if pd.isna(a) and pd.isna(b):
+        return True
+    return type(a) is type(b) and a == b
+
+# --- Data Source Readers (parse + basic cleaning, results are cached by app.frame_cache) ---
+def _read_network_log(path):
+    with metrics.timed('parse_csv'):
+        network_df = pd.read_csv(path)
+    return _clean_network_log(network_df)
+
+def _clean_network_log(network_df):
+    if 'timestamp' in network_df.columns:
+        with metrics.timed('parse_timestamps'):
+            network_df['timestamp'] = pd.to_datetime(network_df['timestamp']).dt.tz_localize(None)
+    with metrics.timed('intern_columns'):
+        return intern_network_columns(network_df) # Users, domains and IPs as integer codes
+
+def _read_expenses(path):
+    with metrics.timed('parse_csv'):
+        expenses_df = pd.read_csv(path)
+    if 'date' in expenses_df.columns:
+        with metrics.timed('parse_timestamps'):
+            expenses_df['date'] = pd.to_datetime(expenses_df['date'])
+    return expenses_df
+
+def _read_known_apps(path):
+    with metrics.timed('parse_csv'):
+        known_apps_df = pd.read_csv(path, keep_default_na=False, na_values=['']) # Read blank as NaN
+    # Drop duplicates in known_apps_df if any, keeping the first entry for a domain
+    if 'domain' in known_apps_df.columns:
+        known_apps_df = known_apps_df.drop_duplicates(subset='domain', keep='first')
+
+        # Handle boolean cols potentially read as objects - ensure they are real bools or None
+        for col in ['compliance_gdpr', 'compliance_hipaa', 'known_breach']:
+            if col in known_apps_df.columns:
+                # Map various 'truthy'/'falsy' representations to bool, keeping NaN/None as None
+                map_dict = {
+                    'True': True, 'true': True, 'TRUE': True, True: True, 1: True, '1': True,
+                    'False': False, 'false': False, 'FALSE': False, False: False, 0: False, '0': False,
+                    np.nan: None, None: None, '': None # Map blanks/NaN/None to None
+                }
+                known_apps_df[col] = known_apps_df[col].map(map_dict)
+                # Explicitly convert to nullable boolean only if necessary, None is usually sufficient
+                # try:
+                #     known_apps_df[col] = known_apps_df[col].astype('boolean')
+                # except Exception: # Handle mixed types or other conversion errors
+                #     pass # Keep original or map to None on error if desired
+
+
+        # Set index *after* potential type conversion
+        known_apps_df.set_index('domain', inplace=True, drop=False)
+
+        # Handle resolution_status potential NaN/None correctly
+        if 'resolution_status' not in known_apps_df.columns:
+            known_apps_df['resolution_status'] = pd.Series(dtype='object')
+        # Ensure it's treated as string or None, replace NaN from read with None
+        known_apps_df['resolution_status'] = known_apps_df['resolution_status'].fillna(value=np.nan).replace([np.nan], [None]).astype(object)
+
+    else:
+         print("Warning: 'domain' column missing from known_apps.csv. Index not set.")
+    return known_apps_df
+
 # --- Safe Type Conversion Helpers ---
 def safe_int(value, default=0):
     """Safely convert value to int, handling potential NaN/None/errors."""
@@ -122,34 +465,377 @@ def safe_bool(value, default=None):
          return default # Or raise an error if strict conversion needed
 
 
-# --- Main Processing Function ---
-def get_processed_app_data():
+# --- Processed Snapshot Cache ---
+# The dashboard fires all of its API calls in parallel, so the discovery + risk
+# pipeline is memoized per data version and shared by every endpoint.
+_snapshot = None
+_snapshot_lock = threading.Lock() # Concurrent requests for the same version wait on one computation
+
+def get_processed_snapshot(wait=False):
     """
-    Main function to get the processed application data. Uses cached raw data.
-    Ensures final dict has JSON-serializable types.
+    Returns the ProcessedSnapshot for the currently loaded data version.
+    Computed at most once per version; the apps it holds are read-only.
+    While the background refresher is building the next snapshot, the last one is returned instead of waiting,
+    unless wait is set (views whose ETag names the loaded data version, see loaded_data_version).
     """
+    global _snapshot
+    cached = load_and_cache_data()
+    version = cached.get('version', 0)
+
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.version >= version:
+        metrics.inc('cache_requests_total', cache='snapshot', result='hit')
+        return snapshot
+
+    if not _snapshot_lock.acquire(blocking=wait or snapshot is None or not _background_refresh_running() or not _is_cache_fresh()):
+        metrics.inc('cache_requests_total', cache='snapshot', result='stale')
+        return snapshot
+    try:
+        snapshot = _snapshot # Re-check, the computation may have finished while we waited
+        if snapshot is not None and snapshot.version >= version:
+            metrics.inc('cache_requests_total', cache='snapshot', result='hit')
+            return snapshot
+        metrics.inc('cache_requests_total', cache='snapshot', result='miss')
+        snapshot = _run_processing_pipeline(cached, version)
+        _publish_snapshot(snapshot)
+        return snapshot
+    finally:
+        _snapshot_lock.release()
+
+def _publish_snapshot(snapshot):
+    """Makes `snapshot` the served one and records what changed in the live update feed. Call with _snapshot_lock held."""
+    global _snapshot
+    previous, _snapshot = _snapshot, snapshot
+    if previous is None:
+        _change_feed.reset(snapshot.version)
+        return
     try:
-        cached = load_and_cache_data()
+        delta = snapshot_delta(previous, snapshot, snapshot.apps_at)
+        _change_feed.publish(snapshot.version, previous.version, current_app.json.dumps(delta))
+    except Exception as e:
+        print(f"Warning: Could not record live update for version {snapshot.version}: {e}\n{traceback.format_exc()}")
+        _change_feed.reset(snapshot.version) # Followers reload everything instead
+
+# --- Live Updates (see app.live) ---
+_change_feed = ChangeFeed()
+
+def live_update_version():
+    """Version of the snapshot live updates currently start from."""
+    get_processed_snapshot()
+    return _change_feed.version
+
+def wait_for_live_updates(since, timeout):
+    """
+    [(version, delta JSON), ...] of the snapshots published after version `since`, waiting up to timeout
+    seconds for one ([] if none came). None if the client has to reload everything (see ChangeFeed).
+    When nothing came, the data sources are checked as for any request (cache TTL), so changes show up.
+    """
+    events = _change_feed.events_since(since, timeout)
+    if events == []:
+        get_processed_snapshot()
+        events = _change_feed.events_since(since)
+    return events
+
+# --- Metrics (see app.metrics), read when /metrics is scraped ---
+def _network_rows():
+    cached = _cached_data
+    if cached is None:
+        return None
+    aggregates = cached.get('network_aggregates')
+    return aggregates.rows_ingested if aggregates is not None else len(cached.get('network', ()))
+
+metrics.registry.gauge_callback('network_rows', _network_rows)
+metrics.registry.gauge_callback('domains_discovered', lambda: len(_snapshot.apps) if _snapshot is not None else None)
+metrics.registry.gauge_callback('data_version', lambda: _cached_data.get('version', 0) if _cached_data else None)
+metrics.registry.gauge_callback('snapshot_age_seconds', snapshot_age)
+
+def processed_snapshot_version():
+    """Version of the snapshot requests are served from now (computed first if needed)."""
+    return get_processed_snapshot().version
+
+def loaded_data_version():
+    """Version of the loaded raw data (the snapshot may not be computed for it yet)."""
+    return load_and_cache_data().get('version', 0)
+
+# --- Background Refresh (see app.refresher) ---
+_refresher = None
+
+def start_background_refresh(app):
+    """
+    Starts the thread refreshing the data and the processed snapshot every BACKGROUND_REFRESH_INTERVAL_S
+    seconds. Requests then serve the last snapshot as long as it is at most MAX_SNAPSHOT_AGE_S old;
+    past that (the refresher is stuck or failing) they reload synchronously again.
+    """
+    global _refresher
+    if _refresher is None or not _refresher.is_alive():
+        _refresher = BackgroundRefresher(app, refresh_in_background, app.config.get('BACKGROUND_REFRESH_INTERVAL_S', 60))
+        _refresher.start()
+    return _refresher
+
+def stop_background_refresh(timeout=None):
+    global _refresher
+    if _refresher is not None:
+        _refresher.stop(timeout)
+        _refresher = None
+
+def refresh_in_background():
+    """
+    One refresh of the background refresher: re-reads the changed sources and builds their snapshot
+    while holding the snapshot lock, so requests keep getting the previous snapshot until it is ready.
+    """
+    with _snapshot_lock:
+        with _data_lock:
+            cached = _reload_data_sources()
+        cached = _sync_resolutions(cached)
+        if _snapshot is None or _snapshot.version < cached.get('version', 0):
+            _publish_snapshot(_run_processing_pipeline(cached, cached.get('version', 0)))
+
+def get_data_status():
+    """Freshness of the served data, without loading anything: data/snapshot versions and snapshot age."""
+    cached, snapshot, age = _cached_data, _snapshot, snapshot_age()
+    return {'data_version': cached.get('version', 0) if cached else None,
+            'snapshot_version': snapshot.version if snapshot is not None else None,
+            'snapshot_age_s': round(age, 3) if age is not None else None,
+            'background_refresh': _background_refresh_running()}
+
+def _background_refresh_running():
+    refresher = _refresher
+    return refresher is not None and refresher.is_alive()
+
+def _run_processing_pipeline(cached, version):
+    """Runs discovery and risk calculation over one set of cached raw data."""
+    network_df = cached.get('network', pd.DataFrame())
+    network_aggregates = cached.get('network_aggregates')
+
+    changes = _domains_changed_since(_snapshot, cached)
+    if (changes is not None and (network_aggregates is not None or not changes[0])
+            and current_app.config.get('RISK_SCORING_MODE', 'columnar') != 'per_app'):
+        return _rescore_changed_apps(_snapshot, *changes, cached, version)
+
+    domain_index = cached.get('domain_index')
+    if network_aggregates is not None:
+        with metrics.timed('discover'):
+            apps_frame = discover_applications_from_aggregates(network_aggregates, domain_index=domain_index)
+    elif network_df.empty: # Check if essential DataFrames are usable
+        print("Warning: Network log data is empty.")
+        return ProcessedSnapshot(version=version) # Empty if no network data
+    else:
+        with metrics.timed('discover'):
+            apps_frame = discover_applications_frame(network_df, domain_index)
+
+    return _scored_snapshot(apps_frame, cached, version)
+
+def _scored_snapshot(apps_frame, cached, version, **fields):
+    """Risk calculation over a discovery frame, as a ProcessedSnapshot (plus `fields`)."""
+    known_apps_db = cached.get('known_apps', pd.DataFrame())
+    expenses_df = cached.get('expenses', pd.DataFrame())
+    expense_index = cached.get('expense_index')
+    if current_app.config.get('RISK_SCORING_MODE', 'columnar') == 'per_app':
+        with metrics.timed('score'):
+            processed_apps = calculate_risk_and_status(build_app_records(apps_frame), known_apps_db, expenses_df, expense_index)
+        with metrics.timed('build_records'):
+            return ProcessedSnapshot(version=version, apps=tuple(freeze_app(app) for app in processed_apps), **fields)
+
+    with metrics.timed('score'):
+        scored = score_apps(apps_frame, known_apps_db, expenses_df, expense_index)
+    with metrics.timed('build_records'):
+        return ProcessedSnapshot(version=version, apps=tuple(freeze_app(app) for app in scored_app_records(scored)),
+                                 frame=scored, factor_source=functools.partial(risk_factors_for, scored), **fields)
+
+def _domains_changed_since(snapshot, cached):
+    """
+    (rediscover, rescore) domains whose apps may differ between `snapshot` and the cached data, when every
+    version in between was an incremental update: the first had new network traffic, the second only a
+    new resolution status. None means everything has to be rescored.
+    """
+    if snapshot is None or snapshot.frame is None or 'sort_key' not in snapshot.frame.columns:
+        return None
+    change_log = cached.get('change_log', {})
+    rediscover, rescore = set(), set()
+    for version in range(snapshot.version + 1, cached.get('version', 0) + 1):
+        change = change_log.get(version)
+        if change is None:
+            return None
+        rediscover |= change[0]
+        rescore |= change[1]
+    return rediscover, rescore
+
+def _rescore_changed_apps(previous, rediscover, rescore, cached, version):
+    """
+    New snapshot from `previous` with only the apps of the changed domains rescored. Apps with new traffic
+    are rediscovered from the network aggregates, the others keep their discovery columns.
+    """
+    domain_index = cached.get('domain_index')
+    if domain_index: # New traffic to a subdomain changes its app
+        rediscover = {domain_index.app_for(domain) or domain for domain in rediscover}
+    parts = [previous.frame.loc[previous.frame['domain'].isin(rescore - rediscover), DISCOVERY_COLUMNS + ['sort_key']]]
+    if rediscover:
+        with metrics.timed('discover'):
+            parts.append(discover_applications_from_aggregates(cached['network_aggregates'], only_domains=rediscover,
+                                                               domain_index=domain_index))
+    apps_frame = pd.concat([part for part in parts if len(part)] or parts[:1], ignore_index=True)
+    changed_domains = rediscover | rescore
+    with metrics.timed('score'):
+        rescored = score_apps(apps_frame, cached.get('known_apps', pd.DataFrame()),
+                              cached.get('expenses', pd.DataFrame()), cached.get('expense_index'))
+
+    kept = previous.frame[~previous.frame['domain'].isin(changed_domains)]
+    scored = pd.concat([kept, rescored], ignore_index=True) if len(rescored) else kept
+    scored = scored.iloc[np.argsort(scored['sort_key'].to_numpy(), kind='stable')].reset_index(drop=True)
+
+    # Unchanged apps keep their (read-only) records from the previous snapshot
+    apps_by_domain = {app['domain']: app for app in previous.apps}
+    apps_by_domain.update((app['domain'], freeze_app(app)) for app in scored_app_records(rescored))
+    return ProcessedSnapshot(version=version, apps=tuple(apps_by_domain[domain] for domain in scored['domain']),
+                             frame=scored, factor_source=functools.partial(risk_factors_for, scored))
+
+# --- Time Windows (the since/until parameters, see app.windows) ---
+_WINDOW_SNAPSHOTS = 8 # Window snapshots kept, most recently used first out
+_window_snapshots = OrderedDict() # (data version, TimeWindow) -> ProcessedSnapshot
+_window_lock = threading.Lock()
+
+def get_window_snapshot(window):
+    """
+    ProcessedSnapshot of the apps seen in a TimeWindow: discovery over the network rows logged inside it,
+    scored against the current catalog and the whole expense ledger. Memoized per data version and window.
+    """
+    cached = load_and_cache_data()
+    key = (cached.get('version', 0), window)
+    with _window_lock:
+        snapshot = _window_snapshots.get(key)
+        if snapshot is not None:
+            _window_snapshots.move_to_end(key)
+            metrics.inc('cache_requests_total', cache='window', result='hit')
+            return snapshot
+    metrics.inc('cache_requests_total', cache='window', result='miss')
+    snapshot = _run_window_pipeline(cached, window, key[0])
+    with _window_lock:
+        _window_snapshots[key] = snapshot
+        while len(_window_snapshots) > _WINDOW_SNAPSHOTS:
+            _window_snapshots.popitem(last=False)
+    return snapshot
+
+def _run_window_pipeline(cached, window, version):
+    domain_index = cached.get('domain_index')
+    network_aggregates = cached.get('network_aggregates')
+    if network_aggregates is not None:
+        if not network_aggregates.window_hours:
+            raise QueryError("since/until need NETWORK_WINDOW_BUCKET_HOURS to be set in 'stream' ingest mode")
+        start, stop = window.bounds(network_aggregates.latest_access())
+        with metrics.timed('discover_window'):
+            aggregates = network_aggregates.window(start, stop)
+            if aggregates.rows_ingested == 0:
+                return ProcessedSnapshot(version=version)
+            apps_frame = discover_applications_from_aggregates(aggregates, domain_index=domain_index)
+        user_access = functools.partial(UserDomainAccess.from_aggregates, aggregates, domain_index)
+    else:
+        time_index = get_time_index(cached)
+        if time_index is None:
+            return ProcessedSnapshot(version=version)
+        network_df = cached['network']
+        with metrics.timed('discover_window'):
+            positions = time_index.rows_between(*window.bounds(time_index.latest()))
+            if not len(positions):
+                return ProcessedSnapshot(version=version)
+            window_df = network_df.take(positions)
+            apps_frame = discover_applications_frame(window_df, domain_index)
+        user_access = functools.partial(UserDomainAccess.from_frame, window_df, domain_index)
+    return _scored_snapshot(apps_frame, cached, version, user_access=user_access)
+
+def get_time_index(cached):
+    """
+    TimeIndex of the loaded network log rows (frame mode), built on first use and kept with the cached
+    data. None if the log can't be used.
+    """
+    time_index = cached.get('time_index')
+    if time_index is None:
         network_df = cached.get('network', pd.DataFrame())
-        expenses_df = cached.get('expenses', pd.DataFrame())
-        known_apps_db = cached.get('known_apps', pd.DataFrame())
+        if network_df.empty or 'timestamp' not in network_df.columns:
+            return None
+        time_index = cached['time_index'] = TimeIndex(network_df['timestamp'])
+    return time_index
 
-        # Check if essential DataFrames are usable
-        if network_df.empty:
-            print("Warning: Network log data is empty.")
-            return [] # Return empty if no network data
+def get_user_app_index(cached):
+    """
+    UserAppIndex of the cached network data (see app.users), built on first use and kept with the cached
+    data, so loads don't pay for it until /api/users is asked. None if the log can't be used.
+    """
+    app_index = cached.get('user_app_index')
+    if app_index is None:
+        network_aggregates = cached.get('network_aggregates')
+        network_df = cached.get('network', pd.DataFrame())
+        required_cols = ['destination_domain', 'user_id', 'timestamp', 'data_uploaded_mb', 'data_downloaded_mb']
+        if network_aggregates is None and (network_df.empty or not all(col in network_df.columns for col in required_cols)):
+            return None
+        with metrics.timed('index_users'):
+            if network_aggregates is not None: # Streamed: read from the (domain, user) aggregates
+                app_index = UserAppIndex.from_aggregates(network_aggregates, cached.get('domain_index'))
+            else:
+                app_index = UserAppIndex.from_frame(network_df, cached.get('domain_index'))
+        cached['user_app_index'] = app_index
+    return app_index
+
+def _served_snapshot(window):
+    return get_window_snapshot(window) if window is not None else get_processed_snapshot()
 
-        discovered_apps = discover_applications(network_df)
-        processed_apps = calculate_risk_and_status(discovered_apps, known_apps_db, expenses_df)
-        return processed_apps
+# --- Main Processing Function ---
+def get_processed_app_data(include_risk_factors=True, window=None):
+    """
+    Main function to get the processed application data, served from the shared snapshot.
+    Ensures final dicts have JSON-serializable types. Returned records are read-only.
+    Pass include_risk_factors=False when the risk_factors text isn't needed, it is built on demand.
+    With a TimeWindow, the apps seen inside it (see get_window_snapshot).
+    """
+    try:
+        snapshot = _served_snapshot(window)
+        return snapshot.with_risk_factors() if include_risk_factors else snapshot.apps
+    except QueryError:
+        raise # A window the loaded data can't answer, reported to the client
     except Exception as e:
         print(f"FATAL Error during application data processing: {e}\n{traceback.format_exc()}")
         return [] # Return empty list on major error
 
+# --- App Queries (/api/apps filtering, sorting and pagination) ---
+def query_processed_apps(query, window=None):
+    """
+    One page of processed apps for an AppQuery (see app.queries), served from the snapshot's AppIndex:
+    {'items', 'total', 'offset', 'limit', 'next_offset', 'version'}. Risk factors are built only for
+    the apps on the page, and only when the requested fields include them. window: as in get_processed_app_data.
+    """
+    snapshot = _served_snapshot(window)
+    if query.fields is not None and snapshot.apps:
+        unknown = [field for field in query.fields if field not in snapshot.apps[0]]
+        if unknown:
+            raise QueryError(f"Unknown fields: {', '.join(unknown)}")
+
+    index = snapshot.memoized('app_index', lambda: AppIndex(snapshot.apps))
+    positions, total = index.select(query)
+    include_risk_factors = query.fields is None or 'risk_factors' in query.fields
+    apps = snapshot.apps_at(positions.tolist(), include_risk_factors=include_risk_factors)
+    next_offset = query.offset + len(apps)
+    return {
+        'items': [project(app, query.fields) for app in apps],
+        'total': total,
+        'offset': query.offset,
+        'limit': query.limit,
+        'next_offset': next_offset if next_offset < total else None,
+        'version': snapshot.version, # Offsets are only stable while the data version stays the same
+    }
+
 # --- Discovery Logic ---
-def discover_applications(network_df):
+DISCOVERY_COLUMNS = ['domain', 'network_access_count', 'user_count', 'unique_users_network',
+                     'total_data_uploaded_mb', 'total_data_downloaded_mb', 'first_seen_network', 'last_seen_network']
+
+def discover_applications(network_df, domain_index=None):
     """Initial discovery based ONLY on network logs. Ensures standard types."""
-    discovered = {}
+    return build_app_records(discover_applications_frame(network_df, domain_index))
+
+def discover_applications_frame(network_df, domain_index=None):
+    """
+    Discovery as a DataFrame: one row per domain, in domain order, holding the network usage
+    fields of a discovered app (plus user_count). Empty frame if the log can't be used.
+    With a domain_index (see app.domains) the rows of subdomains count as their app's domain.
+    """
     required_cols = ['destination_domain', 'user_id', 'timestamp', 'data_uploaded_mb', 'data_downloaded_mb']
 
     # Basic checks upfront
@@ -157,54 +843,182 @@ def discover_applications(network_df):
         print("Warning: Network log empty or missing required columns. Discovery cannot proceed fully.")
         missing = [col for col in required_cols if col not in network_df.columns]
         if missing: print(f"   Missing: {missing}")
-        return [] # Cannot discover without essential columns
+        return pd.DataFrame(columns=DISCOVERY_COLUMNS) # Cannot discover without essential columns
 
     try:
-        grouped = network_df.groupby('destination_domain', dropna=False)
-        for domain, group in grouped:
-             if pd.isna(domain) or not isinstance(domain, str) or domain.strip() == '': # Skip invalid domains
-                 continue
-             domain = str(domain).strip() # Ensure clean string domain
-
-             valid_timestamps = group['timestamp'].dropna()
-             first_seen = valid_timestamps.min() if not valid_timestamps.empty else pd.NaT
-             last_seen = valid_timestamps.max() if not valid_timestamps.empty else pd.NaT
-
-             total_uploaded = safe_float(group['data_uploaded_mb'].sum())
-             total_downloaded = safe_float(group['data_downloaded_mb'].sum())
-             access_count = len(group) # Standard int
-
-             # Get unique users, ensuring they are strings
-             unique_users = list(group['user_id'].astype(str).unique())
-
-             discovered[domain] = {
-                 'id': domain,
-                 'domain': domain,
-                 'network_access_count': access_count,
-                 'unique_users_network': unique_users,
-                 'total_data_uploaded_mb': total_uploaded,
-                 'total_data_downloaded_mb': total_downloaded,
-                 'first_seen_network': first_seen.isoformat() if pd.notna(first_seen) else None,
-                 'last_seen_network': last_seen.isoformat() if pd.notna(last_seen) else None,
-                 'app_name': 'Unknown', 'category': 'Unknown', 'status': 'unknown',
-                 'resolution_status': None, 'inherent_risk_score': 10,
-                 'compliance_gdpr': None, 'compliance_hipaa': None, 'known_breach': None,
-                 'expense_keywords': [], 'linked_expense_count': 0, 'linked_expense_total': 0.0,
-                 'calculated_risk_score': 0, 'calculated_risk_level': 'High', 'risk_factors': []
-             }
+        domain_stats, domain_users = aggregate_network_by_domain(network_df, domain_index)
     except Exception as e:
-         print(f"Error during application discovery grouping/iteration: {e}\n{traceback.format_exc()}")
-         return list(discovered.values()) # Return what was discovered so far
+         print(f"Error during application discovery aggregation: {e}\n{traceback.format_exc()}")
+         return pd.DataFrame(columns=DISCOVERY_COLUMNS)
+    return build_discovery_frame(domain_stats, domain_users)
 
-    return list(discovered.values())
+def discover_applications_from_aggregates(network_aggregates, only_domains=None, domain_index=None):
+    """
+    Discovery frame built from streamed NetworkAggregates (see app.ingestion) instead of raw log rows.
+    only_domains restricts it to the apps of a set of domains. domain_index: as in discover_applications_frame.
+    """
+    if network_aggregates.rows_ingested == 0:
+        print("Warning: Network log empty or missing required columns. Discovery cannot proceed fully.")
+        return pd.DataFrame(columns=DISCOVERY_COLUMNS)
+    domain_stats, domain_users = network_aggregates.domain_summary(only_domains, domain_index)
+    return build_discovery_frame(domain_stats, domain_users)
+
+def build_discovery_frame(domain_stats, domain_users):
+    """
+    Discovery frame from per-domain aggregates in sorted domain order: domain_stats holds the raw
+    'domain', the access/user counts, volume totals and first/last_seen; domain_users each domain's users (InternedStrings).
+    """
+    frame = pd.DataFrame({
+        'domain': [str(d).strip() for d in domain_stats['domain']], # Clean string domains
+        'network_access_count': domain_stats['network_access_count'].to_numpy(),
+        'user_count': domain_stats['user_count'].to_numpy(),
+        'unique_users_network': _object_column(domain_users), # InternedStrings, decoded when serialized
+        'total_data_uploaded_mb': domain_stats['total_data_uploaded_mb'].astype(float).fillna(0.0).to_numpy(),
+        'total_data_downloaded_mb': domain_stats['total_data_downloaded_mb'].astype(float).fillna(0.0).to_numpy(),
+        # object dtype keeps None as None (pandas would otherwise infer a string column holding NaN)
+        'first_seen_network': pd.Series(isoformat_values(domain_stats['first_seen']), dtype=object),
+        'last_seen_network': pd.Series(isoformat_values(domain_stats['last_seen']), dtype=object),
+    }, columns=DISCOVERY_COLUMNS)
+    frame['sort_key'] = domain_stats['domain'].to_numpy() # Raw domain the app is ordered by
+
+    # Domains differing only by surrounding whitespace collapse into one app. As with the dict
+    # apps used to be collected in, the first keeps its position and the last one its values.
+    if frame['domain'].duplicated().any():
+        frame['sort_key'] = frame.groupby('domain', sort=False)['sort_key'].transform('first')
+        first_position = pd.factorize(frame['domain'])[0]
+        keep = (~frame['domain'].duplicated(keep='last')).to_numpy()
+        frame = frame[keep].iloc[np.argsort(first_position[keep], kind='stable')]
+    return frame.reset_index(drop=True)
+
+def aggregate_network_by_domain(network_df, domain_index=None):
+    """
+    Single-pass aggregation of network rows per destination domain.
+    Returns (domain_stats, domain_users): stats in sorted domain order (see build_discovery_frame)
+    and the unique users of each domain in first-seen order, as InternedStrings.
+    With a domain_index, subdomains are rolled up first: matched once per distinct domain, not per row.
+    """
+    domain_codes, domain_values = pd.factorize(network_df['destination_domain'], sort=True)
+    domain_values = np.asarray(domain_values, dtype=object)
+    if domain_index:
+        domain_codes, domain_values = rolled_up_codes(domain_codes, domain_values, domain_index)
+
+    # Invalid domains (NaN, non-strings, blanks) are dropped per distinct domain, not per row.
+    # The trailing False catches the -1 code factorize gives missing values.
+    valid_domain = np.array([isinstance(d, str) and d.strip() != '' for d in domain_values] + [False], dtype=bool)
+    row_mask = valid_domain[domain_codes]
+    domain_codes = domain_codes[row_mask]
+
+    rows = network_df.loc[row_mask, ['timestamp']].assign(domain_code=domain_codes)
+    domain_stats = rows.groupby('domain_code', sort=True).agg(
+        network_access_count=('timestamp', 'size'),
+        first_seen=('timestamp', 'min'), # min/max skip NaT, all-NaT groups stay NaT
+        last_seen=('timestamp', 'max'),
+    )
+
+    # Volume totals are summed over rows grouped contiguously by domain (stable, so each domain
+    # keeps its original row order) to reproduce Series.sum() exactly, see segment_sums.
+    row_order = np.argsort(domain_codes, kind='stable')
+    lengths = domain_stats['network_access_count'].to_numpy()
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    for col, out_col in [('data_uploaded_mb', 'total_data_uploaded_mb'), ('data_downloaded_mb', 'total_data_downloaded_mb')]:
+        raw = network_df[col].to_numpy()[row_mask][row_order]
+        values = pd.to_numeric(raw, errors='coerce').astype(float)
+        unparsable = np.isnan(values) & ~pd.isna(raw) # e.g. 'abc', as opposed to a missing value
+        values = np.where(np.isnan(values), 0.0, values) # Series.sum() skips NaN
+        sums = segment_sums(values, starts, lengths)
+        if unparsable.any(): # The domain's total couldn't be summed, it falls back to 0.0 (safe_float)
+            sums[np.add.reduceat(unparsable, starts) > 0] = 0.0
+        domain_stats[out_col] = sums
+
+    # Unique users per domain: keep the first row of each (domain, user) pair, then a stable
+    # sort by domain keeps users in the order they first appeared for that domain.
+    user_codes, user_names = factorize_as_str(network_df['user_id'])
+    pairs = pd.DataFrame({'domain_code': domain_codes, 'user_code': user_codes[row_mask]}).drop_duplicates()
+    pair_domains = pairs['domain_code'].to_numpy()
+    order = np.argsort(pair_domains, kind='stable')
+    sorted_users = pairs['user_code'].to_numpy()[order].astype(np.int32)
+    user_counts = np.bincount(pair_domains, minlength=len(domain_values))[domain_stats.index.to_numpy()]
+    domain_stats['user_count'] = user_counts
+    # np.split would still give one (empty) group without any domain
+    domain_users = [InternedStrings(codes, user_names) for codes in np.split(sorted_users, np.cumsum(user_counts)[:-1])] if len(domain_stats) else []
+    domain_stats.insert(0, 'domain', domain_values[domain_stats.index.to_numpy()])
+
+    return domain_stats, domain_users
+
+def _object_column(values):
+    """Object array holding each value as is (numpy would unpack sequence-like values into a 2-D array)."""
+    column = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        column[i] = value
+    return column
+
+# numpy adds arrays shorter than this left to right and switches to pairwise summation above it
+_SEQUENTIAL_SUM_LIMIT = 8
+
+def segment_sums(values, starts, lengths):
+    """
+    Sums contiguous, non-empty segments of `values`, matching values[start:start+length].sum() bit for bit.
+    Short segments are accumulated one position at a time across all segments at once,
+    only segments long enough for pairwise summation are summed individually.
+    """
+    if len(starts) == 0:
+        return values[:0].copy()
+    sums = values[starts].copy()
+    short = lengths < _SEQUENTIAL_SUM_LIMIT
+    for offset in range(1, _SEQUENTIAL_SUM_LIMIT):
+        idx = np.flatnonzero(short & (lengths > offset))
+        if idx.size == 0:
+            break
+        sums[idx] += values[starts[idx] + offset]
+    for i in np.flatnonzero(~short):
+        sums[i] = values[starts[i]:starts[i] + lengths[i]].sum()
+    return sums
+
+def build_app_records(apps_frame):
+    """Builds the discovered app dicts (known-app fields at their defaults) from a discovery frame."""
+    columns = zip(*(apps_frame[col].tolist() for col in DISCOVERY_COLUMNS if col != 'user_count'))
+    return [_new_app_record(*values) for values in columns]
+
+def _new_app_record(domain, access_count, unique_users, total_uploaded, total_downloaded, first_seen, last_seen):
+    """A discovered app with network usage filled in (timestamps as ISO strings) and every known-app field at its default."""
+    return {
+        'id': domain,
+        'domain': domain,
+        'network_access_count': access_count,
+        'unique_users_network': unique_users,
+        'total_data_uploaded_mb': total_uploaded,
+        'total_data_downloaded_mb': total_downloaded,
+        'first_seen_network': first_seen,
+        'last_seen_network': last_seen,
+        'app_name': 'Unknown', 'category': 'Unknown', 'status': 'unknown',
+        'resolution_status': None, 'inherent_risk_score': 10,
+        'compliance_gdpr': None, 'compliance_hipaa': None, 'known_breach': None,
+        'expense_keywords': [], 'linked_expense_count': 0, 'linked_expense_total': 0.0,
+        'calculated_risk_score': 0, 'calculated_risk_level': 'High', 'risk_factors': []
+    }
+
+def isoformat_values(timestamps):
+    """Timestamp.isoformat() of every value in a Series (None for NaT), formatted in bulk where possible."""
+    if timestamps.dtype.kind == 'M': # tz-naive datetime64, as produced by load_and_cache_data
+        values = timestamps.to_numpy()
+        missing = np.isnat(values)
+        # isoformat() only adds a fractional part when there is one, so bulk-format whole seconds only
+        if ((values.astype('datetime64[s]') == values) | missing).all():
+            text = np.datetime_as_string(values, unit='s').astype(object)
+            text[missing] = None
+            return text.tolist()
+    return [ts.isoformat() if pd.notna(ts) else None for ts in timestamps]
 
 # --- Risk Calculation ---
-def calculate_risk_and_status(discovered_apps, known_apps_db, expenses_df):
+def calculate_risk_and_status(discovered_apps, known_apps_db, expenses_df, expense_index=None):
     """Calculates risk, status, links expenses. Ensures JSON serializable types."""
     processed_apps = []
     cfg = current_app.config
+    if expense_index is None:
+        expense_index = ExpenseIndex(expenses_df)
     if known_apps_db.empty:
          print("Warning: Known apps database is empty. Risk assessment may be inaccurate.")
+    link_seconds = 0.0 # Timed per app, reported once as the link_expenses stage
 
     for app_dict in discovered_apps:
         domain = app_dict['domain']
@@ -320,21 +1134,9 @@ def calculate_risk_and_status(discovered_apps, known_apps_db, expenses_df):
                     risk_factors.append(f"Vendor has known historical breaches (+{pts} pts)")
 
             # --- Section 3: Link Expenses ---
-            linked_count = 0
-            linked_total = 0.0
-            keywords = app_dict.get('expense_keywords', [])
-            if keywords and not expenses_df.empty and 'vendor_name' in expenses_df.columns and 'amount' in expenses_df.columns:
-                pattern = r'\b(?:' + '|'.join(map(re.escape, keywords)) + r')\b' # Escape special chars
-                try:
-                    matched_expenses = expenses_df[
-                        expenses_df['vendor_name'].astype(str).str.contains(pattern, case=False, na=False, regex=True)
-                    ]
-                    if not matched_expenses.empty:
-                        linked_count = len(matched_expenses)
-                        linked_total = safe_float(matched_expenses['amount'].sum())
-                except Exception as e:
-                    print(f"Regex error linking expenses for {domain} with pattern '{pattern}': {e}")
-
+            link_started = time.perf_counter()
+            linked_count, linked_total = expense_index.link(app_dict.get('expense_keywords', []))
+            link_seconds += time.perf_counter() - link_started
             app_dict['linked_expense_count'] = linked_count
             app_dict['linked_expense_total'] = linked_total
 
@@ -375,16 +1177,219 @@ def calculate_risk_and_status(discovered_apps, known_apps_db, expenses_df):
 
         processed_apps.append(app_dict)
 
+    metrics.observe('link_expenses', link_seconds)
     return processed_apps
 
 
+# --- Columnar Risk Scoring ---
+# Same rules as calculate_risk_and_status, evaluated for all apps at once. The per-rule points are
+# kept as columns so risk_factors_for() can explain a score later, only for callers that show them.
+SCORED_APP_COLUMNS = ['domain', 'app_name', 'category', 'status', 'resolution_status', 'inherent_risk_score',
+                      'compliance_gdpr', 'compliance_hipaa', 'known_breach', 'expense_keywords',
+                      'network_access_count', 'unique_users_network', 'total_data_uploaded_mb', 'total_data_downloaded_mb',
+                      'first_seen_network', 'last_seen_network', 'linked_expense_count', 'linked_expense_total',
+                      'calculated_risk_score', 'calculated_risk_level']
+
+def score_apps(apps_frame, known_apps_db, expenses_df, expense_index=None):
+    """
+    Scores a discovery frame (see discover_applications_frame) in bulk. Returns one row per app with
+    every processed-app field except risk_factors, plus the point columns the factors are built from.
+    """
+    cfg = current_app.config
+    points = cfg.get('RISK_POINTS', {})
+    irrelevant_status = cfg.get('IRRELEVANT_STATUS', 'irrelevant')
+    scored = apps_frame.reset_index(drop=True).copy()
+    n = len(scored)
+
+    # --- Section 1: Enrich with Known Apps (one indexed join on domain) ---
+    if known_apps_db.empty:
+         print("Warning: Known apps database is empty. Risk assessment may be inaccurate.")
+         positions = np.full(n, -1)
+    else:
+        positions = known_apps_db.index.get_indexer(scored['domain'])
+    is_known = positions >= 0
+    known_rows = known_apps_db.iloc[positions[is_known]]
+
+    def known_column(col, convert, default):
+        values = [default() if callable(default) else default for _ in range(n)]
+        if col in known_rows.columns:
+            for i, value in zip(np.flatnonzero(is_known), known_rows[col].tolist()):
+                values[i] = convert(value)
+        return values
+
+    scored['known'] = is_known
+    scored['app_name'] = known_column('app_name', str, 'Unknown')
+    scored['category'] = known_column('category', str, 'Unknown')
+    scored['inherent_risk_score'] = np.array(known_column('inherent_risk_score', lambda v: safe_int(v, default=10), 10), dtype=np.int64)
+    for col in ['compliance_gdpr', 'compliance_hipaa', 'known_breach']:
+        scored[col] = pd.Series(known_column(col, lambda v: safe_bool(v, default=None), None), dtype=object)
+    scored['expense_keywords'] = known_column('expense_keywords', _parse_expense_keywords, list)
+    resolution = np.array(known_column('resolution_status', lambda v: str(v) if pd.notna(v) else None, None), dtype=object)
+    status = np.array(known_column('status', str, 'unknown'), dtype=object)
+
+    # --- Section 1b/1c: Resolution status and irrelevant traffic ---
+    is_false_positive = resolution == 'FalsePositive'
+    is_sanctioned = resolution == 'Sanctioned'
+    status[is_false_positive] = irrelevant_status
+    status[is_sanctioned] = 'sanctioned'
+    is_irrelevant = ~is_false_positive & (status == irrelevant_status)
+    is_scored = ~is_false_positive & ~is_irrelevant
+    scored['status'] = status
+    scored['resolution_status'] = pd.Series(resolution, dtype=object)
+    scored['false_positive'] = is_false_positive
+    scored['irrelevant'] = is_irrelevant
+
+    # --- Section 2: Risk points, one column per rule ---
+    inherent_points = scored['inherent_risk_score'].to_numpy() * safe_int(points.get('inherent_risk_multiplier', 5))
+
+    user_count = scored['user_count'].to_numpy()
+    user_thresholds = cfg.get('USER_COUNT_THRESHOLDS', {'high': 10, 'medium': 3})
+    user_high = user_count > user_thresholds.get('high', 10)
+    user_medium = ~user_high & (user_count > user_thresholds.get('medium', 3))
+    user_points = np.select([user_high, user_medium],
+                            [safe_int(points.get('user_count_high', 20)), safe_int(points.get('user_count_medium', 10))], 0)
+
+    access_high = scored['network_access_count'].to_numpy() > cfg.get('ACCESS_COUNT_THRESHOLD_HIGH', 50)
+    access_points = np.where(access_high, safe_int(points.get('access_count_high', 10)), 0)
+
+    upload_mb = scored['total_data_uploaded_mb'].to_numpy()
+    upload_thresholds = cfg.get('UPLOAD_MB_THRESHOLDS', {'high': 1000, 'medium': 100})
+    upload_high = upload_mb > upload_thresholds.get('high', 1000)
+    upload_medium = ~upload_high & (upload_mb > upload_thresholds.get('medium', 100))
+    upload_points = np.select([upload_high, upload_medium],
+                              [safe_int(points.get('upload_mb_high', 30)), safe_int(points.get('upload_mb_medium', 15))], 0)
+
+    # Compliance/Breach Risk (only if effectively shadow/unapproved)
+    in_shadow_status = pd.Series(status).isin(cfg.get('SHADOW_STATUSES', [])).to_numpy()
+    effectively_shadow = in_shadow_status | ((status == 'conditionally_approved') & ~is_sanctioned)
+    missing_gdpr = effectively_shadow & (scored['compliance_gdpr'].to_numpy() == False) # noqa: E712 - None must not match
+    breach_history = effectively_shadow & (scored['known_breach'].to_numpy() == True) # noqa: E712
+    gdpr_points = np.where(missing_gdpr, safe_int(points.get('missing_gdpr_penalty', 10)), 0)
+    breach_points = np.where(breach_history, safe_int(points.get('known_breach_penalty', 15)), 0)
+
+    # --- Section 3: Link Expenses (only for apps that are actually scored) ---
+    if expense_index is None:
+        expense_index = ExpenseIndex(expenses_df)
+    linked_count = np.zeros(n, dtype=np.int64)
+    linked_total = np.zeros(n, dtype=float)
+    scored_rows = np.flatnonzero(is_scored)
+    keyword_lists = scored['expense_keywords'].tolist()
+    with metrics.timed('link_expenses'):
+        linked_count[scored_rows], linked_total[scored_rows] = expense_index.link_all([keyword_lists[i] for i in scored_rows])
+    scored['linked_expense_count'] = linked_count
+    scored['linked_expense_total'] = linked_total
+
+    # Spend Penalty (if Shadow IT)
+    shadow_spend = (linked_total > 0) & in_shadow_status & ~is_sanctioned
+    spend_points = np.where(shadow_spend, safe_int(points.get('unapproved_spend_penalty', 25)), 0)
+
+    # --- Section 4: Finalize Risk Level ---
+    total = inherent_points + user_points + access_points + upload_points + gdpr_points + breach_points + spend_points
+    risk_score = np.maximum(0, total)
+    risk_thresholds = cfg.get('RISK_THRESHOLDS', {'high': 75, 'medium': 40})
+    sanctioned_low = pd.Series(status).isin(cfg.get('SANCTIONED_STATUSES', [])).to_numpy() & is_sanctioned
+    level = np.select([sanctioned_low, risk_score >= risk_thresholds.get('high', 75), risk_score >= risk_thresholds.get('medium', 40)],
+                      ['Low', 'High', 'Medium'], 'Low').astype(object)
+    # Boost if unknown and not already high
+    boosted = is_scored & (status == 'unknown') & (level != 'High')
+    level[boosted] = 'Medium'
+
+    level[~is_scored] = 'Info'
+    scored['calculated_risk_level'] = level
+    scored['calculated_risk_score'] = np.select([is_false_positive, is_irrelevant], [0, 1], risk_score)
+
+    # Which rules fired and what they were worth, kept for risk_factors_for()
+    rule_columns = {
+        'inherent_points': inherent_points, 'user_points': user_points, 'access_points': access_points,
+        'upload_points': upload_points, 'gdpr_points': gdpr_points, 'breach_points': breach_points, 'spend_points': spend_points,
+        'user_count_high': user_high, 'user_count_medium': user_medium, 'access_count_high': access_high,
+        'upload_mb_high': upload_high, 'upload_mb_medium': upload_medium,
+        'missing_gdpr': missing_gdpr, 'breach_history': breach_history, 'shadow_spend': shadow_spend,
+        'risk_boosted': boosted,
+    }
+    for col, values in rule_columns.items():
+        scored[col] = np.where(is_scored, values, 0 if values.dtype.kind in 'iu' else False)
+    return scored
+
+def _parse_expense_keywords(value):
+    return [str(kw).strip() for kw in str(value).split(',') if str(kw).strip()]
+
+def scored_app_records(scored):
+    """Processed app dicts from a score_apps() frame. risk_factors is left empty, see risk_factors_for()."""
+    columns = zip(*(scored[col].tolist() for col in SCORED_APP_COLUMNS))
+    records = []
+    for values in columns:
+        app_dict = dict(zip(SCORED_APP_COLUMNS, values))
+        app_dict['id'] = app_dict['domain']
+        app_dict['risk_factors'] = []
+        records.append(app_dict)
+    return records
+
+def risk_factors_for(scored, positions=None):
+    """
+    Builds the human-readable risk factors of every app in a score_apps() frame, in frame order,
+    or only of the apps at the given row positions.
+    """
+    if positions is not None:
+        scored = scored.iloc[positions]
+    factors = []
+    rows = scored[['known', 'false_positive', 'irrelevant', 'resolution_status', 'inherent_risk_score', 'inherent_points',
+                   'user_count', 'user_count_high', 'user_count_medium', 'user_points', 'network_access_count',
+                   'access_count_high', 'access_points', 'total_data_uploaded_mb', 'upload_mb_high', 'upload_mb_medium',
+                   'upload_points', 'missing_gdpr', 'gdpr_points', 'breach_history', 'breach_points',
+                   'linked_expense_total', 'shadow_spend', 'spend_points', 'risk_boosted']].itertuples(index=False)
+    for row in rows:
+        if row.false_positive:
+            factors.append(["Marked as False Positive by Admin."])
+            continue
+        if row.irrelevant:
+            factors.append(["Marked as irrelevant traffic (e.g., blog, news)."])
+            continue
+        app_factors = []
+        if not row.known:
+            app_factors.append("Application domain not found in known database")
+        if row.resolution_status == 'Sanctioned':
+            app_factors.append("Manually sanctioned by Admin.")
+        app_factors.append(f"Inherent risk score: {row.inherent_risk_score}/10 ({row.inherent_points} pts)")
+        if row.user_count_high or row.user_count_medium:
+            label = "High" if row.user_count_high else "Moderate"
+            app_factors.append(f"{label} user count ({row.user_count}) (+{row.user_points} pts)")
+        if row.access_count_high:
+            app_factors.append(f"High access count ({row.network_access_count}) (+{row.access_points} pts)")
+        if row.upload_mb_high or row.upload_mb_medium:
+            label = "Very High" if row.upload_mb_high else "High"
+            app_factors.append(f"{label} data upload ({row.total_data_uploaded_mb:.1f} MB) (+{row.upload_points} pts)")
+        if row.missing_gdpr:
+            app_factors.append(f"Lacks GDPR compliance (+{row.gdpr_points} pts)")
+        if row.breach_history:
+            app_factors.append(f"Vendor has known historical breaches (+{row.breach_points} pts)")
+        if row.shadow_spend:
+            app_factors.append(f"Detected Shadow IT spend: ${row.linked_expense_total:.2f} (+{row.spend_points} pts)")
+        if row.risk_boosted:
+            app_factors.append("Risk boosted: Application status is Unknown.")
+        factors.append(app_factors)
+    return factors
+
+
 # --- Analysis Functions for APIs ---
 
 def get_summary_stats(processed_apps):
     """Calculates KPI stats based on processed app data. Returns standard types."""
+    return tally_apps(processed_apps)['stats']
+
+@metrics.timed('tally')
+def tally_apps(processed_apps):
+    """
+    Counts everything the dashboard widgets need in one pass over the processed apps:
+    {'stats': KPI stats, 'spend_by_category': {category: spend}, 'shadow_apps': [apps behind the behavior insights]}.
+    """
     cfg = current_app.config
     stats = defaultdict(int) # Values will be standard ints
     total_spend = 0.0 # Standard float
+    irrelevant_status = cfg.get('IRRELEVANT_STATUS', 'irrelevant')
+    shadow_status_list = cfg.get('SHADOW_STATUSES', [])
+    spend_by_cat = defaultdict(float)
+    shadow_apps = []
 
     app_count_total = 0 # Count relevant apps
     for app in processed_apps:
@@ -394,7 +1399,13 @@ def get_summary_stats(processed_apps):
         resolution = app.get('resolution_status')
         risk_level = app.get('calculated_risk_level', 'Low') # Handle error state or missing level
 
-        if status == cfg.get('IRRELEVANT_STATUS', 'irrelevant') or resolution == 'FalsePositive':
+        if app.get('status') in shadow_status_list and resolution not in ['Sanctioned', 'FalsePositive']:
+            shadow_apps.append(app)
+        if app.get('status') != irrelevant_status and resolution != 'FalsePositive':
+            spend = safe_float(app.get('linked_expense_total', 0.0))
+            if spend > 0: spend_by_cat[str(app.get('category', 'Unknown'))] += spend
+
+        if status == irrelevant_status or resolution == 'FalsePositive':
             stats['irrelevant_or_fp'] += 1
         else:
              app_count_total += 1 # Count relevant apps
@@ -421,47 +1432,71 @@ def get_summary_stats(processed_apps):
          if k != 'linked_spend':
              final_stats[k] = int(v)
 
-    return final_stats
+    return {'stats': final_stats, 'spend_by_category': spend_by_cat, 'shadow_apps': shadow_apps}
 
+def get_risk_distribution(stats):
+    """Risk distribution chart data from the KPI stats. Returns standard types."""
+    # Simplified: directly use risk counts, irrelevant/FP combined as Info/FP
+    return {
+        'labels': ['High', 'Medium', 'Low', 'Info/FP'],
+        'values': [stats.get('high_risk', 0), stats.get('medium_risk', 0), stats.get('low_risk', 0),
+                   stats.get('irrelevant_or_fp', 0)]
+    }
 
-def get_behavior_insights(processed_apps):
-    """Generates user behavior insights. Returns standard types."""
+
+def get_user_domain_access(cached):
+    """
+    The per-(domain, user) access counts of a loaded data version (see app.insights), built on first
+    use and kept with the cached data. None if the network data can't be used.
+    """
+    access = cached.get('user_domain_access')
+    if access is None:
+        network_aggregates = cached.get('network_aggregates')
+        network_df = cached.get('network', pd.DataFrame())
+        if network_aggregates is not None:
+            access = UserDomainAccess.from_aggregates(network_aggregates, cached.get('domain_index'))
+        elif network_df.empty or 'destination_domain' not in network_df.columns or 'user_id' not in network_df.columns:
+            return None
+        else:
+            access = UserDomainAccess.from_frame(network_df, cached.get('domain_index'))
+        cached['user_domain_access'] = access
+    return access
+
+def get_behavior_insights(processed_apps, window=None):
+    """Generates user behavior insights (users counted inside the TimeWindow the apps are from, if any). Returns standard types."""
+    return behavior_insights_for(tally_apps(processed_apps)['shadow_apps'], _user_access_of(_served_snapshot(window)))
+
+def _user_access_of(snapshot):
+    """Builds the UserDomainAccess behind a snapshot's apps, None for the loaded data's."""
+    if snapshot.user_access is None:
+        return None
+    return lambda: snapshot.memoized('user_domain_access', snapshot.user_access)
+
+@metrics.timed('insights')
+def behavior_insights_for(shadow_apps_data, user_access=None):
+    """
+    Behavior insights over the shadow apps picked by tally_apps. user_access builds the UserDomainAccess
+    to count users from (default: the loaded data's, see get_user_domain_access). Returns standard types.
+    """
     cfg = current_app.config
     insights = {'top_shadow_users_by_app_count': [], 'top_shadow_users_by_access_count': [], 'apps_with_high_data_upload': []}
 
     try:
-        shadow_status_list = cfg.get('SHADOW_STATUSES', [])
-        shadow_apps_data = [
-            app for app in processed_apps
-            if app.get('status') in shadow_status_list
-            and app.get('resolution_status') not in ['Sanctioned', 'FalsePositive']
-        ]
         if not shadow_apps_data: return insights
 
-        cached = load_and_cache_data()
-        network_df = cached.get('network', pd.DataFrame())
-        if network_df.empty or 'destination_domain' not in network_df.columns or 'user_id' not in network_df.columns:
+        access = user_access() if user_access is not None else get_user_domain_access(load_and_cache_data())
+        if access is None:
             print("Warning: Network data insufficient for behavior insights.")
             return insights
 
-        shadow_domains = {app['domain'] for app in shadow_apps_data}
-        shadow_traffic = network_df[network_df['destination_domain'].isin(shadow_domains)].copy() # Use .copy()
-
-        # --- Analysis on shadow_traffic ---
-        if not shadow_traffic.empty:
-            # Use cfg.get with default for limit
-            limit = cfg.get('BEHAVIOR_INSIGHTS_LIMIT', 5)
-
-            # Grouping can fail if user_id has NA/mixed types - coerce to string first
-            shadow_traffic['user_id'] = shadow_traffic['user_id'].astype(str)
-
-            # Top users by distinct app count
-            user_app_counts = shadow_traffic.groupby('user_id')['destination_domain'].nunique().sort_values(ascending=False)
-            insights['top_shadow_users_by_app_count'] = [(str(user), int(count)) for user, count in user_app_counts.head(limit).items()]
+        # Use cfg.get with default for limit
+        limit = cfg.get('BEHAVIOR_INSIGHTS_LIMIT', 5)
 
-            # Top users by access count
-            user_access_counts = shadow_traffic['user_id'].value_counts().sort_values(ascending=False)
-            insights['top_shadow_users_by_access_count'] = [(str(user), int(count)) for user, count in user_access_counts.head(limit).items()]
+        # Top users by distinct app count and by access count, over the current shadow apps' traffic
+        shadow_domains = {app['domain'] for app in shadow_apps_data}
+        by_app_count, by_access_count = access.top_users(shadow_domains, limit)
+        insights['top_shadow_users_by_app_count'] = by_app_count
+        insights['top_shadow_users_by_access_count'] = by_access_count
 
         # Apps with high data upload
         upload_thresholds = cfg.get('UPLOAD_MB_THRESHOLDS', {})
@@ -485,80 +1520,211 @@ def get_behavior_insights(processed_apps):
 
 def get_spend_by_category(processed_apps):
     """Aggregates linked spend by application category. Returns standard types."""
-    cfg = current_app.config
-    spend_by_cat = defaultdict(float)
-    irrelevant_status = cfg.get('IRRELEVANT_STATUS', 'irrelevant')
-    for app in processed_apps:
-        if app.get('status') != irrelevant_status and app.get('resolution_status') != 'FalsePositive':
-            category = str(app.get('category', 'Unknown'))
-            spend = safe_float(app.get('linked_expense_total', 0.0))
-            if spend > 0: spend_by_cat[category] += spend
+    return spend_chart_data(tally_apps(processed_apps)['spend_by_category'])
 
+def spend_chart_data(spend_by_cat):
     sorted_data = sorted(spend_by_cat.items(), key=lambda item: item[1], reverse=True)
     labels = [str(item[0]) for item in sorted_data]
     values = [float(round(item[1], 2)) for item in sorted_data]
     return {'labels': labels, 'values': values}
 
 
-def get_usage_trends(processed_apps):
-    """Simulates daily access trend data. Returns standard types."""
-    cfg = current_app.config
-    trend_data = defaultdict(int)
-    today = datetime.date.today()
-    trend_days = cfg.get('TREND_SIMULATION_DAYS', 7)
-    if trend_days <= 0: trend_days = 7 # Basic sanity check
-
-    date_range = [(today - datetime.timedelta(days=i)).isoformat() for i in range(trend_days - 1, -1, -1)]
-
-    import random
-    total_apps = len(processed_apps) if processed_apps else 1 # Avoid division by zero if no apps
-    base_count = max(1, total_apps) * 5 # Ensure base is at least 5
-    for day_iso in date_range:
-        daily_accesses = base_count + random.randint(-total_apps // 2, total_apps) # Fluctuate less wildly maybe
-        trend_data[day_iso] = max(0, daily_accesses)
-
-    labels = list(trend_data.keys())
-    values = list(trend_data.values())
-    return {'labels': labels, 'values': values}
-
-
-# --- Simulation of updating data (for workflow) ---
+def get_usage_trends(query=None):
+    """
+    Access counts (and upload MB) per day or hour over a window, read from the usage rollups built
+    at ingestion. By default the last TREND_SIMULATION_DAYS days up to the latest logged access
+    (today if the log is empty). Returns standard types.
+    """
+    if query is None:
+        query = TrendQuery(days=default_trend_days())
+    cached = load_and_cache_data()
+    rollups = cached.get('usage_rollups')
+    if rollups is None:
+        rollups = UsageRollups()
+    domains, domain_index = None, cached.get('domain_index')
+    if query.domain is not None and domain_index:
+        # A catalog app's trend includes its subdomains' traffic
+        domains = domain_index.members(query.domain.strip(), rollups.domain_names()) or None
+    return trend_series(rollups, query, rollups.latest_day() or datetime.date.today(), domains)
+
+DASHBOARD_SECTIONS = ['stats', 'apps', 'behavior', 'risk_distribution', 'spend_by_category', 'usage_trend']
+
+def get_dashboard(sections=DASHBOARD_SECTIONS, trend_query=None, window=None):
+    """
+    The selected dashboard widgets (see DASHBOARD_SECTIONS) in one response, all from the same
+    processed snapshot, whose version is included. The apps are counted once per snapshot for
+    every widget (see tally_apps). With a TimeWindow every widget but the usage trend (which has
+    its own window) covers the apps seen inside it. Returns standard types.
+    """
+    snapshot = _served_snapshot(window)
+    dashboard = {'version': snapshot.version}
+    if {'stats', 'behavior', 'risk_distribution', 'spend_by_category'} & set(sections):
+        tally = snapshot.memoized('app_tally', lambda: tally_apps(snapshot.apps))
+        if 'stats' in sections:
+            dashboard['stats'] = tally['stats']
+        if 'behavior' in sections:
+            dashboard['behavior'] = snapshot.memoized('behavior_insights', lambda: behavior_insights_for(tally['shadow_apps'], _user_access_of(snapshot)))
+        if 'risk_distribution' in sections:
+            dashboard['risk_distribution'] = get_risk_distribution(tally['stats'])
+        if 'spend_by_category' in sections:
+            dashboard['spend_by_category'] = spend_chart_data(tally['spend_by_category'])
+    if 'apps' in sections:
+        dashboard['apps'] = snapshot.with_risk_factors()
+    if 'usage_trend' in sections:
+        dashboard['usage_trend'] = get_usage_trends(trend_query)
+    return dashboard
+
+def default_trend_days():
+    trend_days = current_app.config.get('TREND_SIMULATION_DAYS', 7)
+    return trend_days if trend_days > 0 else 7 # Basic sanity check
+
+
+# --- Users (the /api/users drill-down, see app.users) ---
+USER_APP_FIELDS = ['app_name', 'category', 'status', 'resolution_status', 'calculated_risk_level', 'calculated_risk_score']
+
+def get_user_detail(user_id):
+    """
+    A user's apps (most accessed first, with their app fields from the served snapshot), traffic totals
+    and expenses, read from the user indexes built with the data: the cost follows the user's apps and
+    expenses. None if the user is in neither the network log nor the expenses. Returns standard types.
+    """
+    cached = load_and_cache_data()
+    snapshot = get_processed_snapshot(wait=True) # Never older than the data version of the ETag
+    app_index, expense_index = get_user_app_index(cached), cached.get('user_expense_index')
+    totals = app_index.totals_of(user_id) if app_index is not None and user_id in app_index else None
+    if totals is None and (expense_index is None or user_id not in expense_index):
+        return None
+    if totals is None: # Expenses only
+        totals = {'access_count': 0, 'uploaded_mb': 0.0, 'downloaded_mb': 0.0, 'app_count': 0,
+                  'first_seen': None, 'last_seen': None}
+    apps = [_with_app_fields(snapshot, app) for app in (app_index.apps_of(user_id) if app_index is not None else [])]
+    expense_count, expense_total = expense_index.total_of(user_id) if expense_index is not None else (0, 0.0)
+    return {
+        'user_id': str(user_id),
+        **totals,
+        'shadow_app_count': sum(app['is_shadow'] for app in apps),
+        'expense_count': expense_count,
+        'expense_total': round(expense_total, 2),
+        'apps': apps,
+        'expenses': expense_index.expenses_of(user_id) if expense_index is not None else [],
+        'version': snapshot.version,
+    }
+
+def get_top_users(query):
+    """
+    One page of the users with network traffic, by a UserQuery's sort field (largest first):
+    {'items', 'total', 'offset', 'limit', 'next_offset', 'version'}, each item a user's totals with
+    their shadow app count and expense total. Returns standard types.
+    """
+    cached = load_and_cache_data()
+    snapshot = get_processed_snapshot(wait=True) # Never older than the data version of the ETag
+    app_index, expense_index = get_user_app_index(cached), cached.get('user_expense_index')
+    page, total = app_index.top_users(query.sort, query.offset, query.limit) if app_index is not None else ([], 0)
+    items = []
+    shadow_domains = snapshot.memoized('shadow_domains', lambda: {app['domain'] for app in snapshot.apps if _is_shadow(app)})
+    for user_id, totals in page:
+        shadow_apps = sum(domain in shadow_domains for domain in app_index.domains_of(user_id))
+        expense_count, expense_total = expense_index.total_of(user_id) if expense_index is not None else (0, 0.0)
+        items.append({'user_id': user_id, **totals, 'shadow_app_count': shadow_apps,
+                      'expense_count': expense_count, 'expense_total': round(expense_total, 2)})
+    next_offset = query.offset + len(items)
+    return {'items': items, 'total': total, 'offset': query.offset, 'limit': query.limit,
+            'next_offset': next_offset if next_offset < total else None, 'version': snapshot.version}
+
+def _with_app_fields(snapshot, user_app):
+    """A user's app row plus the USER_APP_FIELDS of its processed app, and whether it counts as shadow IT."""
+    positions = snapshot.memoized('positions_by_domain', lambda: {app['domain']: i for i, app in enumerate(snapshot.apps)})
+    position = positions.get(user_app['domain'])
+    app = snapshot.apps[position] if position is not None else {}
+    return {'domain': user_app['domain'], **{field: app.get(field) for field in USER_APP_FIELDS},
+            'is_shadow': _is_shadow(app), **{k: v for k, v in user_app.items() if k != 'domain'}}
+
+def _is_shadow(app):
+    # Shadow as picked by tally_apps for the insights
+    return (app.get('status') in current_app.config.get('SHADOW_STATUSES', [])
+            and app.get('resolution_status') not in ['Sanctioned', 'FalsePositive'])
+
+# --- Resolution Updates (workflow) ---
 def update_app_resolution_status(app_id, new_status):
-    """Simulates updating the resolution status in known_apps CSV."""
-    print(f"Simulating update for app '{app_id}' to status '{new_status}'")
-    cfg = current_app.config
-    file_path = cfg.get('KNOWN_APPS_FILE')
-    if not file_path or not os.path.exists(file_path):
-        print(f"      > Error: Known apps file path missing/invalid: {file_path}")
-        return False
+    """
+    Records a new resolution status for an app of the known-apps catalog in the resolution store
+    (see app.resolutions). The catalog CSV is left untouched; the change is applied to the cached
+    catalog right away and only the affected app is rescored for the next snapshot.
+    """
+    app_id = str(app_id) # Ensure ID is string for comparison
     try:
-        # Use na_filter=False only if you are absolutely sure blanks != NaN
-        df = pd.read_csv(file_path, keep_default_na=False, na_values=['']) # Treat blanks as NaN
-        if 'domain' not in df.columns:
-            print(f"      > Error: 'domain' column missing in {file_path}")
+        known_apps_df = load_and_cache_data().get('known_apps', pd.DataFrame())
+        if 'domain' not in known_apps_df.columns or app_id not in known_apps_df.index:
+            print(f"      > Error: App ID {app_id} not found in the known apps catalog for update.")
             return False
-        if 'resolution_status' not in df.columns:
-            df['resolution_status'] = pd.Series(dtype='object')
-
-        # Ensure domain column is suitable type for comparison (usually string)
-        df['domain'] = df['domain'].astype(str)
-        app_id = str(app_id) # Ensure ID is string for comparison
-
-        if app_id in df['domain'].values:
-            status_to_save = new_status if new_status is not None else np.nan # Use NaN for DB/Pandas representation of NULL
-            df.loc[df['domain'] == app_id, 'resolution_status'] = status_to_save
-            # Write back NaN as empty string
-            df.to_csv(file_path, index=False, na_rep='')
-            print(f"      > CSV Updated for {app_id}")
-            global _cached_data # Invalidate cache
-            _cached_data = None
-            return True
-        else:
-            print(f"      > Error: App ID {app_id} not found in {file_path} for update.")
+        store = get_resolution_store()
+        if store is None:
+            print("      > Error: No resolution store configured (RESOLUTION_STORE_FILE).")
             return False
+        store.record(app_id, new_status)
+        _publish_resolutions()
+        return True
     except Exception as e:
-        print(f"      > Error reading/writing CSV file ({file_path}): {e}\n{traceback.format_exc()}")
+        print(f"      > Error recording resolution for {app_id}: {e}\n{traceback.format_exc()}")
         return False
 
-# Need re module for regex compile in risk calculation expense linking
-import re
\ No newline at end of file
+def update_app_resolutions(changes):
+    """
+    Records many resolution changes [(app_id, status), ...] at once: a single transaction in the
+    resolution store, then one new data version in which only the affected apps are rescored.
+    Every app must be in the known-apps catalog, otherwise nothing is recorded (ResolutionError).
+    Returns {'updated', 'revision'}, or None if the store is unavailable.
+    """
+    known_apps_df = load_and_cache_data().get('known_apps', pd.DataFrame())
+    catalog = known_apps_df.index if 'domain' in known_apps_df.columns else pd.Index([])
+    missing = sorted({app_id for app_id, _ in changes if app_id not in catalog})
+    if missing:
+        shown = ', '.join(missing[:10]) + (f" (+{len(missing) - 10} more)" if len(missing) > 10 else '')
+        raise ResolutionError(f"Apps not found in the known apps catalog: {shown}")
+    if not changes:
+        return {'updated': 0, 'revision': _cached_data.get('resolution_revision', 0)}
+
+    store = get_resolution_store()
+    if store is None:
+        print("      > Error: No resolution store configured (RESOLUTION_STORE_FILE).")
+        return None
+    revision = store.record_many(changes)
+    _publish_resolutions()
+    print(f"Recorded {len(changes)} resolution changes (revision {revision})")
+    return {'updated': len(changes), 'revision': revision}
+
+def _publish_resolutions():
+    # Applies the recorded changes and rescores their apps right away, pushing them to live dashboards
+    _sync_resolutions(_cached_data)
+    get_processed_snapshot()
+
+def resolve_matching_apps(filter_args, new_status):
+    """
+    Sets the resolution of every catalog app matching an /api/apps filter (see app.queries), e.g.
+    {'category': 'CDN', 'status': 'unknown'}. Matching apps outside the catalog are skipped and counted.
+    """
+    unknown = [param for param in filter_args if param not in FILTER_FIELDS and param not in ('min_upload_mb', 'max_upload_mb')]
+    if unknown:
+        raise QueryError(f"Unsupported filter parameters: {', '.join(unknown)}")
+    query = AppQuery.from_args({param: _filter_arg(param, value) for param, value in filter_args.items()})
+    if not query.filters and query.min_upload_mb is None and query.max_upload_mb is None:
+        raise QueryError("filter needs at least one criterion")
+
+    snapshot = get_processed_snapshot()
+    index = snapshot.memoized('app_index', lambda: AppIndex(snapshot.apps))
+    positions, _ = index.select(dataclasses.replace(query, offset=0, limit=len(index)))
+    known_apps_df = load_and_cache_data().get('known_apps', pd.DataFrame())
+    catalog = known_apps_df.index if 'domain' in known_apps_df.columns else pd.Index([])
+    domains = [snapshot.apps[position]['domain'] for position in positions.tolist()]
+    changes = [(domain, new_status) for domain in domains if domain in catalog]
+    result = update_app_resolutions(changes)
+    if result is not None:
+        result['skipped'] = len(domains) - len(changes) # Matched, but not in the catalog
+    return result
+
+def _filter_arg(param, value):
+    # A JSON filter value as its query parameter: a string, a number or a list of those (comma-joined)
+    values = value if isinstance(value, list) else [value]
+    if not all(isinstance(v, (str, int, float)) and not isinstance(v, bool) for v in values):
+        raise QueryError(f"filter '{param}' must be a string, a number or a list of those")
+    return ','.join(map(str, values))
@@ -0,0 +1,229 @@
+# app/queries.py
+# Server-side filtering, sorting and pagination of the processed apps (the /api/apps query parameters).
+# An AppIndex is built once per snapshot: sort orders are computed per field on first use and the
+# matching apps of each filter/sort combination are remembered, so later pages just slice an array.
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Query parameter -> app field, for the comma-separated equality filters (matched case-insensitively)
+FILTER_FIELDS = {
+    'status': 'status',
+    'risk_level': 'calculated_risk_level',
+    'category': 'category',
+    'resolution': 'resolution_status', # 'none' matches apps without a resolution
+}
+
+SORT_FIELDS = ['domain', 'app_name', 'category', 'status', 'resolution_status', 'calculated_risk_score',
+               'calculated_risk_level', 'network_access_count', 'unique_users_network', 'total_data_uploaded_mb',
+               'total_data_downloaded_mb', 'linked_expense_count', 'linked_expense_total',
+               'first_seen_network', 'last_seen_network']
+
+RISK_LEVEL_ORDER = ['Info', 'Low', 'Medium', 'High'] # Anything else ('Error') sorts with the missing values
+
+QUERY_PARAMS = set(FILTER_FIELDS) | {'min_upload_mb', 'max_upload_mb', 'sort', 'order', 'offset', 'limit', 'page', 'fields'}
+
+_MATCH_CACHE_SIZE = 64 # Filter/sort combinations remembered per snapshot
+
+
+class QueryError(ValueError):
+    """Invalid query parameters (reported to the client as a 400)."""
+
+
+@dataclass(frozen=True)
+class AppQuery:
+    filters: tuple = () # ((field, (lower-cased values, ...)), ...)
+    min_upload_mb: float = None
+    max_upload_mb: float = None
+    sort: str = None # None keeps the snapshot's domain order
+    descending: bool = False
+    offset: int = 0
+    limit: int = 100
+    fields: tuple = None # None returns every field
+
+    @classmethod
+    def from_args(cls, args, default_limit=100, max_limit=1000):
+        """Parses request query parameters, raising QueryError on invalid ones."""
+        filters = []
+        for param, field in FILTER_FIELDS.items():
+            values = _split_list(args.get(param))
+            if values:
+                filters.append((field, tuple(sorted(value.lower() for value in values))))
+
+        sort = args.get('sort') or None
+        order = args.get('order', 'asc').lower()
+        if order not in ('asc', 'desc'):
+            raise QueryError("order must be 'asc' or 'desc'")
+        descending = order == 'desc'
+        if sort and sort.startswith('-'):
+            sort, descending = sort[1:], True
+        if sort is not None and sort not in SORT_FIELDS:
+            raise QueryError(f"Cannot sort by '{sort}'. Sortable fields: {', '.join(SORT_FIELDS)}")
+
+        limit = int_param(args, 'limit', default_limit, minimum=1)
+        if limit > max_limit:
+            raise QueryError(f"limit can be at most {max_limit}")
+        offset = int_param(args, 'offset', 0, minimum=0)
+        if 'page' in args:
+            offset = (int_param(args, 'page', 1, minimum=1) - 1) * limit
+
+        fields = _split_list(args.get('fields'))
+        return cls(filters=tuple(filters), min_upload_mb=_float_param(args, 'min_upload_mb'),
+                   max_upload_mb=_float_param(args, 'max_upload_mb'), sort=sort, descending=descending,
+                   offset=offset, limit=limit, fields=tuple(fields) if fields else None)
+
+
+def has_query_params(args):
+    return any(param in args for param in QUERY_PARAMS)
+
+
+def _split_list(value):
+    return [part.strip() for part in value.split(',') if part.strip()] if value else []
+
+
+def sections_param(args, available):
+    """
+    The sections of `available` selected by the 'sections' (only these) and 'exclude' (all but these)
+    comma-separated parameters, in `available` order. All of them by default.
+    """
+    included, excluded = _split_list(args.get('sections')), _split_list(args.get('exclude'))
+    unknown = [name for name in included + excluded if name not in available]
+    if unknown:
+        raise QueryError(f"Unknown section(s) {', '.join(unknown)}. Available: {', '.join(available)}")
+    return [name for name in available if (not included or name in included) and name not in excluded]
+
+
+def int_param(args, name, default, minimum):
+    try:
+        value = int(args.get(name, default))
+    except (TypeError, ValueError):
+        raise QueryError(f"{name} must be an integer")
+    if value < minimum:
+        raise QueryError(f"{name} must be at least {minimum}")
+    return value
+
+
+def _float_param(args, name):
+    if args.get(name) in (None, ''):
+        return None
+    try:
+        return float(args[name])
+    except ValueError:
+        raise QueryError(f"{name} must be a number")
+
+
+class AppIndex:
+    """Sort orders and filter results over one snapshot's apps, built lazily and kept for its lifetime."""
+
+    def __init__(self, apps):
+        self._apps = apps
+        self._columns = {}
+        self._orders = {}
+        self._matches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._apps)
+
+    def select(self, query):
+        """Returns (positions of the apps on the requested page, total number of matching apps)."""
+        matches = self._matching(query)
+        return matches[query.offset:query.offset + query.limit], len(matches)
+
+    def _matching(self, query):
+        """Positions of every app matching the query's filters, in the query's sort order."""
+        key = (query.filters, query.min_upload_mb, query.max_upload_mb, query.sort, query.descending)
+        with self._lock:
+            if key in self._matches:
+                self._matches.move_to_end(key)
+                return self._matches[key]
+
+        order = self._order(query.sort, query.descending)
+        mask = None
+        for field, values in query.filters:
+            field_mask = np.isin(self._lowered(field), values)
+            mask = field_mask if mask is None else mask & field_mask
+        if query.min_upload_mb is not None or query.max_upload_mb is not None:
+            uploads = self._numbers('total_data_uploaded_mb')
+            upload_mask = np.ones(len(uploads), dtype=bool)
+            if query.min_upload_mb is not None:
+                upload_mask &= uploads >= query.min_upload_mb
+            if query.max_upload_mb is not None:
+                upload_mask &= uploads <= query.max_upload_mb
+            mask = upload_mask if mask is None else mask & upload_mask
+        matches = order if mask is None else order[mask[order]]
+
+        with self._lock:
+            self._matches[key] = matches
+            if len(self._matches) > _MATCH_CACHE_SIZE:
+                self._matches.popitem(last=False)
+        return matches
+
+    def _order(self, field, descending):
+        """App positions sorted by a field (missing values last, ties in snapshot order)."""
+        key = (field, descending)
+        order = self._orders.get(key)
+        if order is not None:
+            return order
+        positions = np.arange(len(self._apps))
+        if field is None:
+            order = positions
+        else:
+            ranks = self._ranks(field)
+            missing = ranks < 0
+            primary = np.where(missing, 1, -ranks) if descending else np.where(missing, ranks.max(initial=0) + 1, ranks)
+            order = np.lexsort((positions, primary))
+        self._orders[key] = order
+        return order
+
+    def _ranks(self, field):
+        """Dense rank of every app's value of a field, -1 where it is missing."""
+        values = self._column(field)
+        if field == 'calculated_risk_level':
+            level_rank = {level: rank for rank, level in enumerate(RISK_LEVEL_ORDER)}
+            return np.array([level_rank.get(value, -1) for value in values], dtype=np.int64)
+        try:
+            ranks, _ = pd.factorize(values, sort=True)
+        except TypeError: # Mixed types that can't be compared, order by their text instead
+            ranks, _ = pd.factorize(np.array([str(v) if not _is_missing(v) else None for v in values], dtype=object), sort=True)
+        return ranks
+
+    def _column(self, field):
+        values = self._columns.get(field)
+        if values is None:
+            values = np.empty(len(self._apps), dtype=object)
+            for i, app in enumerate(self._apps):
+                value = app.get(field)
+                values[i] = len(value) if field == 'unique_users_network' and value is not None else value
+            self._columns[field] = values
+        return values
+
+    def _lowered(self, field):
+        key = ('lowered', field)
+        values = self._columns.get(key)
+        if values is None:
+            values = np.array(['none' if _is_missing(v) else str(v).lower() for v in self._column(field)], dtype=object)
+            self._columns[key] = values
+        return values
+
+    def _numbers(self, field):
+        key = ('numbers', field)
+        values = self._columns.get(key)
+        if values is None:
+            values = pd.to_numeric(pd.Series(self._column(field)), errors='coerce').fillna(0.0).to_numpy(dtype=float)
+            self._columns[key] = values
+        return values
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def project(app, fields):
+    """The app reduced to the requested fields (all of them when fields is None)."""
+    if fields is None:
+        return app
+    return {field: app.get(field) for field in fields}
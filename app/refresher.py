@@ -0,0 +1,33 @@
+# app/refresher.py
+# Background data refresh. A daemon thread re-reads the changed data sources and rebuilds the processed
+# snapshot at a fixed interval, so no request has to reload data when the cache expires: requests keep
+# serving the last good snapshot while the next one is built.
+import threading
+import time
+import traceback
+
+
+class BackgroundRefresher(threading.Thread):
+    """Calls `refresh` (inside an app context) every interval_s seconds until stopped."""
+
+    def __init__(self, app, refresh, interval_s):
+        super().__init__(name='background-refresher', daemon=True)
+        self.app = app
+        self.refresh = refresh
+        self.interval_s = interval_s
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            started = time.monotonic()
+            try:
+                with self.app.app_context():
+                    self.refresh()
+            except Exception as e:
+                # Keep going, requests serve the last good snapshot until a refresh succeeds
+                print(f"Background refresh failed: {e}\n{traceback.format_exc()}")
+            self._stopped.wait(max(0.0, self.interval_s - (time.monotonic() - started)))
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self.join(timeout)
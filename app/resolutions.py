@@ -0,0 +1,116 @@
+# app/resolutions.py
+# Resolution status overrides, layered over the known-apps catalog. Every update is one row appended
+# to an SQLite journal (WAL mode, synchronous=FULL), so writes are O(1), durable once acknowledged and
+# serialized by SQLite across threads and worker processes. The latest row per domain wins.
+import datetime
+import os
+import sqlite3
+import threading
+
+RESOLUTION_STATUSES = ['Sanctioned', 'Blocked', 'Investigating', 'FalsePositive'] # None clears the resolution
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resolution_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    domain TEXT NOT NULL,
+    resolution_status TEXT, -- NULL clears the resolution
+    recorded_at TEXT NOT NULL
+)
+"""
+
+
+class ResolutionStore:
+    """
+    Append-only journal of resolution status changes. Each change gets an increasing revision
+    (the row id); a process holding overrides up to some revision catches up with changes_since().
+    """
+
+    def __init__(self, path, busy_timeout_s=5.0):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=busy_timeout_s, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock() # One connection per store, shared by the request threads
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=FULL') # fsync on every commit
+            self._conn.execute(_SCHEMA)
+
+    def record(self, domain, status):
+        """Appends a change (status None clears the resolution) and returns its revision."""
+        return self.record_many([(domain, status)])
+
+    def record_many(self, changes):
+        """
+        Appends (domain, status) changes in one transaction, all of them or none.
+        Returns the revision of the last one.
+        """
+        recorded_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                self._conn.executemany(
+                    'INSERT INTO resolution_log (domain, resolution_status, recorded_at) VALUES (?, ?, ?)',
+                    [(domain, status, recorded_at) for domain, status in changes])
+                revision = self._conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+            return revision
+
+    def revision(self):
+        """Revision of the latest recorded change, 0 when there is none."""
+        with self._lock:
+            return self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM resolution_log').fetchone()[0]
+
+    def changes_since(self, revision):
+        """(overrides, latest revision): the latest status of every domain changed after `revision`."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, domain, resolution_status FROM resolution_log WHERE id > ? ORDER BY id',
+                (revision,)).fetchall()
+        overrides = {domain: status for _, domain, status in rows}
+        return overrides, (rows[-1][0] if rows else revision)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ResolutionError(ValueError):
+    """Invalid resolution update (reported to the client as a 400)."""
+
+
+def is_valid_status(status):
+    return status is None or (isinstance(status, str) and status in RESOLUTION_STATUSES)
+
+
+def parse_changes(items):
+    """[(app_id, status), ...] from a bulk payload's list of {"app_id", "resolution_status"} objects."""
+    if not isinstance(items, list) or not items:
+        raise ResolutionError("changes must be a non-empty list of {app_id, resolution_status} objects")
+    changes = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get('app_id') or 'resolution_status' not in item:
+            raise ResolutionError("Every change needs an app_id and a resolution_status (null clears it)")
+        if not is_valid_status(item['resolution_status']):
+            raise ResolutionError(f"Invalid resolution_status {item['resolution_status']!r} for app '{item['app_id']}'. "
+                                  f"Must be one of {RESOLUTION_STATUSES} or explicitly null.")
+        changes.append((str(item['app_id']), item['resolution_status']))
+    return changes
+
+
+def apply_overrides(known_apps_df, overrides):
+    """
+    Sets the resolution_status of the catalog rows of the overridden domains, in place.
+    Domains missing from the catalog are ignored. Returns the domains that were set.
+    """
+    if not overrides or 'domain' not in known_apps_df.columns or known_apps_df.empty:
+        return set()
+    applied = set()
+    for domain, status in overrides.items():
+        if domain in known_apps_df.index:
+            known_apps_df.at[domain, 'resolution_status'] = status
+            applied.add(domain)
+    return applied
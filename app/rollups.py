@@ -0,0 +1,245 @@
+# app/rollups.py
+# Pre-bucketed usage rollups behind the usage trend chart: access counts and upload MB of the network
+# log per hour and per day, overall and per (stripped) domain. Rows are added while the log is
+# ingested; a trend query then only reads the buckets of its window, never the raw rows.
+import datetime
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .queries import QueryError, int_param
+
+GRANULARITIES = {'hour': 1, 'day': 24} # Bucket width in hours
+_ALL_DOMAINS = -1 # Domain code of the overall buckets
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+class UsageRollups:
+    """
+    (access_count, uploaded_mb) buckets keyed by (domain code, bucket number), bucket numbers counting
+    hours or days since the epoch. The overall series is stored under domain code -1. Only rows with a
+    timestamp and a valid domain (a non-blank string, as in discovery) are counted.
+    """
+
+    def __init__(self):
+        self._domain_codes = {} # Stripped domain -> code
+        self._hourly = None # Merged hourly buckets, indexed by (domain, bucket)
+        self._pending = [] # Hourly parts not merged yet
+        self._pending_rows = 0
+        self._levels = {} # Granularity -> sorted (domains, buckets, access counts, uploaded MB) arrays
+        self._lock = threading.RLock() # Incremental refreshes add rows while requests may be reading
+
+    def __getstate__(self):
+        with self._lock:
+            self._compact()
+            state = self.__dict__.copy()
+        del state['_lock']
+        state['_levels'] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def copy(self):
+        """A copy to add rows to while this one keeps being read. Merged buckets are shared, they are replaced, not changed."""
+        with self._lock:
+            rollups = UsageRollups.__new__(UsageRollups)
+            rollups.__dict__.update(self.__dict__)
+            rollups._domain_codes = dict(self._domain_codes)
+            rollups._pending = list(self._pending)
+            rollups._levels = dict(self._levels)
+            rollups._lock = threading.RLock()
+        return rollups
+
+    @classmethod
+    def from_frame(cls, network_df):
+        """Built from a loaded network log DataFrame (frame ingest mode)."""
+        rollups = cls()
+        if not network_df.empty and {'timestamp', 'destination_domain'} <= set(network_df.columns):
+            rollups.add(network_df['destination_domain'], network_df['timestamp'], network_df.get('data_uploaded_mb'))
+        return rollups
+
+    def add(self, domains, timestamps, uploaded_mb=None):
+        """Adds a batch of log rows (parsed, tz-naive timestamps)."""
+        with self._lock:
+            domain_codes, domain_values = pd.factorize(domains)
+            lookup = np.array([self._code_for(value) for value in domain_values] + [-2], dtype=np.int64)
+            codes = lookup[domain_codes] # -2: invalid or missing domain
+            stamps = np.asarray(timestamps, dtype='datetime64[ns]')
+            keep = (codes >= 0) & ~np.isnat(stamps)
+            if not keep.any():
+                return
+            if uploaded_mb is None:
+                uploads = np.zeros(len(codes))
+            else:
+                uploads = pd.to_numeric(pd.Series(np.asarray(uploaded_mb)), errors='coerce').fillna(0.0).to_numpy(dtype=float)
+
+            rows = pd.DataFrame({'domain': codes[keep],
+                                 'bucket': stamps[keep].astype('datetime64[h]').astype(np.int64),
+                                 'uploaded_mb': uploads[keep]})
+            per_domain = _bucket_totals(rows, ['domain', 'bucket'])
+            overall = _bucket_totals(rows, 'bucket')
+            overall.index = pd.MultiIndex.from_arrays(
+                [np.full(len(overall), _ALL_DOMAINS, dtype=np.int64), overall.index.to_numpy()], names=['domain', 'bucket'])
+            self._pending.append(pd.concat([overall, per_domain]))
+            self._pending_rows += len(self._pending[-1])
+            self._levels = {}
+            # Merge once the pending parts outgrow the merged buckets, keeping adds amortized O(rows)
+            if self._hourly is None or self._pending_rows > len(self._hourly):
+                self._compact()
+
+    def merge(self, other):
+        """Adds the buckets of another UsageRollups, e.g. built by a worker process."""
+        with other._lock:
+            other._compact()
+            hourly, names = other._hourly, list(other._domain_codes) # Names in code order
+        if hourly is None:
+            return
+        with self._lock:
+            lookup = np.array([self._code_for(name) for name in names] + [_ALL_DOMAINS], dtype=np.int64)
+            part = hourly.copy()
+            part.index = pd.MultiIndex.from_arrays(
+                [lookup[part.index.get_level_values('domain').to_numpy()], part.index.get_level_values('bucket').to_numpy()],
+                names=['domain', 'bucket'])
+            self._pending.append(part)
+            self._pending_rows += len(part)
+            self._levels = {}
+            if self._hourly is None or self._pending_rows > len(self._hourly):
+                self._compact()
+
+    def _code_for(self, value):
+        if not isinstance(value, str) or value.strip() == '':
+            return -2
+        return self._domain_codes.setdefault(value.strip(), len(self._domain_codes))
+
+    def _compact(self):
+        if not self._pending:
+            return
+        parts = self._pending if self._hourly is None else [self._hourly] + self._pending
+        self._hourly = pd.concat(parts).groupby(level=['domain', 'bucket']).sum()
+        self._pending = []
+        self._pending_rows = 0
+
+    def _level(self, granularity):
+        """Sorted bucket arrays of a granularity, derived from the hourly buckets on first use."""
+        level = self._levels.get(granularity)
+        if level is None:
+            self._compact()
+            buckets = self._hourly if self._hourly is not None else _bucket_totals(
+                pd.DataFrame({'domain': [], 'bucket': [], 'uploaded_mb': []}, dtype=np.int64), ['domain', 'bucket'])
+            width = GRANULARITIES[granularity]
+            if width != 1:
+                index = buckets.index
+                buckets = buckets.groupby([index.get_level_values('domain'),
+                                           index.get_level_values('bucket') // width]).sum()
+            level = (buckets.index.get_level_values(0).to_numpy(dtype=np.int64),
+                     buckets.index.get_level_values(1).to_numpy(dtype=np.int64),
+                     buckets['access_count'].to_numpy(dtype=np.int64),
+                     buckets['uploaded_mb'].to_numpy(dtype=float))
+            self._levels[granularity] = level
+        return level
+
+    def latest_day(self):
+        """Date of the latest counted access, None if there is none."""
+        with self._lock:
+            domains, buckets, _, _ = self._level('day')
+        overall = np.flatnonzero(domains == _ALL_DOMAINS)
+        if not len(overall):
+            return None
+        return _EPOCH + datetime.timedelta(days=int(buckets[overall[-1]]))
+
+    def domain_names(self):
+        """Every (stripped) domain with counted accesses."""
+        with self._lock:
+            return list(self._domain_codes)
+
+    def series(self, granularity, start, stop, domain=None):
+        """
+        Dense (access counts, uploaded MB) arrays for buckets start..stop-1 of a granularity, overall,
+        for one domain (matched by its stripped name) or summed over a list of domains.
+        Buckets without traffic are 0.
+        """
+        counts = np.zeros(stop - start, dtype=np.int64)
+        uploads = np.zeros(stop - start, dtype=float)
+        with self._lock:
+            if domain is None:
+                codes = [_ALL_DOMAINS]
+            else:
+                names = domain if isinstance(domain, (list, tuple, set, frozenset)) else [domain]
+                codes = [code for code in (self._domain_codes.get(str(name).strip()) for name in names) if code is not None]
+            if not codes:
+                return counts, uploads
+            domains, buckets, access_counts, uploaded_mb = self._level(granularity)
+        for code in codes:
+            lo, hi = np.searchsorted(domains, [code, code + 1])
+            first, last = lo + np.searchsorted(buckets[lo:hi], [start, stop])
+            positions = buckets[first:last] - start
+            counts[positions] += access_counts[first:last]
+            uploads[positions] += uploaded_mb[first:last]
+        return counts, uploads
+
+
+def _bucket_totals(rows, keys):
+    return rows.groupby(keys).agg(access_count=('uploaded_mb', 'size'), uploaded_mb=('uploaded_mb', 'sum'))
+
+
+@dataclass(frozen=True)
+class TrendQuery:
+    """A usage trend window: whole days from start to end (inclusive), bucketed per day or per hour."""
+    granularity: str = 'day'
+    days: int = 7
+    start: datetime.date = None
+    end: datetime.date = None # None (and no start): ends on the day of the latest logged access
+    domain: str = None # None: all domains
+
+    @classmethod
+    def from_args(cls, args, default_days=7, max_days=366):
+        """Parses request query parameters (granularity, days, start, end, domain), raising QueryError on invalid ones."""
+        granularity = args.get('granularity', 'day').lower()
+        if granularity not in GRANULARITIES:
+            raise QueryError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+        start, end = _date_param(args, 'start'), _date_param(args, 'end')
+        if start is not None and end is not None:
+            if end < start:
+                raise QueryError("end must not be before start")
+            days = (end - start).days + 1
+        else:
+            days = int_param(args, 'days', default_days, minimum=1)
+        if days > max_days:
+            raise QueryError(f"The window can be at most {max_days} days")
+        return cls(granularity=granularity, days=days, start=start, end=end, domain=args.get('domain') or None)
+
+    def window(self, latest_day):
+        """(first day, last day) of the window, given the day the data ends on."""
+        if self.start is not None:
+            return self.start, self.start + datetime.timedelta(days=self.days - 1)
+        end = self.end or latest_day
+        return end - datetime.timedelta(days=self.days - 1), end
+
+
+def _date_param(args, name):
+    if not args.get(name):
+        return None
+    try:
+        return datetime.date.fromisoformat(args[name])
+    except ValueError:
+        raise QueryError(f"{name} must be a date (YYYY-MM-DD)")
+
+
+def trend_series(rollups, query, latest_day, domains=None):
+    """
+    The chart data of a trend query: {labels, values (access counts), uploaded_mb, granularity}.
+    domains: the domains to sum instead of query.domain alone, e.g. every subdomain rolled up into an app.
+    """
+    first_day, last_day = query.window(latest_day)
+    width = GRANULARITIES[query.granularity]
+    start = (first_day - _EPOCH).days * 24 // width
+    stop = ((last_day - _EPOCH).days + 1) * 24 // width
+    counts, uploads = rollups.series(query.granularity, start, stop, domains if domains is not None else query.domain)
+    unit = 'h' if query.granularity == 'hour' else 'D'
+    labels = np.datetime_as_string(np.arange(start, stop).astype(f'datetime64[{unit}]'), unit='m' if unit == 'h' else 'D')
+    return {'labels': labels.tolist(), 'values': counts.tolist(),
+            'uploaded_mb': [round(float(mb), 2) for mb in uploads], 'granularity': query.granularity}
@@ -1,18 +1,42 @@
 # app/routes.py
-from flask import Blueprint, render_template, jsonify, request, current_app
+from flask import Blueprint, render_template, jsonify, request, current_app, stream_with_context
 # Import specific functions needed
 from .processing import (
     get_processed_app_data,
+    query_processed_apps,
     get_summary_stats,
     get_behavior_insights,
     get_spend_by_category,
+    get_risk_distribution,
+    get_dashboard,
+    DASHBOARD_SECTIONS,
     get_usage_trends,
-    update_app_resolution_status # For workflow simulation
+    default_trend_days,
+    update_app_resolution_status, # For workflow simulation
+    update_app_resolutions,
+    resolve_matching_apps,
+    get_data_status,
+    get_user_detail,
+    get_top_users,
+    processed_snapshot_version,
+    loaded_data_version,
+    live_update_version,
+    wait_for_live_updates
 )
+from .queries import AppQuery, QueryError, has_query_params, sections_param
+from .rollups import TrendQuery
+from .windows import TimeWindow, WINDOW_PARAMS
+from .users import UserQuery
+from .resolutions import RESOLUTION_STATUSES, ResolutionError, is_valid_status, parse_changes
+from .http_cache import conditional_get, compress_response
+from . import metrics
 import traceback
 import os # Need os for the init.py modification below
 
 bp = Blueprint('main', __name__)
+bp.before_request(metrics.start_request_timer)
+bp.after_request(metrics.add_server_timing) # Registered first so it runs last, after gzip
+bp.after_request(compress_response) # gzip large JSON responses
 
 # === Page Route ===
 
@@ -34,101 +58,234 @@ def dashboard():
 
 
 # === API Endpoints ===
-# ... (rest of the API endpoints remain unchanged) ...
+# GET endpoints answer If-None-Match with 304 while the data version behind their ETag is unchanged (see app.http_cache)
+# The app, summary, chart and insight endpoints take since/until to only cover the apps used in a time window:
+# ISO 8601 dates or date-times, or durations back from the latest logged access (see app.windows),
+# e.g. /api/apps?since=24h or /api/summary_stats?since=2023-10-01&until=2023-10-07
+
+def _snapshot_or_window_version():
+    """ETag version of views taking since/until: a window is read from the loaded data, without the processed snapshot."""
+    if any(request.args.get(param) for param in WINDOW_PARAMS):
+        return loaded_data_version()
+    return processed_snapshot_version()
 
 @bp.route('/api/summary_stats')
+@conditional_get(_snapshot_or_window_version)
 def api_summary_stats():
     """API endpoint to get summary KPI statistics."""
     try:
-        apps = get_processed_app_data()
+        apps = get_processed_app_data(include_risk_factors=False, window=TimeWindow.from_args(request.args))
         stats = get_summary_stats(apps)
         return jsonify(stats)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error in /api/summary_stats: {e}\n{traceback.format_exc()}")
         return jsonify({"error": "Could not calculate summary stats"}), 500
 
 @bp.route('/api/apps')
+@conditional_get(_snapshot_or_window_version)
 def api_get_apps():
-    """API endpoint to get the full list of processed applications."""
+    """
+    API endpoint to get the processed applications. Without query parameters returns the full list.
+    With any of status, risk_level, category, resolution (comma-separated), min_upload_mb, max_upload_mb,
+    sort (prefix '-' or order=desc for descending), offset/limit or page, fields (comma-separated)
+    returns one page: {"items": [...], "total", "offset", "limit", "next_offset", "version"}.
+    e.g. /api/apps?status=unknown,unsanctioned&sort=-calculated_risk_score&page=1&fields=domain,app_name
+    """
     try:
-        apps = get_processed_app_data()
-         # Maybe add filtering/pagination params here later: ?status=unknown&page=1
-        return jsonify(apps)
+        window = TimeWindow.from_args(request.args)
+        if not has_query_params(request.args):
+            return jsonify(get_processed_app_data(window=window))
+        query = AppQuery.from_args(request.args,
+                                   default_limit=current_app.config.get('APPS_PAGE_SIZE', 100),
+                                   max_limit=current_app.config.get('APPS_MAX_PAGE_SIZE', 1000))
+        return jsonify(query_processed_apps(query, window))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error in /api/apps: {e}\n{traceback.format_exc()}")
         return jsonify({"error": "Could not retrieve application data"}), 500
 
 
 @bp.route('/api/behavior_insights')
+@conditional_get(_snapshot_or_window_version)
 def api_behavior_insights():
      """API endpoint for user behavior data."""
      try:
-        apps = get_processed_app_data()
-        insights = get_behavior_insights(apps)
+        window = TimeWindow.from_args(request.args)
+        apps = get_processed_app_data(include_risk_factors=False, window=window)
+        insights = get_behavior_insights(apps, window)
         return jsonify(insights)
+     except QueryError as e:
+         return jsonify({"error": str(e)}), 400
      except Exception as e:
          print(f"Error in /api/behavior_insights: {e}\n{traceback.format_exc()}")
          return jsonify({"error": "Could not calculate behavior insights"}), 500
 
 
 @bp.route('/api/chart_data/risk_distribution')
+@conditional_get(_snapshot_or_window_version)
 def api_chart_risk_distribution():
     """API endpoint for risk distribution chart data."""
     try:
-        apps = get_processed_app_data()
+        apps = get_processed_app_data(include_risk_factors=False, window=TimeWindow.from_args(request.args))
         stats = get_summary_stats(apps) # Contains counts needed
-        cfg = current_app.config
-        # Ensure we account for irrelevant/FP if needed or handle appropriately
-        # Simplified: directly use risk counts
-        data = {
-             'labels': ['High', 'Medium', 'Low', 'Info/FP'], # Combined Info/FP for simplicity
-             'values': [
-                 stats.get('high_risk', 0),
-                 stats.get('medium_risk', 0),
-                 stats.get('low_risk', 0),
-                 stats.get('irrelevant_or_fp', 0) # Get the irrelevant/FP count
-                 # Ensure the sum matches total_detected or handle discrepancies
-             ]
-        }
-        return jsonify(data)
+        return jsonify(get_risk_distribution(stats))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
          print(f"Error in /api/chart_data/risk_distribution: {e}\n{traceback.format_exc()}")
          return jsonify({"error": "Could not generate risk distribution data"}), 500
 
 @bp.route('/api/chart_data/spend_by_category')
+@conditional_get(_snapshot_or_window_version)
 def api_chart_spend_category():
     """API endpoint for spend by category chart data."""
     try:
-         apps = get_processed_app_data()
+         apps = get_processed_app_data(include_risk_factors=False, window=TimeWindow.from_args(request.args))
          spend_data = get_spend_by_category(apps)
          return jsonify(spend_data)
+    except QueryError as e:
+         return jsonify({"error": str(e)}), 400
     except Exception as e:
          print(f"Error in /api/chart_data/spend_by_category: {e}\n{traceback.format_exc()}")
          return jsonify({"error": "Could not generate spend by category data"}), 500
 
 @bp.route('/api/chart_data/usage_trend')
+@conditional_get(loaded_data_version) # Read from the usage rollups, not the processed snapshot
 def api_chart_usage_trend():
-    """API endpoint for (simulated) usage trend data."""
+    """
+    API endpoint for usage trend data: access counts per day (or hour) from the network log.
+    Optional parameters: granularity (day|hour), days, start/end (YYYY-MM-DD), domain.
+    e.g. /api/chart_data/usage_trend?granularity=hour&days=2&domain=dropbox.com
+    """
     try:
-         apps = get_processed_app_data()
-         trend_data = get_usage_trends(apps) # Calls the simulation
-         return jsonify(trend_data)
+         query = TrendQuery.from_args(request.args, default_days=default_trend_days(),
+                                      max_days=current_app.config.get('TREND_MAX_DAYS', 366))
+         return jsonify(get_usage_trends(query))
+    except QueryError as e:
+         return jsonify({"error": str(e)}), 400
     except Exception as e:
          print(f"Error in /api/chart_data/usage_trend: {e}\n{traceback.format_exc()}")
          return jsonify({"error": "Could not generate usage trend data"}), 500
 
+@bp.route('/api/users')
+@conditional_get(loaded_data_version) # The user indexes are built from the loaded data, not the snapshot
+def api_users():
+    """
+    API endpoint for the top users by network activity, one page at a time:
+    {"items": [{"user_id", "access_count", "uploaded_mb", "downloaded_mb", "app_count", "first_seen", "last_seen",
+    "shadow_app_count", "expense_count", "expense_total"}, ...], "total", "offset", "limit", "next_offset", "version"}.
+    Optional parameters: sort (access_count, uploaded_mb, downloaded_mb or app_count; largest first), offset, limit.
+    """
+    try:
+        query = UserQuery.from_args(request.args, default_limit=current_app.config.get('USERS_PAGE_SIZE', 20),
+                                    max_limit=current_app.config.get('USERS_MAX_PAGE_SIZE', 1000))
+        return jsonify(get_top_users(query))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in /api/users: {e}\n{traceback.format_exc()}")
+        return jsonify({"error": "Could not list users"}), 500
+
+@bp.route('/api/users/<user_id>')
+@conditional_get(loaded_data_version)
+def api_user_detail(user_id):
+    """
+    API endpoint for one user: their traffic totals, the apps they use (most accessed first, with app name,
+    status, resolution, risk and is_shadow), and their expenses. 404 if the user is unknown.
+    e.g. /api/users/user3@example.com
+    """
+    try:
+        detail = get_user_detail(user_id)
+        if detail is None:
+            return jsonify({"error": f"Unknown user '{user_id}'"}), 404
+        return jsonify(detail)
+    except Exception as e:
+        print(f"Error in /api/users/{user_id}: {e}\n{traceback.format_exc()}")
+        return jsonify({"error": "Could not retrieve the user"}), 500
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Pipeline stage timings, cache, reload and ingestion counters in the Prometheus text format (see app.metrics)."""
+    return current_app.response_class(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/api/status')
+def api_status():
+    """API endpoint for the freshness of the served data (snapshot_age_s: seconds since it was last refreshed)."""
+    return jsonify(get_data_status())
+
+@bp.route('/api/dashboard')
+@conditional_get(_snapshot_or_window_version)
+def api_dashboard():
+    """
+    API endpoint for every dashboard widget at once, all from the same data version:
+    {"version", "stats", "apps", "behavior", "risk_distribution", "spend_by_category", "usage_trend"}.
+    Optional parameters: sections or exclude (comma-separated section names), and the usage_trend
+    parameters (granularity, days, start/end, domain) for its trend section. since/until window the other sections.
+    e.g. /api/dashboard?exclude=apps or /api/dashboard?sections=stats,usage_trend&granularity=hour
+    """
+    try:
+        sections = sections_param(request.args, DASHBOARD_SECTIONS)
+        query = TrendQuery.from_args(request.args, default_days=default_trend_days(),
+                                     max_days=current_app.config.get('TREND_MAX_DAYS', 366))
+        return jsonify(get_dashboard(sections, query, TimeWindow.from_args(request.args)))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in /api/dashboard: {e}\n{traceback.format_exc()}")
+        return jsonify({"error": "Could not build the dashboard data"}), 500
+
+@bp.route('/api/stream')
+def api_stream():
+    """
+    Server-Sent Events stream of dashboard changes, starting after data version `since` (or the
+    Last-Event-ID a reconnecting EventSource sends; default: the current version). Event types:
+    - delta (id: version): {"version", "previous_version", "added", "removed", "risk_changed",
+      "resolution_changed", "apps": the changed app records};
+    - resync: {"version"}, the client fell behind the kept deltas and should reload everything.
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        version = int(since) if since else live_update_version()
+    except ValueError:
+        return jsonify({"error": "since must be an integer version"}), 400
+    except Exception as e:
+        print(f"Error in /api/stream: {e}\n{traceback.format_exc()}")
+        return jsonify({"error": "Could not start the update stream"}), 500
+    heartbeat_s = current_app.config.get('LIVE_UPDATES_HEARTBEAT_S', 15)
+
+    def events(version):
+        yield 'retry: 5000\n\n'
+        try:
+            while True:
+                updates = wait_for_live_updates(version, heartbeat_s)
+                if updates is None:
+                    version = live_update_version()
+                    yield f'id: {version}\nevent: resync\ndata: {{"version": {version}}}\n\n'
+                elif not updates:
+                    yield ': keep-alive\n\n' # Also lets the server notice closed connections
+                for version, payload in updates or []:
+                    yield f'id: {version}\nevent: delta\ndata: {payload}\n\n'
+        except Exception as e:
+            print(f"Error in /api/stream: {e}\n{traceback.format_exc()}") # The client reconnects
+
+    return current_app.response_class(stream_with_context(events(version)), mimetype='text/event-stream',
+                                      headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # === Workflow Simulation API ===
 @bp.route('/api/apps/<app_id>/resolve', methods=['POST'])
 def api_resolve_app(app_id):
     """
-    Simulates updating the resolution status of an app.
+    Updates the resolution status of an app of the known-apps catalog (recorded in the resolution store).
     Expects JSON payload: {"resolution_status": "Sanctioned" | "Blocked" | "Investigating" | "FalsePositive"}
     """
     data = request.get_json()
     new_status = data.get('resolution_status')
 
     # Define valid statuses including None to clear it
-    valid_statuses = ['Sanctioned', 'Blocked', 'Investigating', 'FalsePositive', None]
+    valid_statuses = RESOLUTION_STATUSES + [None]
 
     # Check if the provided status is valid OR explicitly None
     is_valid = False
@@ -147,7 +304,7 @@ def api_resolve_app(app_id):
     if not app_id:
          return jsonify({"error": "Missing app_id"}), 400
 
-    # Call the processing function to simulate DB update
+    # Record the change; only this app is rescored for the next snapshot
     success = update_app_resolution_status(app_id, new_status)
 
     if success:
@@ -155,4 +312,35 @@ def api_resolve_app(app_id):
         # For simplicity, return success. Frontend should refetch to see change.
          return jsonify({"success": True, "message": f"App '{app_id}' status updated to '{new_status if new_status is not None else 'None'}'"})
     else:
-         return jsonify({"error": f"Failed to update status for app '{app_id}'"}), 500
\ No newline at end of file
+         return jsonify({"error": f"Failed to update status for app '{app_id}'"}), 500
+
+@bp.route('/api/apps/resolve', methods=['POST'])
+def api_resolve_apps():
+    """
+    Updates the resolution status of many apps at once: recorded in one transaction, rescored once.
+    Expects JSON payload, either a list of changes:
+        {"changes": [{"app_id": "cdn1.example.com", "resolution_status": "FalsePositive"}, ...]}
+    or an /api/apps filter (status, risk_level, category, resolution, min_upload_mb, max_upload_mb):
+        {"filter": {"category": "CDN", "status": "unknown"}, "resolution_status": "FalsePositive"}
+    Returns {"success", "updated", "revision"} (+ "skipped": filter matches outside the known-apps catalog).
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or ('changes' in data) == ('filter' in data):
+        return jsonify({"error": "Expected a JSON object with either 'changes' or 'filter'"}), 400
+    try:
+        if 'changes' in data:
+            result = update_app_resolutions(parse_changes(data['changes']))
+        else:
+            new_status = data.get('resolution_status')
+            if not isinstance(data['filter'], dict) or 'resolution_status' not in data or not is_valid_status(new_status):
+                return jsonify({"error": f"A filter object and a resolution_status (one of {RESOLUTION_STATUSES} or null) are required."}), 400
+            result = resolve_matching_apps(data['filter'], new_status)
+    except (ResolutionError, QueryError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in /api/apps/resolve: {e}\n{traceback.format_exc()}")
+        return jsonify({"error": "Failed to update resolution statuses"}), 500
+
+    if result is None:
+        return jsonify({"error": "Failed to update resolution statuses"}), 500
+    return jsonify({"success": True, **result})
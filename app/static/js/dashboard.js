@@ -3,6 +3,9 @@
 
 // --- Global Variables & State ---
 let allAppsData = []; // Stores the full dataset fetched from the API
+let dashboardVersion = null; // Data version the dashboard shows, live updates continue from it
+let liveUpdates = null; // EventSource of /api/stream
+let widgetRefreshTimer = null; // Pending refetch of the widgets after live updates
 let riskDistributionChart = null;
 let spendByCategoryChart = null;
 let usageTrendChart = null;
@@ -18,8 +21,11 @@ const API_ENDPOINTS = {
     riskChart: '/api/chart_data/risk_distribution',
     spendChart: '/api/chart_data/spend_by_category',
     trendChart: '/api/chart_data/usage_trend',
+    dashboard: '/api/dashboard', // All of the above in one response
+    liveUpdates: '/api/stream', // Server-Sent Events with the changes of each new data version
     resolveApp: '/api/apps/:app_id/resolve' // Placeholder for app_id
 };
+const WIDGET_REFRESH_DELAY_MS = 3000; // Live updates arriving within this delay share one refetch of the widgets
 
 const RISK_LEVEL_CLASSES = {
     'High': 'table-danger',
@@ -72,7 +78,8 @@ function showStatusMessage(message, type = 'info') { // type: success, danger, w
 // --- API Fetch Functions ---
 async function fetchData(endpoint) {
     try {
-        const response = await fetch(endpoint);
+        // Revalidate the browser's cached copy (If-None-Match): unchanged data comes back as a bodiless 304
+        const response = await fetch(endpoint, { cache: 'no-cache' });
         if (!response.ok) {
             console.error(`API Error ${response.status}: ${response.statusText} for ${endpoint}`);
             showStatusMessage(`Error fetching data from ${endpoint}. Status: ${response.status}`, 'danger');
@@ -378,28 +385,12 @@ function updateSortIcons(activeColumn, direction) {
     console.log("Initializing Dashboard...");
     document.getElementById('last-updated').textContent = `Updating...`;
 
-     // Fetch all data in parallel
-    const [stats, apps, behavior, riskChartData, spendChartData, trendChartData] = await Promise.all([
-         fetchData(API_ENDPOINTS.stats),
-         fetchData(API_ENDPOINTS.apps),
-        fetchData(API_ENDPOINTS.behavior),
-        fetchData(API_ENDPOINTS.riskChart),
-         fetchData(API_ENDPOINTS.spendChart),
-         fetchData(API_ENDPOINTS.trendChart),
-     ]);
+     // Fetch every widget in one round-trip, all built from the same data version
+    const dashboard = await fetchData(API_ENDPOINTS.dashboard) || {};
+    const apps = dashboard.apps;
 
     document.getElementById('last-updated').textContent = `Updated: ${moment().format('HH:mm:ss')}`;
 
-     // --- Update KPIs ---
-    if (stats) {
-        document.getElementById('kpi-total-detected').textContent = formatNumber(stats.total_detected);
-         document.getElementById('kpi-shadow-count').textContent = formatNumber(stats.shadow_count);
-         document.getElementById('kpi-high-risk').textContent = formatNumber(stats.high_risk);
-        document.getElementById('kpi-medium-risk').textContent = formatNumber(stats.medium_risk);
-        // document.getElementById('kpi-low-risk').textContent = formatNumber(stats.low_risk); // If you add this back
-        document.getElementById('kpi-linked-spend').textContent = formatCurrency(stats.linked_spend);
-    }
-
     // --- Render Table ---
     if (apps) {
          allAppsData = apps; // Store full dataset
@@ -410,6 +401,34 @@ function updateSortIcons(activeColumn, direction) {
          document.getElementById('app-table-body').innerHTML = '<tr><td colspan="12" class="text-center text-danger">Error loading application data.</td></tr>';
      }
 
+    renderWidgets(dashboard);
+    if (dashboard.version !== undefined) {
+        dashboardVersion = dashboard.version;
+        followLiveUpdates();
+    }
+
+     console.log("Dashboard Initialized.");
+ }
+
+// KPIs, charts and behavior insights from an /api/dashboard response
+function renderWidgets(dashboard) {
+    const {
+        stats, behavior,
+        risk_distribution: riskChartData,
+        spend_by_category: spendChartData,
+        usage_trend: trendChartData,
+    } = dashboard;
+
+     // --- Update KPIs ---
+    if (stats) {
+        document.getElementById('kpi-total-detected').textContent = formatNumber(stats.total_detected);
+         document.getElementById('kpi-shadow-count').textContent = formatNumber(stats.shadow_count);
+         document.getElementById('kpi-high-risk').textContent = formatNumber(stats.high_risk);
+        document.getElementById('kpi-medium-risk').textContent = formatNumber(stats.medium_risk);
+        // document.getElementById('kpi-low-risk').textContent = formatNumber(stats.low_risk); // If you add this back
+        document.getElementById('kpi-linked-spend').textContent = formatCurrency(stats.linked_spend);
+    }
+
     // --- Create/Update Charts ---
     if (riskChartData) {
          riskDistributionChart = createOrUpdateChart(
@@ -461,9 +480,57 @@ function updateSortIcons(activeColumn, direction) {
         topUsersList.innerHTML = '<li>Error loading insights.</li>';
          highUploadList.innerHTML = '<li>Error loading insights.</li>';
      }
+}
 
-     console.log("Dashboard Initialized.");
- }
+
+// --- Live Updates ---
+function followLiveUpdates() {
+    if (liveUpdates || !window.EventSource) return; // Opened once, the browser reconnects by itself
+    liveUpdates = new EventSource(`${API_ENDPOINTS.liveUpdates}?since=${dashboardVersion}`);
+    liveUpdates.addEventListener('delta', (event) => applyLiveUpdate(JSON.parse(event.data)));
+    liveUpdates.addEventListener('resync', () => initializeDashboard()); // Too far behind, reload everything
+}
+
+// Patches the app table with the changed apps of a new data version and schedules a refresh of the other widgets
+function applyLiveUpdate(delta) {
+    if (dashboardVersion !== null && delta.version <= dashboardVersion) return; // Already shown
+    if (delta.previous_version !== dashboardVersion) { // Missed a version
+        initializeDashboard();
+        return;
+    }
+    dashboardVersion = delta.version;
+
+    const removed = new Set(delta.removed);
+    const changed = new Map(delta.apps.map(app => [app.domain, app]));
+    allAppsData = allAppsData.filter(app => !removed.has(app.domain)).map(app => changed.get(app.domain) || app);
+    const shown = new Set(allAppsData.map(app => app.domain));
+    delta.apps.forEach(app => { if (!shown.has(app.domain)) allAppsData.push(app); });
+    if (allAppsData.length > 0) {
+        filterTable(); // Re-render with the current filter and sort
+    } else {
+        renderAppTable(allAppsData);
+    }
+
+    scheduleWidgetRefresh();
+
+    const notes = [];
+    if (delta.added.length) notes.push(`${delta.added.length} new app(s) detected`);
+    if (delta.risk_changed.length) notes.push(`${delta.risk_changed.length} risk level change(s)`);
+    if (delta.resolution_changed.length) notes.push(`${delta.resolution_changed.length} resolution update(s)`);
+    if (notes.length) showStatusMessage(notes.join(', '), 'info');
+}
+
+// The widgets summarize every app, so they are refetched rather than patched: once per burst of live updates,
+// at a random point of the delay so the dashboards open everywhere don't all ask at the same moment
+function scheduleWidgetRefresh() {
+    if (widgetRefreshTimer !== null) return; // The pending refetch will get the latest version
+    widgetRefreshTimer = setTimeout(async () => {
+        widgetRefreshTimer = null;
+        const widgets = await fetchData(`${API_ENDPOINTS.dashboard}?exclude=apps`);
+        if (widgets) renderWidgets(widgets);
+        document.getElementById('last-updated').textContent = `Updated: ${moment().format('HH:mm:ss')}`;
+    }, WIDGET_REFRESH_DELAY_MS * (0.5 + Math.random() / 2));
+}
 
 
 // --- Event Listeners ---
@@ -0,0 +1,240 @@
+# app/users.py
+# Per-user drill-down behind /api/users: which apps a user reaches, how much they moved and what they
+# expensed. UserAppIndex inverts the per-(domain, user) network aggregates into each user's apps and
+# UserExpenseIndex groups the expense rows by user, both in CSR layout (rows grouped by user, one offset
+# per user). They are built when the data is loaded or refreshed, so a lookup reads one user's rows only.
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .domains import rolled_up_codes
+from .ingestion import factorize_as_str
+from .queries import QueryError, int_param
+
+USER_SORT_FIELDS = ['access_count', 'uploaded_mb', 'downloaded_mb', 'app_count']
+EXPENSE_FIELDS = ['expense_id', 'vendor_name', 'amount', 'date', 'status']
+
+
+class UserAppIndex:
+    """
+    Each user's apps: (app domain, access count, upload/download MB, first/last seen) rows grouped by user,
+    plus per-user totals. Users are interned by their astype(str) form; rows without a user or a valid
+    domain are left out. With a domain_index (see app.domains) subdomains count as their app's domain.
+    """
+
+    def __init__(self, pairs, user_names):
+        """pairs: DataFrame of user (code into user_names), domain (name), access_count, uploaded_mb, downloaded_mb, first_seen, last_seen."""
+        user_names = np.asarray(user_names, dtype=object)
+        domain_codes, domain_values = pd.factorize(pairs['domain'])
+        valid_domain = np.array([isinstance(d, str) and d.strip() != '' for d in domain_values] + [False], dtype=bool)
+        users = pairs['user'].to_numpy(dtype=np.int64)
+        keep = valid_domain[domain_codes] & (~pd.isna(user_names[users]) if len(users) else np.array([], dtype=bool))
+        # Subdomains rolled into one app, or domains differing only by whitespace, become one row
+        app_codes, app_names = pd.factorize(np.array([str(d).strip() for d in domain_values], dtype=object))
+        app_names = np.asarray(app_names, dtype=object)
+        keys = users[keep] * max(1, len(app_names)) + app_codes[domain_codes[keep]] # Sorted by user first
+        rows = pairs[keep].groupby(keys, sort=True).agg(
+            access_count=('access_count', 'sum'), uploaded_mb=('uploaded_mb', 'sum'), downloaded_mb=('downloaded_mb', 'sum'),
+            first_seen=('first_seen', 'min'), last_seen=('last_seen', 'max'))
+
+        self.user_names = user_names
+        self._codes = {str(name): code for code, name in enumerate(user_names) if not pd.isna(name)}
+        row_users = rows.index.to_numpy(dtype=np.int64) // max(1, len(app_names))
+        self._domains = app_names[rows.index.to_numpy(dtype=np.int64) % max(1, len(app_names))]
+        self._access_counts = rows['access_count'].to_numpy(dtype=np.int64)
+        self._uploaded_mb = rows['uploaded_mb'].to_numpy(dtype=float)
+        self._downloaded_mb = rows['downloaded_mb'].to_numpy(dtype=float)
+        self._first_seen = rows['first_seen'].to_numpy(dtype='datetime64[ns]')
+        self._last_seen = rows['last_seen'].to_numpy(dtype='datetime64[ns]')
+        app_counts = np.bincount(row_users, minlength=len(user_names))
+        self._starts = np.concatenate(([0], np.cumsum(app_counts)))
+
+        # Per-user totals, for the top users listing
+        self._totals = {
+            'app_count': app_counts,
+            'access_count': np.bincount(row_users, weights=self._access_counts, minlength=len(user_names)).astype(np.int64),
+            'uploaded_mb': np.bincount(row_users, weights=self._uploaded_mb, minlength=len(user_names)),
+            'downloaded_mb': np.bincount(row_users, weights=self._downloaded_mb, minlength=len(user_names)),
+        }
+        self._active = np.flatnonzero(app_counts) # Users with at least one app
+        self._orders = {} # Sort field -> active users in listing order
+
+    @classmethod
+    def from_frame(cls, network_df, domain_index=None):
+        """Built from a loaded network log DataFrame (frame ingest mode)."""
+        domain_codes, domain_values = pd.factorize(network_df['destination_domain'])
+        if domain_index:
+            domain_codes, domain_values = rolled_up_codes(domain_codes, domain_values, domain_index)
+        user_codes, user_names = factorize_as_str(network_df['user_id'])
+        keep = domain_codes >= 0
+        rows = pd.DataFrame({'timestamp': network_df['timestamp'].to_numpy()[keep],
+                             'uploaded_mb': pd.to_numeric(network_df['data_uploaded_mb'], errors='coerce').to_numpy()[keep],
+                             'downloaded_mb': pd.to_numeric(network_df['data_downloaded_mb'], errors='coerce').to_numpy()[keep]})
+        keys = domain_codes[keep].astype(np.int64) * max(1, len(user_names)) + user_codes[keep] # One int key per pair
+        pairs = rows.groupby(keys).agg(
+            access_count=('timestamp', 'size'), uploaded_mb=('uploaded_mb', 'sum'), downloaded_mb=('downloaded_mb', 'sum'),
+            first_seen=('timestamp', 'min'), last_seen=('timestamp', 'max'))
+        pair_keys = pairs.index.to_numpy(dtype=np.int64)
+        pairs = pairs.reset_index(drop=True).assign(domain=np.asarray(domain_values, dtype=object)[pair_keys // max(1, len(user_names))],
+                                                   user=pair_keys % max(1, len(user_names)))
+        return cls(pairs, user_names)
+
+    @classmethod
+    def from_aggregates(cls, network_aggregates, domain_index=None):
+        """Built from streamed NetworkAggregates (see app.ingestion), reading their (domain, user) aggregates."""
+        pairs = network_aggregates.pair_stats()
+        domain_names = (network_aggregates.app_domains(domain_index) if domain_index
+                        else np.asarray(network_aggregates.domains.values, dtype=object))
+        frame = pd.DataFrame({
+            'domain': domain_names[pairs.index.get_level_values('domain').to_numpy()],
+            'user': pairs.index.get_level_values('user').to_numpy(),
+            'access_count': pairs['access_count'].to_numpy(), 'uploaded_mb': pairs['uploaded_mb'].to_numpy(),
+            'downloaded_mb': pairs['downloaded_mb'].to_numpy(),
+            'first_seen': pairs['first_seen'].to_numpy(), 'last_seen': pairs['last_seen'].to_numpy(),
+        })
+        return cls(frame, network_aggregates.users.values)
+
+    def __len__(self):
+        return len(self._active)
+
+    def __contains__(self, user_id):
+        code = self._codes.get(str(user_id))
+        return code is not None and self._starts[code + 1] > self._starts[code]
+
+    def apps_of(self, user_id):
+        """
+        The user's apps, most accessed first: [{'domain', 'access_count', 'uploaded_mb', 'downloaded_mb',
+        'first_seen', 'last_seen'}, ...]. Empty for an unknown user.
+        """
+        code = self._codes.get(str(user_id))
+        if code is None:
+            return []
+        rows = slice(self._starts[code], self._starts[code + 1])
+        apps = [{'domain': domain, 'access_count': count, 'uploaded_mb': uploaded, 'downloaded_mb': downloaded,
+                 'first_seen': first, 'last_seen': last}
+                for domain, count, uploaded, downloaded, first, last in zip(
+                    self._domains[rows], self._access_counts[rows].tolist(), self._uploaded_mb[rows].tolist(),
+                    self._downloaded_mb[rows].tolist(), _isoformat_all(self._first_seen[rows]), _isoformat_all(self._last_seen[rows]))]
+        return sorted(apps, key=lambda app: (-app['access_count'], app['domain']))
+
+    def domains_of(self, user_id):
+        """The app domains of a user (unordered), empty for an unknown user."""
+        code = self._codes.get(str(user_id))
+        if code is None:
+            return self._domains[:0]
+        return self._domains[self._starts[code]:self._starts[code + 1]]
+
+    def totals_of(self, user_id):
+        """The user's {'access_count', 'uploaded_mb', 'downloaded_mb', 'app_count', 'first_seen', 'last_seen'}, None if unknown."""
+        code = self._codes.get(str(user_id))
+        if code is None:
+            return None
+        return self._totals_at(code)
+
+    def _totals_at(self, code):
+        rows = slice(self._starts[code], self._starts[code + 1])
+        return {
+            'access_count': int(self._totals['access_count'][code]),
+            'uploaded_mb': float(self._totals['uploaded_mb'][code]),
+            'downloaded_mb': float(self._totals['downloaded_mb'][code]),
+            'app_count': int(self._totals['app_count'][code]),
+            'first_seen': _isoformat(self._first_seen[rows].min()) if rows.stop > rows.start else None,
+            'last_seen': _isoformat(self._last_seen[rows].max()) if rows.stop > rows.start else None,
+        }
+
+    def top_users(self, sort, offset, limit):
+        """
+        One page of the users with traffic, by a USER_SORT_FIELDS total (largest first, ties by user):
+        ([(user, totals), ...], number of users). The order of each field is sorted once per index.
+        """
+        order = self._orders.get(sort)
+        if order is None:
+            names = np.array([str(name) for name in self.user_names[self._active]], dtype=object)
+            ranks, _ = pd.factorize(names, sort=True)
+            order = self._orders[sort] = self._active[np.lexsort((ranks, -self._totals[sort][self._active]))]
+        return [(str(self.user_names[user]), self._totals_at(user)) for user in order[offset:offset + limit]], len(order)
+
+
+class UserExpenseIndex:
+    """Expense rows grouped by user (users by their astype(str) form), in ledger order."""
+
+    def __init__(self, expenses_df):
+        self._codes = {}
+        if expenses_df.empty or 'user_id' not in expenses_df.columns:
+            self._starts = np.zeros(1, dtype=np.int64)
+            self._rows, self._records = np.array([], dtype=np.int64), []
+            self._amount_totals = np.zeros(0)
+            return
+        user_codes, user_names = factorize_as_str(expenses_df['user_id'])
+        self._codes = {str(name): code for code, name in enumerate(user_names) if not pd.isna(name)}
+        valid_rows = np.flatnonzero(user_codes >= 0)
+        self._rows = valid_rows[np.argsort(user_codes[valid_rows], kind='stable')]
+        self._starts = np.concatenate(([0], np.cumsum(np.bincount(user_codes[valid_rows], minlength=len(user_names)))))
+        columns = [col for col in EXPENSE_FIELDS if col in expenses_df.columns]
+        self._records = expenses_df[columns] # Rows are turned into dicts on lookup
+        amounts = (pd.to_numeric(expenses_df['amount'], errors='coerce').fillna(0.0).to_numpy(dtype=float)
+                   if 'amount' in expenses_df.columns else np.zeros(len(expenses_df)))
+        self._amount_totals = np.bincount(user_codes[valid_rows], weights=amounts[valid_rows], minlength=len(user_names))
+
+    def __contains__(self, user_id):
+        return str(user_id) in self._codes
+
+    def total_of(self, user_id):
+        """(expense count, amount total) of a user, (0, 0.0) if they have no expenses."""
+        code = self._codes.get(str(user_id))
+        if code is None:
+            return 0, 0.0
+        return int(self._starts[code + 1] - self._starts[code]), float(self._amount_totals[code])
+
+    def expenses_of(self, user_id):
+        """The user's expenses [{'expense_id', 'vendor_name', 'amount', 'date', 'status'}, ...] in ledger order."""
+        code = self._codes.get(str(user_id))
+        if code is None:
+            return []
+        rows = self._records.iloc[self._rows[self._starts[code]:self._starts[code + 1]]]
+        return [{col: _plain(value) for col, value in record.items()} for record in rows.to_dict('records')]
+
+
+def _isoformat(value):
+    return None if pd.isna(value) else pd.Timestamp(value).isoformat()
+
+
+def _isoformat_all(values):
+    """Timestamp.isoformat() of each datetime64 value (None for NaT), in bulk when all are whole seconds."""
+    missing = np.isnat(values)
+    if ((values.astype('datetime64[s]') == values) | missing).all():
+        text = np.datetime_as_string(values, unit='s').astype(object)
+        text[missing] = None
+        return text.tolist()
+    return [_isoformat(value) for value in values]
+
+
+def _plain(value):
+    """JSON-friendly form of an expense value (dates as YYYY-MM-DD, NaN as None)."""
+    if isinstance(value, pd.Timestamp):
+        return value.date().isoformat() if value == value.normalize() else value.isoformat()
+    if isinstance(value, (np.integer, np.floating)):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+@dataclass(frozen=True)
+class UserQuery:
+    """A page of the top users listing."""
+    sort: str = 'access_count'
+    offset: int = 0
+    limit: int = 20
+
+    @classmethod
+    def from_args(cls, args, default_limit=20, max_limit=1000):
+        """Parses request query parameters (sort, offset, limit), raising QueryError on invalid ones."""
+        sort = (args.get('sort') or 'access_count').lstrip('-')
+        if sort not in USER_SORT_FIELDS:
+            raise QueryError(f"Cannot sort users by '{sort}'. Sortable fields: {', '.join(USER_SORT_FIELDS)}")
+        limit = int_param(args, 'limit', default_limit, minimum=1)
+        if limit > max_limit:
+            raise QueryError(f"limit can be at most {max_limit}")
+        return cls(sort=sort, offset=int_param(args, 'offset', 0, minimum=0), limit=limit)
@@ -0,0 +1,119 @@
+# app/windows.py
+# Time windows of the app, summary and insight APIs (the since/until query parameters): discovery and
+# scoring over only the network rows logged inside the window. Frame mode keeps the positions of the log
+# rows sorted by timestamp (TimeIndex), so a window is two binary searches and discovery then reads the
+# rows inside it only. Streaming mode sums the aggregates of the time buckets (NETWORK_WINDOW_BUCKET_HOURS
+# hours each) the window covers instead (see NetworkAggregates.window): its bounds are rounded out to whole buckets.
+import datetime
+import re
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .queries import QueryError
+
+WINDOW_PARAMS = ('since', 'until')
+
+_RELATIVE = re.compile(r'^(\d+)([hd])$') # e.g. 24h, 7d: back from the latest logged access
+_UNITS = {'h': 'hours', 'd': 'days'}
+# Log timestamps are datetime64[ns]: bounds beyond its range are clamped to it, they cover the same rows
+_EARLIEST, _LATEST = datetime.datetime(1677, 9, 22), datetime.datetime(2262, 4, 11)
+
+
+@dataclass(frozen=True)
+class TimeWindow:
+    """
+    Rows logged from `since` (inclusive) until `until` (exclusive), either bound open when None.
+    A bound is a naive UTC datetime, or a timedelta counted back from the latest logged access.
+    """
+    since: object = None
+    until: object = None
+
+    @classmethod
+    def from_args(cls, args):
+        """
+        Parses the since/until request parameters, raising QueryError on invalid ones. None when neither
+        is given. Each is an ISO 8601 date or date-time (naive ones are UTC, like the log) or a duration
+        back from the latest logged access (24h, 7d). A date-only `until` includes that whole day.
+        """
+        since, until = _bound_param(args, 'since'), _bound_param(args, 'until', end_of_day=True)
+        if since is None and until is None:
+            return None
+        if type(since) is type(until) and (since >= until if isinstance(since, datetime.datetime) else since <= until):
+            raise QueryError("since must be before until")
+        return cls(since=since, until=until)
+
+    def bounds(self, latest):
+        """(start, stop) as datetime64[ns], None for an open end, given the latest logged access (NaT if none)."""
+        return _resolve(self.since, latest), _resolve(self.until, latest)
+
+
+def _bound_param(args, name, end_of_day=False):
+    value = (args.get(name) or '').strip()
+    if not value:
+        return None
+    match = _RELATIVE.match(value)
+    if match:
+        try:
+            return datetime.timedelta(**{_UNITS[match.group(2)]: int(match.group(1))})
+        except OverflowError:
+            raise QueryError(f"{name} is too long a duration")
+    try:
+        if len(value) == 10: # YYYY-MM-DD
+            day = datetime.datetime.combine(datetime.date.fromisoformat(value), datetime.time())
+            return day + datetime.timedelta(days=1) if end_of_day and day.date() < datetime.date.max else day
+        moment = datetime.datetime.fromisoformat(value)
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    except (ValueError, OverflowError):
+        raise QueryError(f"{name} must be an ISO 8601 date or date-time, or a duration like 24h or 7d")
+    return moment
+
+
+def _resolve(bound, latest):
+    if bound is None:
+        return None
+    if isinstance(bound, datetime.timedelta):
+        if pd.isna(latest):
+            return None
+        latest = pd.Timestamp(latest)
+        if bound >= latest.to_pydatetime(warn=False) - _EARLIEST:
+            return np.datetime64(_EARLIEST, 'ns')
+        return np.datetime64(latest - bound, 'ns')
+    return np.datetime64(min(max(bound, _EARLIEST), _LATEST), 'ns')
+
+
+def bucket_range(start, stop, hours=1):
+    """
+    Buckets of `hours` hours since the epoch covering [start, stop): start rounded down, stop rounded up
+    (None stays open).
+    """
+    bucket_ns = hours * 3600 * 10**9
+    start_bucket = None if start is None else int(start.astype('datetime64[ns]').astype(np.int64) // bucket_ns)
+    stop_bucket = None if stop is None else int(-(-stop.astype('datetime64[ns]').astype(np.int64) // bucket_ns))
+    return start_bucket, stop_bucket
+
+
+class TimeIndex:
+    """Positions of the network log rows with a timestamp, sorted by it (ties in log order)."""
+
+    def __init__(self, timestamps):
+        stamps = np.asarray(timestamps, dtype='datetime64[ns]')
+        timed = np.flatnonzero(~np.isnat(stamps))
+        order = np.argsort(stamps[timed], kind='stable')
+        self._positions = timed[order]
+        self._stamps = stamps[timed][order]
+
+    def __len__(self):
+        return len(self._positions)
+
+    def latest(self):
+        """Latest timestamp, NaT if no row has one."""
+        return self._stamps[-1] if len(self._stamps) else np.datetime64('NaT', 'ns')
+
+    def rows_between(self, start=None, stop=None):
+        """Positions, in log order, of the rows logged from start (inclusive) until stop (exclusive)."""
+        lo = 0 if start is None else np.searchsorted(self._stamps, start, side='left')
+        hi = len(self._stamps) if stop is None else np.searchsorted(self._stamps, stop, side='left')
+        return np.sort(self._positions[lo:hi])
@@ -0,0 +1,95 @@
+# benchmarks/bench_discovery.py
+"""
+Times discover_applications on synthetic network logs from 10^4 to 10^7 rows and checks that
+its output is identical to the original per-domain groupby loop (run up to --legacy-max-rows).
+
+    python benchmarks/bench_discovery.py [--max-rows 10000000] [--legacy-max-rows 1000000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.processing import discover_applications, safe_float  # noqa: E402
+
+
+def make_network_log(n_rows, seed=0):
+    """Zipf-skewed synthetic proxy log, roughly one distinct domain per 20 rows."""
+    rng = np.random.default_rng(seed)
+    n_domains = max(10, n_rows // 20)
+    n_users = max(5, min(50_000, n_rows // 100))
+    domains = np.array([f"app{i}.example.com" for i in range(n_domains)], dtype=object)
+    users = np.array([f"user{i}@example.com" for i in range(n_users)], dtype=object)
+    domain_idx = np.minimum(rng.zipf(1.2, n_rows) - 1, n_domains - 1)
+    start = np.datetime64('2023-10-01T00:00:00', 'ns')
+    return pd.DataFrame({
+        'timestamp': start + rng.integers(0, 30 * 86400, n_rows).astype('timedelta64[s]'),
+        'user_id': users[rng.integers(0, n_users, n_rows)],
+        'destination_domain': domains[domain_idx],
+        'data_uploaded_mb': np.round(rng.exponential(5, n_rows), 3),
+        'data_downloaded_mb': np.round(rng.exponential(20, n_rows), 3),
+    })
+
+
+def legacy_discover_applications(network_df):
+    """The original per-domain loop, kept as the reference implementation."""
+    discovered = {}
+    for domain, group in network_df.groupby('destination_domain', dropna=False):
+        if pd.isna(domain) or not isinstance(domain, str) or domain.strip() == '':
+            continue
+        domain = str(domain).strip()
+        valid_timestamps = group['timestamp'].dropna()
+        first_seen = valid_timestamps.min() if not valid_timestamps.empty else pd.NaT
+        last_seen = valid_timestamps.max() if not valid_timestamps.empty else pd.NaT
+        discovered[domain] = {
+            'id': domain,
+            'domain': domain,
+            'network_access_count': len(group),
+            'unique_users_network': list(group['user_id'].astype(str).unique()),
+            'total_data_uploaded_mb': safe_float(group['data_uploaded_mb'].sum()),
+            'total_data_downloaded_mb': safe_float(group['data_downloaded_mb'].sum()),
+            'first_seen_network': first_seen.isoformat() if pd.notna(first_seen) else None,
+            'last_seen_network': last_seen.isoformat() if pd.notna(last_seen) else None,
+            'app_name': 'Unknown', 'category': 'Unknown', 'status': 'unknown',
+            'resolution_status': None, 'inherent_risk_score': 10,
+            'compliance_gdpr': None, 'compliance_hipaa': None, 'known_breach': None,
+            'expense_keywords': [], 'linked_expense_count': 0, 'linked_expense_total': 0.0,
+            'calculated_risk_score': 0, 'calculated_risk_level': 'High', 'risk_factors': []
+        }
+    return list(discovered.values())
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--max-rows', type=int, default=10_000_000)
+    parser.add_argument('--legacy-max-rows', type=int, default=1_000_000,
+                        help="Largest size the (slow) original loop is run and compared at")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'domains':>9} {'vectorized s':>13} {'rows/s':>12} {'legacy s':>10} {'speedup':>8}  identical")
+    n_rows = 10_000
+    while n_rows <= args.max_rows:
+        network_df = make_network_log(n_rows)
+        apps, elapsed = timed(discover_applications, network_df)
+        line = f"{n_rows:>10} {len(apps):>9} {elapsed:>13.3f} {n_rows / elapsed:>12,.0f}"
+        if n_rows <= args.legacy_max_rows:
+            legacy_apps, legacy_elapsed = timed(legacy_discover_applications, network_df)
+            line += f" {legacy_elapsed:>10.3f} {legacy_elapsed / elapsed:>7.1f}x  {apps == legacy_apps}"
+        else:
+            line += f" {'-':>10} {'-':>8}  -"
+        print(line, flush=True)
+        n_rows *= 10
+
+
+if __name__ == '__main__':
+    main()
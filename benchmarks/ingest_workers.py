@@ -0,0 +1,68 @@
+# benchmarks/ingest_workers.py
+# Streaming ingestion throughput of the network log as the number of worker processes grows.
+# Every run is checked against the single-process aggregates before its timing is reported.
+#
+#   python benchmarks/ingest_workers.py --rows 5000000 --workers 1,2,4,8,16,32
+#   python benchmarks/ingest_workers.py --log data/network_log_enhanced.csv --workers 1,4
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.ingestion import stream_network_log # noqa: E402
+from benchmarks.synthetic import write_network_log # noqa: E402
+
+
+def summary_of(aggregates):
+    summary, users = aggregates.domain_summary()
+    return summary.reset_index(drop=True), [u.tolist() for u in users]
+
+
+def same_results(expected, actual):
+    (summary_a, users_a), (summary_b, users_b) = expected, actual
+    exact = ['domain', 'network_access_count', 'user_count', 'first_seen', 'last_seen']
+    if not summary_a[exact].equals(summary_b[exact]) or users_a != users_b:
+        return False
+    # Volume totals are summed in a different grouping, allow floating point rounding
+    return all(np.allclose(summary_a[col].to_numpy(float), summary_b[col].to_numpy(float), rtol=1e-9, atol=1e-9)
+               for col in ['total_data_uploaded_mb', 'total_data_downloaded_mb'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming ingestion throughput by number of worker processes.')
+    parser.add_argument('--log', help='Network log to read (default: a generated one)')
+    parser.add_argument('--rows', type=int, default=2000000, help='Rows of the generated log')
+    parser.add_argument('--workers', default='1,2,4,8', help='Comma-separated worker counts')
+    parser.add_argument('--chunk-rows', type=int, default=250000)
+    parser.add_argument('--min-range-mb', type=float, default=1.0, help='Smallest byte range per worker')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = args.log
+        if not path:
+            path = os.path.join(tmp_dir, 'network_log.csv')
+            started = time.perf_counter()
+            write_network_log(path, args.rows)
+            print(f"Generated {args.rows:,} rows in {time.perf_counter() - started:.1f}s")
+        size_mb = os.path.getsize(path) / 1e6
+
+        baseline = None
+        print(f"{'workers':>7} {'seconds':>8} {'rows/s':>12} {'MB/s':>8} {'speedup':>8}  identical")
+        for workers in [int(w) for w in args.workers.split(',')]:
+            started = time.perf_counter()
+            aggregates, _ = stream_network_log(path, args.chunk_rows, workers=workers,
+                                               min_range_bytes=int(args.min_range_mb * 1e6))
+            elapsed = time.perf_counter() - started
+            result = summary_of(aggregates)
+            if baseline is None:
+                baseline = (elapsed, result)
+            print(f"{workers:>7} {elapsed:>8.2f} {aggregates.rows_ingested / elapsed:>12,.0f} {size_mb / elapsed:>8.1f} "
+                  f"{baseline[0] / elapsed:>7.2f}x  {same_results(baseline[1], result)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+# benchmarks/pipeline.py
+"""
+Times every stage of the processing pipeline and every dashboard /api route (through the Flask
+test client) on seeded synthetic data sets (see benchmarks/synthetic.py), reporting the time,
+the peak traced memory and the throughput of each. With --check, exits with status 1 when a stage
+is slower or needs more memory than in the stored baseline, beyond the tolerance. Baselines are
+machine specific, so none is kept in the repository (benchmarks/baseline.json is ignored by git):
+record one with --update-baseline on the machine that runs the checks. The time window stages are
+left out in stream mode unless config.py sets NETWORK_WINDOW_BUCKET_HOURS.
+
+    python benchmarks/pipeline.py [--rows 1e3,1e4,1e5] [--modes frame,stream] [--check | --update-baseline]
+    python benchmarks/pipeline.py --rows 1e7 --modes stream --data-dir /tmp/shadow-it-bench --no-memory
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+from flask import current_app
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import config  # noqa: E402
+from app import create_app, processing  # noqa: E402
+from app.windows import TimeWindow  # noqa: E402
+from benchmarks.synthetic import generate_dataset  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+ROUTES = {
+    'GET /api/summary_stats': '/api/summary_stats',
+    'GET /api/apps': '/api/apps',
+    'GET /api/apps?query': '/api/apps?status=unknown,unsanctioned&sort=-calculated_risk_score&limit=100',
+    'GET /api/summary_stats?since=24h': '/api/summary_stats?since=24h',
+    'GET /api/users': '/api/users?limit=100',
+    'GET /api/users/<user_id>': '/api/users/user1645@example.com', # Busiest user of the default seed
+    'GET /api/behavior_insights': '/api/behavior_insights',
+    'GET /api/chart_data/risk_distribution': '/api/chart_data/risk_distribution',
+    'GET /api/chart_data/spend_by_category': '/api/chart_data/spend_by_category',
+    'GET /api/chart_data/usage_trend': '/api/chart_data/usage_trend?granularity=hour&days=7',
+    'GET /api/dashboard': '/api/dashboard',
+}
+WINDOW_STAGES = {'get_window_snapshot', 'GET /api/summary_stats?since=24h'}
+
+
+def dataset_for(rows, args, data_dir):
+    """Generates the data set of a size, or reuses the one already in data_dir."""
+    out_dir = os.path.join(data_dir, f'rows{rows}-domains{args.domains}-users{args.users}-skew{args.skew}-seed{args.seed}')
+    paths = {'network': os.path.join(out_dir, 'network_log_enhanced.csv'),
+             'known_apps': os.path.join(out_dir, 'known_apps_enhanced.csv'),
+             'expenses': os.path.join(out_dir, 'expenses.csv')}
+    if not all(os.path.exists(path) for path in paths.values()):
+        paths = generate_dataset(out_dir, rows, domains=args.domains, users=args.users, skew=args.skew, seed=args.seed)
+    return paths
+
+
+def make_app(paths, mode):
+    """The dashboard app with config.py's settings, reading `paths` without a frame cache or resolution store."""
+    settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+    settings.update(NETWORK_LOG_FILE=paths['network'], KNOWN_APPS_FILE=paths['known_apps'],
+                    EXPENSES_FILE=paths['expenses'], NETWORK_INGEST_MODE=mode, DATA_CACHE_DIR=None,
+                    RESOLUTION_STORE_FILE=None, BACKGROUND_REFRESH=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return create_app(types.SimpleNamespace(**settings))
+
+
+def reset_processing():
+    """Drops the loaded data and snapshot, so the next stage starts cold."""
+    processing._cached_data = None
+    processing._data_load_time = None
+    processing._snapshot = None
+    processing._window_snapshots.clear()
+
+
+def pipeline_stages(client):
+    """
+    (name, prepare) pairs, in pipeline order. prepare() sets up the inputs of a stage and returns
+    the call to time. Run inside an app context.
+    """
+    def load():
+        reset_processing()
+        return lambda: processing.load_and_cache_data(force_reload=True)
+
+    def discover():
+        cached = processing.load_and_cache_data()
+        if cached['network_aggregates'] is not None:
+            return lambda: processing.discover_applications_from_aggregates(cached['network_aggregates'],
+                                                                            domain_index=cached['domain_index'])
+        return lambda: processing.discover_applications(cached['network'], cached['domain_index'])
+
+    def scoring_inputs():
+        cached = processing.load_and_cache_data()
+        if cached['network_aggregates'] is not None:
+            apps_frame = processing.discover_applications_from_aggregates(cached['network_aggregates'],
+                                                                          domain_index=cached['domain_index'])
+        else:
+            apps_frame = processing.discover_applications_frame(cached['network'], cached['domain_index'])
+        return apps_frame, cached['known_apps'], cached['expenses'], cached['expense_index']
+
+    def calculate():
+        apps_frame, *catalogs = scoring_inputs()
+        records = processing.build_app_records(apps_frame)
+        return lambda: processing.calculate_risk_and_status(records, *catalogs)
+
+    def score():
+        inputs = scoring_inputs()
+        return lambda: processing.score_apps(*inputs)
+
+    def snapshot():
+        processing.load_and_cache_data()
+        processing._snapshot = None
+        return processing.get_processed_snapshot
+
+    def window():
+        processing.load_and_cache_data()
+        processing._window_snapshots.clear()
+        return lambda: processing.get_window_snapshot(TimeWindow(since=datetime.timedelta(hours=24)))
+
+    def behavior():
+        apps = processing.get_processed_app_data(include_risk_factors=False)
+        return lambda: processing.get_behavior_insights(apps)
+
+    def route(url):
+        def prepare():
+            processing.get_processed_snapshot()
+            return lambda: _checked_get(client, url)
+        return prepare
+
+    stages = ([('load_and_cache_data', load), ('discover_applications', discover),
+               ('calculate_risk_and_status', calculate), ('score_apps', score),
+               ('get_processed_snapshot', snapshot), ('get_window_snapshot', window), ('get_behavior_insights', behavior)]
+              + [(name, route(url)) for name, url in ROUTES.items()])
+    if current_app.config['NETWORK_INGEST_MODE'] == 'stream' and not current_app.config.get('NETWORK_WINDOW_BUCKET_HOURS'):
+        stages = [(name, prepare) for name, prepare in stages if name not in WINDOW_STAGES] # No windows without buckets
+    return stages
+
+
+def _checked_get(client, url):
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} returned {response.status_code}")
+    return response.get_data()
+
+
+def time_stage(prepare, repeat):
+    """Best of `repeat` runs, in seconds."""
+    best = None
+    for _ in range(repeat):
+        call = prepare()
+        with contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            call()
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory_mb(prepare):
+    """Peak memory traced while the stage runs, above what was allocated when it started, in MB."""
+    call = prepare()
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            started, _ = tracemalloc.get_traced_memory()
+            call()
+            _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return (peak - started) / 1e6
+
+
+def run_benchmark(paths, mode, rows, args):
+    """{stage: {'seconds', 'peak_mb'}} of one data set and ingest mode."""
+    app = make_app(paths, mode)
+    results = {}
+    with app.app_context():
+        stages = pipeline_stages(app.test_client())
+        for name, prepare in stages:
+            results[name] = {'seconds': round(time_stage(prepare, args.repeat), 6)}
+        if args.memory: # A separate pass, tracing slows everything down
+            for name, prepare in stages:
+                results[name]['peak_mb'] = round(peak_memory_mb(prepare), 3)
+    reset_processing()
+    return results
+
+
+def regressions(results, baseline, args):
+    """Descriptions of the stages that got slower or bigger than their baseline by more than the tolerance."""
+    found = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, unit, slack in [('seconds', 's', args.min_delta_s), ('peak_mb', 'MB', args.min_delta_mb)]:
+            if result.get(metric) is None or base.get(metric) is None:
+                continue
+            if result[metric] > base[metric] * (1 + args.tolerance) and result[metric] - base[metric] > slack:
+                found.append(f"{name}: {result[metric]:.4f}{unit} vs baseline {base[metric]:.4f}{unit} "
+                             f"(+{(result[metric] / base[metric] - 1) * 100 if base[metric] else float('inf'):.0f}%)")
+    return found
+
+
+def print_results(mode, rows, results, baseline):
+    print(f"\n{mode} ingest, {rows:,} log rows")
+    print(f"{'stage':<38} {'seconds':>9} {'throughput':>16} {'peak MB':>9} {'baseline s':>11}")
+    for name, result in results.items():
+        if name.startswith('GET '):
+            throughput = f"{1 / result['seconds']:,.1f} req/s"
+        else:
+            throughput = f"{rows / result['seconds']:,.0f} rows/s"
+        peak = f"{result['peak_mb']:.1f}" if result.get('peak_mb') is not None else '-'
+        base = baseline.get(name, {}).get('seconds')
+        base = f"{base:.4f}" if base is not None else '-'
+        print(f"{name:<38} {result['seconds']:>9.4f} {throughput:>16} {peak:>9} {base:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', default='1e3,1e4,1e5', help='Comma-separated network log sizes (up to 1e7)')
+    parser.add_argument('--modes', default='frame,stream', help='Comma-separated NETWORK_INGEST_MODEs')
+    parser.add_argument('--domains', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of domain and user popularity')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--data-dir', help='Where generated data sets are kept and reused (default: a temporary directory)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage, the best one counts')
+    parser.add_argument('--no-memory', dest='memory', action='store_false', help='Skip the peak memory pass')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--check', action='store_true', help='Exit with status 1 on a regression against the baseline')
+    parser.add_argument('--update-baseline', action='store_true', help='Store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='Allowed slowdown or growth, as a fraction')
+    parser.add_argument('--min-delta-s', type=float, default=0.01, help='Slowdowns below this are never regressions')
+    parser.add_argument('--min-delta-mb', type=float, default=1.0, help='Growth below this is never a regression')
+    args = parser.parse_args()
+
+    dataset = {'domains': args.domains, 'users': args.users, 'skew': args.skew, 'seed': args.seed}
+    stored = {'dataset': dataset, 'runs': {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            stored = json.load(f)
+    elif args.check:
+        print(f"No baseline at {args.baseline}: record one on this machine with --update-baseline first")
+        return 2
+    if stored.get('dataset') != dataset:
+        if args.check:
+            print(f"The baseline was recorded on another data set ({stored.get('dataset')}), not {dataset}")
+            return 2
+        stored = {'dataset': dataset, 'runs': {}} # Replaced by --update-baseline
+
+    found = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for rows in [int(float(r)) for r in args.rows.split(',')]:
+            started = time.perf_counter()
+            paths = dataset_for(rows, args, args.data_dir or tmp_dir)
+            print(f"\nData set of {rows:,} log rows ready in {time.perf_counter() - started:.1f}s", flush=True)
+            for mode in args.modes.split(','):
+                key = f'{mode}/{rows}'
+                results = run_benchmark(paths, mode, rows, args)
+                baseline = stored['runs'].get(key, {})
+                print_results(mode, rows, results, baseline)
+                if args.check:
+                    found += [f"{key} {regression}" for regression in regressions(results, baseline, args)]
+                stored['runs'][key] = results
+                sys.stdout.flush()
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(stored, f, indent=2, sort_keys=True)
+        print(f"\nBaseline written to {args.baseline}")
+    if found:
+        print(f"\n{len(found)} regression(s) beyond {args.tolerance:.0%}:")
+        for regression in found:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
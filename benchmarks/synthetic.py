@@ -0,0 +1,165 @@
+# benchmarks/synthetic.py
+"""
+Seeded synthetic data sets in the layout of data/: a network log, a known-apps catalog and an
+expense ledger. Accesses follow a Zipf-like distribution over domains and users (skew 0 is
+uniform, larger values concentrate traffic on the most popular ones), arrive in time order with a
+working-hours daily cycle, and part of them go to subdomains of the base domains. Popular domains
+are more likely to be in the catalog; most expenses name a catalog app's vendor.
+
+    python benchmarks/synthetic.py OUT_DIR --rows 1000000 [--domains 5000] [--users 2000] [--skew 1.1] [--seed 0]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+CATEGORIES = ['File Storage', 'File Transfer', 'CRM', 'Collaboration', 'Project Management', 'Design',
+              'Developer Tools', 'Analytics', 'Marketing', 'HR', 'Finance', 'CDN', 'Social Media', 'AI Assistant']
+STATUSES = ['sanctioned', 'unsanctioned', 'unknown', 'conditionally_approved', 'irrelevant']
+STATUS_WEIGHTS = [0.35, 0.25, 0.2, 0.1, 0.1]
+EXPENSE_STATUSES = ['Approved', 'Pending Review', 'Rejected']
+SUBDOMAINS = ['api', 'cdn', 'eu', 'login', 'static']
+_CHUNK_ROWS = 1000000
+_HOUR_WEIGHTS = np.array([1, 1, 1, 1, 1, 2, 4, 8, 14, 16, 16, 15, 12, 15, 16, 15, 13, 9, 6, 4, 3, 2, 2, 1], dtype=float)
+
+
+def zipf_weights(n, skew):
+    """Probabilities of ranks 1..n proportional to 1 / rank**skew."""
+    weights = 1.0 / np.arange(1, n + 1, dtype=float) ** skew
+    return weights / weights.sum()
+
+
+def domain_names(domains):
+    return np.array([f'app{i}.example.com' for i in range(domains)], dtype=object)
+
+
+def write_network_log(path, rows, domains=5000, users=2000, skew=1.1, days=30, subdomain_share=0.2,
+                      dirty_share=0.001, seed=0, start='2023-10-01'):
+    """
+    Writes `rows` log rows over `days` days in time order. A subdomain_share of the accesses go to
+    a subdomain of the domain (e.g. api.app3.example.com) and a dirty_share have no domain or user.
+    """
+    rng = np.random.default_rng(seed)
+    names = domain_names(domains)
+    domain_p, user_p = zipf_weights(domains, skew), zipf_weights(users, skew)
+    # Popularity ranks shuffled over the names, so app0 isn't always the busiest
+    domain_order, user_order = rng.permutation(domains), rng.permutation(users)
+    upload_scale = rng.lognormal(1.0, 1.0, domains) # Typical upload size varies by domain
+    hour_p = _HOUR_WEIGHTS / _HOUR_WEIGHTS.sum()
+    first_day = np.datetime64(start, 's')
+
+    with open(path, 'w', newline='') as f:
+        for offset in range(0, rows, _CHUNK_ROWS):
+            n = min(_CHUNK_ROWS, rows - offset)
+            # The days this chunk covers, so the whole log is in time order
+            day_lo, day_hi = days * offset // rows, max(days * (offset + n) // rows, days * offset // rows + 1)
+            seconds = (rng.integers(day_lo, day_hi, n) * 86400 + rng.choice(24, n, p=hour_p) * 3600
+                       + rng.integers(0, 3600, n))
+            seconds.sort()
+            domain_idx = domain_order[rng.choice(domains, n, p=domain_p)]
+            user_idx = user_order[rng.choice(users, n, p=user_p)]
+            destination = names[domain_idx]
+            to_subdomain = rng.random(n) < subdomain_share
+            destination[to_subdomain] = (np.array(SUBDOMAINS, dtype=object)[rng.integers(0, len(SUBDOMAINS), to_subdomain.sum())]
+                                         + '.' + destination[to_subdomain])
+            user_ids = np.array([f'user{i}@example.com' for i in range(users)], dtype=object)[user_idx]
+            dirty = rng.random(n) < dirty_share
+            destination[dirty & (rng.random(n) < 0.5)] = ''
+            user_ids[dirty & (rng.random(n) >= 0.5)] = ''
+            frame = pd.DataFrame({
+                'timestamp': np.datetime_as_string(first_day + seconds.astype('timedelta64[s]')) + 'Z',
+                'user_id': user_ids,
+                'source_ip': [f'10.{(u >> 16) & 255}.{(u >> 8) & 255}.{u & 255}' for u in user_idx.tolist()],
+                'destination_domain': destination,
+                'data_uploaded_mb': np.round(rng.exponential(upload_scale[domain_idx]), 3),
+                'data_downloaded_mb': np.round(rng.exponential(20.0, n), 3),
+            })
+            frame.to_csv(f, index=False, header=offset == 0)
+
+
+def write_known_apps(path, domains=5000, skew=1.1, known_share=0.3, seed=0):
+    """
+    Writes a catalog of known_share of the domains, drawn with the same popularity weights as the
+    log (same seed), so the busiest domains are mostly known. Returns the catalog as a DataFrame.
+    """
+    rng = np.random.default_rng(seed)
+    names = domain_names(domains)
+    domain_order = rng.permutation(domains) # Same popularity ranks as write_network_log with this seed
+    count = max(1, int(domains * known_share))
+    weights = zipf_weights(domains, skew / 2) # Flatter than the traffic: plenty of rarely used apps are known too
+    picked = np.sort(rng.choice(domains, count, replace=False, p=weights))
+    codes = domain_order[picked]
+    catalog = pd.DataFrame({
+        'domain': names[codes],
+        'app_name': [f'App {code}' for code in codes],
+        'category': rng.choice(CATEGORIES, count),
+        'status': rng.choice(STATUSES, count, p=STATUS_WEIGHTS),
+        'compliance_gdpr': rng.choice(['True', 'False', ''], count, p=[0.6, 0.3, 0.1]),
+        'compliance_hipaa': rng.choice(['True', 'False', ''], count, p=[0.2, 0.6, 0.2]),
+        'known_breach': rng.choice(['True', 'False'], count, p=[0.1, 0.9]),
+        'inherent_risk_score': rng.integers(1, 11, count),
+        'expense_keywords': [f'vend{code}' if rng.random() < 0.8 else '' for code in codes],
+    })
+    catalog.to_csv(path, index=False)
+    return catalog
+
+
+def write_expenses(path, catalog, rows=1000, users=2000, linked_share=0.8, days=30, seed=0, start='2023-10-01'):
+    """Writes `rows` expenses, linked_share of them from vendors named by catalog expense keywords."""
+    rng = np.random.default_rng(seed)
+    keywords = [kw for kw in catalog['expense_keywords'] if kw]
+    linked = rng.random(rows) < linked_share if keywords else np.zeros(rows, dtype=bool)
+    vendors = np.array([f'Other Vendor {i} LLC' for i in rng.integers(0, max(10, rows // 10), rows)], dtype=object)
+    if keywords:
+        vendors[linked] = [f'{kw.capitalize()} Inc' for kw in rng.choice(keywords, linked.sum())]
+    pd.DataFrame({
+        'expense_id': [f'EXP{i:07d}' for i in range(rows)],
+        'user_id': [f'user{i}@example.com' for i in rng.integers(0, users, rows)],
+        'vendor_name': vendors,
+        'amount': np.round(rng.lognormal(3.5, 1.0, rows), 2),
+        'date': np.datetime_as_string(np.datetime64(start, 'D') + rng.integers(0, days, rows).astype('timedelta64[D]')),
+        'status': rng.choice(EXPENSE_STATUSES, rows, p=[0.8, 0.15, 0.05]),
+    }).to_csv(path, index=False)
+
+
+def generate_dataset(out_dir, rows, domains=5000, users=2000, skew=1.1, expenses=None, known_share=0.3, days=30, seed=0):
+    """
+    Writes network_log_enhanced.csv, known_apps_enhanced.csv and expenses.csv to out_dir.
+    Returns {'network', 'known_apps', 'expenses'} paths (config NETWORK_LOG_FILE etc.).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {'network': os.path.join(out_dir, 'network_log_enhanced.csv'),
+             'known_apps': os.path.join(out_dir, 'known_apps_enhanced.csv'),
+             'expenses': os.path.join(out_dir, 'expenses.csv')}
+    write_network_log(paths['network'], rows, domains=domains, users=users, skew=skew, days=days, seed=seed)
+    catalog = write_known_apps(paths['known_apps'], domains=domains, skew=skew, known_share=known_share, seed=seed)
+    write_expenses(paths['expenses'], catalog, rows=expenses if expenses is not None else max(10, rows // 200),
+                   users=users, days=days, seed=seed)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Writes a seeded synthetic data set (network log, known apps, expenses).')
+    parser.add_argument('out_dir')
+    parser.add_argument('--rows', type=int, default=1000000, help='Network log rows')
+    parser.add_argument('--domains', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--skew', type=float, default=1.1, help='Zipf exponent of domain and user popularity (0: uniform)')
+    parser.add_argument('--expenses', type=int, help='Expense rows (default: rows / 200)')
+    parser.add_argument('--known-share', type=float, default=0.3, help='Share of the domains in the known-apps catalog')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    paths = generate_dataset(args.out_dir, args.rows, domains=args.domains, users=args.users, skew=args.skew,
+                             expenses=args.expenses, known_share=args.known_share, days=args.days, seed=args.seed)
+    print(f"Wrote {args.rows:,} log rows in {time.perf_counter() - started:.1f}s:")
+    for path in paths.values():
+        print(f"  {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
+
+
+if __name__ == '__main__':
+    main()
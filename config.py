@@ -7,10 +7,56 @@ import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 
+# NETWORK_LOG_FILE may also name a directory or a glob (e.g. 'logs/network-*.csv.gz') of rotated log
+# segments, read in name order. Segments can be gzip (.gz) or zstd (.zst, needs the zstandard package)
+# compressed; they are decompressed while being read.
 NETWORK_LOG_FILE = os.path.join(DATA_DIR, 'network_log_enhanced.csv')
 KNOWN_APPS_FILE = os.path.join(DATA_DIR, 'known_apps_enhanced.csv')
 EXPENSES_FILE = os.path.join(DATA_DIR, 'expenses.csv')
 
+# Parsed and cleaned copies of the CSVs above are kept here in a binary columnar format and reused
+# while the source file's size and mtime are unchanged. Set to None to always parse the CSVs.
+# A segmented network log is cached segment by segment ('frame' mode), so a new segment is the only one parsed.
+DATA_CACHE_DIR = os.path.join(BASE_DIR, 'instance', 'frame_cache')
+
+# --- Network Log Ingestion ---
+# 'frame' parses the whole network log into memory. 'stream' reads it NETWORK_LOG_CHUNK_ROWS rows at a
+# time and keeps only per-domain / per-(domain, user) aggregates, so memory grows with the number of
+# domains and users rather than the number of log rows. Volume totals are summed chunk by chunk there,
+# so they can differ from 'frame' mode in the last floating point digits.
+NETWORK_INGEST_MODE = 'frame'
+NETWORK_LOG_CHUNK_ROWS = 250000
+# Time windows (the since/until API parameters) in 'stream' mode need the (domain, user) aggregates kept
+# per bucket of this many hours of the log, e.g. 1 or 24; window bounds are rounded out to whole buckets.
+# Memory then also grows with the number of buckets the log spans, roughly (domain, user) pairs per
+# bucket times buckets. None keeps no buckets and since/until are rejected in 'stream' mode.
+NETWORK_WINDOW_BUCKET_HOURS = None
+# Processes folding a large log in parallel in 'stream' mode (0: one per CPU). The log is split at line
+# boundaries into parts of at least 32 MB and the partial aggregates are merged in log order, with the
+# same results as a single process (volume totals again up to floating point rounding).
+NETWORK_INGEST_WORKERS = 1
+# A cache refresh only re-reads the sources whose file changed and rescores the apps depending on the
+# change: edited catalog rows, re-linked spend and, in 'stream' mode, the lines appended to the network
+# log since the last read. A truncated, rotated or rewritten log ('frame' mode: any change to it) is
+# reloaded from scratch. With a segmented log only new or changed segments are read again.
+INCREMENTAL_REFRESH = True
+# Refresh the data and the processed snapshot in a background thread every BACKGROUND_REFRESH_INTERVAL_S
+# seconds instead of inside the first request after the cache expires. Requests serve the last good
+# snapshot meanwhile, falling back to reloading themselves once it is older than MAX_SNAPSHOT_AGE_S.
+BACKGROUND_REFRESH = False
+BACKGROUND_REFRESH_INTERVAL_S = 60
+MAX_SNAPSHOT_AGE_S = 600
+# Segments of a segmented network log whose newest row is more than this many days older than the newest
+# row of all segments age out of the data (None: keep every segment).
+NETWORK_LOG_RETENTION_DAYS = None
+# Roll traffic to subdomains of a known app's domain (api.dropbox.com, eu.files.box.com) up into that app,
+# instead of discovering each subdomain as a separate unknown app.
+SUBDOMAIN_ROLLUP = True
+
+# Resolution status changes made from the dashboard are appended to this SQLite journal and layered over
+# the resolution_status column of KNOWN_APPS_FILE (which is no longer rewritten). Latest change wins.
+RESOLUTION_STORE_FILE = os.path.join(BASE_DIR, 'instance', 'resolutions.sqlite3')
+
 # --- Risk Scoring Configuration ---
 RISK_THRESHOLDS = {
     'high': 75,
@@ -31,6 +77,10 @@ RISK_POINTS = {
     'unapproved_spend_penalty': 25,
 }
 
+# 'columnar' scores all apps at once with NumPy and only builds risk factor text when an API shows it.
+# 'per_app' is the original one-app-at-a-time calculation (slower, isolates errors to single apps).
+RISK_SCORING_MODE = 'columnar'
+
 # User count thresholds corresponding to medium/high points
 USER_COUNT_THRESHOLDS = {
     'medium': 3,
@@ -50,9 +100,26 @@ IRRELEVANT_STATUS = 'irrelevant'
 
 
 # --- Trend Analysis ---
-# Number of days to simulate for trend chart
+# Default window of the usage trend chart, in days (ending on the day of the latest logged access)
 TREND_SIMULATION_DAYS = 7
+# Longest window /api/chart_data/usage_trend accepts
+TREND_MAX_DAYS = 366
 
 # --- Frontend Configuration ---
 # Number of top users/apps to show in insights
-BEHAVIOR_INSIGHTS_LIMIT = 5
\ No newline at end of file
+BEHAVIOR_INSIGHTS_LIMIT = 5
+
+# Page size of /api/apps when it is queried with filter/sort/pagination parameters, and its upper limit
+APPS_PAGE_SIZE = 100
+APPS_MAX_PAGE_SIZE = 1000
+# Page size of the /api/users top users listing, and its upper limit
+USERS_PAGE_SIZE = 20
+USERS_MAX_PAGE_SIZE = 1000
+
+# Seconds between keep-alive comments on the /api/stream live update stream. Each one also checks the
+# data sources as a request would (see the cache TTL), so new detections reach open dashboards.
+LIVE_UPDATES_HEARTBEAT_S = 15
+
+# JSON responses of at least this many bytes are gzip-compressed for clients that accept it
+RESPONSE_GZIP_MIN_BYTES = 1024
+RESPONSE_GZIP_LEVEL = 6
\ No newline at end of file
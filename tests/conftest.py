@@ -0,0 +1,28 @@
+# tests/conftest.py
+"""
+Fixtures shared by the test modules: a small seeded synthetic data set (see benchmarks/synthetic.py).
+
+    python -m pytest tests
+"""
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks.synthetic import generate_dataset  # noqa: E402
+
+ROWS = 3000
+
+
+@pytest.fixture(scope='session')
+def dataset(tmp_path_factory):
+    """Paths of a seeded synthetic data set, shared by every test (copy it before changing it)."""
+    return generate_dataset(str(tmp_path_factory.mktemp('synthetic')), ROWS, domains=300, users=100, days=5, seed=7)
+
+
+@pytest.fixture
+def data_copy(dataset, tmp_path):
+    """A private copy of the data set, for tests that edit the files."""
+    return {name: shutil.copy(path, tmp_path) for name, path in dataset.items()}
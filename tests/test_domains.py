@@ -0,0 +1,57 @@
+# tests/test_domains.py
+"""
+Checks of app discovery with and without subdomain rollup, against counts computed row by row.
+"""
+import math
+
+import pandas as pd
+import pytest
+
+from support import api_outputs, make_app
+
+
+def _reference_discovery(network_path, app_of=None):
+    """Per-domain access counts, user sets and upload totals computed row by row, the way discovery started out."""
+    log = pd.read_csv(network_path, keep_default_na=False, dtype=str)
+    apps = {}
+    for domain, user, uploaded in zip(log['destination_domain'], log['user_id'], log['data_uploaded_mb']):
+        if not domain.strip():
+            continue
+        key = app_of(domain.strip()) if app_of else domain.strip()
+        app = apps.setdefault(key, {'count': 0, 'users': set(), 'uploaded': 0.0})
+        app['count'] += 1
+        app['users'].add(user)
+        app['uploaded'] += float(uploaded)
+    return apps
+
+
+def _discovered(outputs):
+    return {app['domain']: {'count': app['network_access_count'], 'users': set(app['unique_users_network']),
+                            'uploaded': app['total_data_uploaded_mb']} for app in outputs['/api/apps']}
+
+
+@pytest.mark.parametrize('mode', ['frame', 'stream'])
+def test_rollup_off_discovers_every_raw_domain(dataset, mode):
+    discovered = _discovered(api_outputs(make_app(dataset, NETWORK_INGEST_MODE=mode, SUBDOMAIN_ROLLUP=False), ['/api/apps']))
+    reference = _reference_discovery(dataset['network'])
+    assert set(discovered) == set(reference)
+    assert any(domain.count('.') > 2 for domain in discovered) # Subdomains stay apps of their own
+    for domain, app in reference.items():
+        assert discovered[domain]['count'] == app['count']
+        assert discovered[domain]['users'] == app['users']
+        assert math.isclose(discovered[domain]['uploaded'], app['uploaded'], rel_tol=1e-9)
+
+
+@pytest.mark.parametrize('mode', ['frame', 'stream'])
+def test_rollup_counts_subdomains_as_their_app(dataset, mode):
+    catalog = set(pd.read_csv(dataset['known_apps'])['domain'])
+
+    def app_of(domain):
+        parts = domain.split('.')
+        known = [suffix for suffix in ('.'.join(parts[i:]) for i in range(len(parts))) if suffix in catalog]
+        return known[0] if known else domain
+
+    discovered = _discovered(api_outputs(make_app(dataset, NETWORK_INGEST_MODE=mode, SUBDOMAIN_ROLLUP=True), ['/api/apps']))
+    reference = _reference_discovery(dataset['network'], app_of)
+    assert {domain: app['count'] for domain, app in discovered.items()} == {domain: app['count'] for domain, app in reference.items()}
+    assert {domain: app['users'] for domain, app in discovered.items()} == {domain: app['users'] for domain, app in reference.items()}
@@ -0,0 +1,81 @@
+# tests/test_http_cache.py
+"""
+Checks of the HTTP caching of the JSON API: ETags naming the process and data version, 304 answers
+to If-None-Match, and gzip around RESPONSE_GZIP_MIN_BYTES.
+"""
+import gzip
+import json
+
+import pytest
+
+from app import http_cache, processing
+from support import make_app
+
+
+def test_etag_names_the_process_and_data_version(dataset):
+    client = make_app(dataset).test_client()
+    response = client.get('/api/summary_stats')
+    etag, weak = response.get_etag()
+    assert weak and etag == f'{http_cache._PROCESS_TAG}-{processing._snapshot.version}'
+    assert response.headers['Cache-Control'] == 'no-cache'
+
+
+@pytest.mark.parametrize('url', ['/api/apps', '/api/summary_stats', '/api/dashboard', '/api/apps?since=24h',
+                                 '/api/users', '/api/chart_data/usage_trend'])
+def test_matching_if_none_match_gets_a_304(dataset, url):
+    client = make_app(dataset).test_client()
+    response = client.get(url)
+    assert response.status_code == 200
+    revalidated = client.get(url, headers={'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b''
+    assert revalidated.headers['ETag'] == response.headers['ETag']
+
+
+def test_etag_of_another_process_or_version_gets_the_response(dataset):
+    client = make_app(dataset).test_client()
+    etag, _ = client.get('/api/apps').get_etag()
+    version = etag.split('-')[-1]
+    for stale in [f'W/"00000000-{version}"', f'W/"{http_cache._PROCESS_TAG}-{int(version) - 1}"']:
+        assert client.get('/api/apps', headers={'If-None-Match': stale}).status_code == 200
+
+
+def test_window_and_trend_requests_do_not_build_the_snapshot(dataset):
+    client = make_app(dataset).test_client()
+    for url in ['/api/apps?since=2d', '/api/summary_stats?since=2023-10-03', '/api/chart_data/usage_trend']:
+        response = client.get(url)
+        assert response.status_code == 200
+        assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert processing._snapshot is None
+
+
+def test_user_revalidation_does_not_build_the_snapshot(dataset):
+    client = make_app(dataset).test_client()
+    etags = {url: client.get(url).headers['ETag'] for url in ['/api/users', '/api/users/user1@example.com']}
+    processing._snapshot = None
+    for url, etag in etags.items():
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    assert processing._snapshot is None
+
+
+def test_large_responses_are_gzipped_for_clients_accepting_it(dataset):
+    client = make_app(dataset, RESPONSE_GZIP_MIN_BYTES=1024).test_client()
+    plain = client.get('/api/apps')
+    assert 'Content-Encoding' not in plain.headers and 'Accept-Encoding' in plain.headers['Vary']
+    assert len(plain.get_data()) >= 1024
+
+    compressed = client.get('/api/apps', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(compressed.get_data())) == plain.get_json()
+
+
+def test_responses_below_the_threshold_are_not_gzipped(dataset):
+    client = make_app(dataset, RESPONSE_GZIP_MIN_BYTES=1024).test_client()
+    small = client.get('/api/chart_data/risk_distribution', headers={'Accept-Encoding': 'gzip'})
+    assert len(small.get_data()) < 1024 and 'Content-Encoding' not in small.headers
+
+    size = len(client.get('/api/apps').get_data())
+    client = make_app(dataset, RESPONSE_GZIP_MIN_BYTES=size + 1).test_client()
+    assert 'Content-Encoding' not in client.get('/api/apps', headers={'Accept-Encoding': 'gzip'}).headers
+    client = make_app(dataset, RESPONSE_GZIP_MIN_BYTES=size).test_client()
+    assert client.get('/api/apps', headers={'Accept-Encoding': 'gzip'}).headers['Content-Encoding'] == 'gzip'
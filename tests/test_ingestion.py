@@ -0,0 +1,73 @@
+# tests/test_ingestion.py
+"""
+Checks of the network log ingestion: stream mode matches frame mode, and malformed rows or logs
+only affect what they have to.
+"""
+import pandas as pd
+import pytest
+
+from app.ingestion import SegmentedLog, stream_network_log
+from support import (API_URLS, api_outputs, assert_close, assert_same_summary, make_app, reset_processing, split_into_segments,
+                     summary_of)
+
+
+def test_stream_mode_matches_frame_mode(dataset):
+    frame = api_outputs(make_app(dataset, NETWORK_INGEST_MODE='frame'))
+    stream = api_outputs(make_app(dataset, NETWORK_INGEST_MODE='stream'))
+    assert_close(stream, frame)
+
+
+@pytest.mark.parametrize('mode', ['frame', 'stream'])
+def test_non_numeric_volume_only_affects_its_domain(data_copy, mode):
+    clean = api_outputs(make_app(data_copy, NETWORK_INGEST_MODE=mode), ['/api/apps'])['/api/apps']
+    log = pd.read_csv(data_copy['network'], dtype=str, keep_default_na=False)
+    bad_domain = log.loc[5, 'destination_domain']
+    log.loc[5, 'data_uploaded_mb'] = 'abc'
+    log.to_csv(data_copy['network'], index=False)
+
+    outputs = api_outputs(make_app(data_copy, NETWORK_INGEST_MODE=mode), API_URLS + ['/api/dashboard'])
+    apps = outputs['/api/apps']
+    assert [app['domain'] for app in apps] == [app['domain'] for app in clean]
+    changed = {app['domain'] for app, before in zip(apps, clean) if app['total_data_uploaded_mb'] != before['total_data_uploaded_mb']}
+    assert changed <= {bad_domain} | {app['domain'] for app in apps if bad_domain.endswith('.' + app['domain'])}
+    if mode == 'frame': # The domain's total falls back to 0.0, as the per-domain sum did
+        assert all(app['total_data_uploaded_mb'] == 0.0 for app in apps if app['domain'] in changed)
+
+
+@pytest.mark.parametrize('mode', ['frame', 'stream'])
+def test_log_without_valid_domains_has_no_apps(data_copy, mode):
+    log = pd.read_csv(data_copy['network'], dtype=str, keep_default_na=False)
+    log['destination_domain'] = ''
+    log.to_csv(data_copy['network'], index=False)
+
+    spender = pd.read_csv(data_copy['expenses'])['user_id'].iloc[0]
+    outputs = api_outputs(make_app(data_copy, NETWORK_INGEST_MODE=mode), API_URLS + ['/api/dashboard', f'/api/users/{spender}'])
+    assert outputs['/api/apps'] == []
+    assert outputs['/api/users?limit=50']['items'] == []
+    assert outputs[f'/api/users/{spender}']['apps'] == [] # Known from the expenses only
+
+
+# --- Parallel and Segmented Folds ---
+def test_parallel_fold_matches_single_pass(dataset):
+    single, _ = stream_network_log(dataset['network'], 997, window_hours=1)
+    parallel, _ = stream_network_log(dataset['network'], 997, workers=3, min_range_bytes=1, window_hours=1)
+    assert_same_summary(summary_of(parallel), summary_of(single))
+    assert_same_summary(summary_of(parallel.window()), summary_of(single.window()))
+
+
+def test_segmented_fold_matches_single_pass(dataset, tmp_path):
+    single, _ = stream_network_log(dataset['network'], 997)
+    segmented = SegmentedLog(split_into_segments(dataset['network'], tmp_path / 'segments'), 997)
+    segmented.refresh()
+    assert_same_summary(summary_of(segmented.aggregates), summary_of(single))
+
+
+def test_cached_segmented_frame_log_matches_single_file(dataset, tmp_path):
+    single = api_outputs(make_app(dataset, NETWORK_INGEST_MODE='frame'))
+    segments = split_into_segments(dataset['network'], tmp_path / 'segments')
+    cache_dir = tmp_path / 'cache'
+    app = make_app({**dataset, 'network': segments}, NETWORK_INGEST_MODE='frame', DATA_CACHE_DIR=str(cache_dir))
+    assert api_outputs(app) == single
+    reset_processing()
+    assert api_outputs(app) == single # Segments served from the frame cache this time
+    assert len(list(cache_dir.glob('*'))) == 3 + 2 # One entry per segment, plus the catalog and expenses
@@ -0,0 +1,65 @@
+# tests/test_live.py
+"""
+Checks of the live dashboard updates: the delta a change publishes (snapshot_delta, ChangeFeed) and
+the Server-Sent Events stream carrying it.
+"""
+import json
+import types
+
+from app import processing
+from app.live import ChangeFeed, snapshot_delta
+from support import api_outputs, make_app
+
+
+def _snapshot(version, *apps):
+    return types.SimpleNamespace(version=version, apps=tuple(apps))
+
+
+def test_snapshot_delta_lists_what_changed():
+    kept = {'domain': 'kept.com', 'calculated_risk_level': 'Low', 'resolution_status': None}
+    previous = _snapshot(1, kept, {'domain': 'gone.com'},
+                         {'domain': 'risky.com', 'calculated_risk_level': 'Low', 'resolution_status': None})
+    current = _snapshot(2, {'domain': 'new.com'}, kept,
+                        {'domain': 'risky.com', 'calculated_risk_level': 'High', 'resolution_status': 'Blocked'})
+    delta = snapshot_delta(previous, current, lambda positions: [current.apps[p]['domain'] for p in positions])
+    assert delta == {'version': 2, 'previous_version': 1, 'added': ['new.com'], 'removed': ['gone.com'],
+                     'risk_changed': [{'domain': 'risky.com', 'from': 'Low', 'to': 'High'}],
+                     'resolution_changed': [{'domain': 'risky.com', 'from': None, 'to': 'Blocked'}],
+                     'apps': ['new.com', 'risky.com']}
+
+
+def test_change_feed_keeps_the_latest_deltas():
+    feed = ChangeFeed(history=2)
+    feed.reset(1)
+    for version in [2, 3, 4]:
+        feed.publish(version, version - 1, f'delta {version}')
+    assert feed.events_since(2) == [(3, 'delta 3'), (4, 'delta 4')]
+    assert feed.events_since(4, timeout=0.01) == []
+    assert feed.events_since(1) is None # Delta 2 is no longer kept
+
+
+def test_resolve_publishes_its_delta(dataset, tmp_path):
+    app = make_app(dataset, RESOLUTION_STORE_FILE=str(tmp_path / 'resolutions.sqlite3'))
+    domain = next(a['domain'] for a in api_outputs(app, ['/api/apps'])['/api/apps'] if a['status'] != 'unknown')
+    with app.app_context():
+        version = processing.live_update_version()
+
+    client = app.test_client()
+    assert client.post(f'/api/apps/{domain}/resolve', json={'resolution_status': 'Blocked'}).status_code == 200
+    with app.app_context():
+        events = processing.wait_for_live_updates(version, 0)
+    assert [event_version for event_version, _ in events] == [version + 1]
+    delta = json.loads(events[0][1])
+    assert (delta['version'], delta['previous_version']) == (version + 1, version)
+    assert delta['added'] == [] and delta['removed'] == []
+    assert delta['resolution_changed'] == [{'domain': domain, 'from': None, 'to': 'Blocked'}]
+    assert [a['domain'] for a in delta['apps']] == [domain]
+    current = next(a for a in api_outputs(app, ['/api/apps'])['/api/apps'] if a['domain'] == domain)
+    assert delta['apps'][0] == current
+
+    # The same delta, as an event of the stream
+    response = client.get(f'/api/stream?since={version}', buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks).startswith(b'retry:')
+    assert next(chunks).decode() == f'id: {version + 1}\nevent: delta\ndata: {events[0][1]}\n\n'
+    response.close()
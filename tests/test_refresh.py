@@ -0,0 +1,82 @@
+# tests/test_refresh.py
+"""
+Checks of the data refresh: refreshing incrementally gives the same API outputs as a full reload.
+"""
+import os
+
+import pandas as pd
+import pytest
+
+from app import processing
+from support import api_outputs, assert_close, expire_cache, make_app, reset_processing, summary_of, write_lines
+
+
+def test_incremental_log_refresh_matches_full_reload(data_copy):
+    with open(data_copy['network'], newline='') as f:
+        lines = f.readlines()
+    write_lines(data_copy['network'], lines[:len(lines) * 2 // 3])
+    app = make_app(data_copy, NETWORK_INGEST_MODE='stream', INCREMENTAL_REFRESH=True)
+    api_outputs(app)
+    with open(data_copy['network'], 'a', newline='') as f:
+        f.writelines(lines[len(lines) * 2 // 3:])
+    expire_cache()
+    incremental = api_outputs(app)
+    assert processing._cached_data['network_tail'] is not None
+
+    reset_processing()
+    assert_close(incremental, api_outputs(app))
+
+
+def test_incremental_log_refresh_leaves_the_published_version_alone(data_copy):
+    with open(data_copy['network'], newline='') as f:
+        lines = f.readlines()
+    write_lines(data_copy['network'], lines[:len(lines) // 2])
+    app = make_app(data_copy, NETWORK_INGEST_MODE='stream', INCREMENTAL_REFRESH=True)
+    api_outputs(app)
+    published = processing._cached_data
+    aggregates, rollups, offset = published['network_aggregates'], published['usage_rollups'], published['network_tail'].offset
+    rows, summary, series = aggregates.rows_ingested, summary_of(aggregates), rollups.series('hour', 0, 10**6)
+
+    with open(data_copy['network'], 'a', newline='') as f:
+        f.writelines(lines[len(lines) // 2:])
+    expire_cache()
+    api_outputs(app)
+    assert processing._cached_data['version'] > published['version']
+    assert processing._cached_data['network_aggregates'].rows_ingested == len(lines) - 1
+    # Version N still reads what it was built from
+    assert (aggregates.rows_ingested, published['network_tail'].offset) == (rows, offset)
+    assert summary_of(aggregates)[1] == summary[1]
+    assert summary_of(aggregates)[0].equals(summary[0])
+    assert all((a == b).all() for a, b in zip(rollups.series('hour', 0, 10**6), series))
+
+
+def test_appended_lines_without_valid_domains_are_not_read_again(data_copy):
+    app = make_app(data_copy, NETWORK_INGEST_MODE='stream', INCREMENTAL_REFRESH=True)
+    before = api_outputs(app)
+    rows = processing._cached_data['network_aggregates'].rows_ingested
+    with open(data_copy['network'], 'a', newline='') as f:
+        f.write('2023-10-06T00:00:00Z,user1@example.com,10.0.0.1,,1.0,1.0\n')
+    expire_cache()
+    assert api_outputs(app) == before
+    assert processing._cached_data['network_aggregates'].rows_ingested == rows + 1
+    assert processing._cached_data['network_tail'].state() == 'unchanged'
+
+
+@pytest.mark.parametrize('mode', ['frame', 'stream'])
+def test_incremental_catalog_and_expense_refresh_matches_full_reload(data_copy, mode):
+    app = make_app(data_copy, NETWORK_INGEST_MODE=mode, INCREMENTAL_REFRESH=True)
+    api_outputs(app)
+    catalog = pd.read_csv(data_copy['known_apps'], dtype=str, keep_default_na=False)
+    catalog.loc[0, 'status'] = 'unsanctioned' if catalog.loc[0, 'status'] != 'unsanctioned' else 'sanctioned'
+    catalog.loc[1, 'inherent_risk_score'] = '10'
+    catalog.to_csv(data_copy['known_apps'], index=False)
+    expenses = pd.read_csv(data_copy['expenses'], dtype=str, keep_default_na=False)
+    expenses.loc[0, 'amount'] = '99999.0'
+    expenses.to_csv(data_copy['expenses'], index=False)
+    for path in [data_copy['known_apps'], data_copy['expenses']]:
+        os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10**9))
+    expire_cache()
+    incremental = api_outputs(app)
+
+    reset_processing()
+    assert incremental == api_outputs(app)
@@ -0,0 +1,88 @@
+# tests/test_refresher.py
+"""
+Checks of the background refresher: it picks up changed sources without any request, and requests
+reload the data themselves once the snapshot is older than MAX_SNAPSHOT_AGE_S.
+"""
+import contextlib
+import datetime
+import io
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from app import processing
+from app.refresher import BackgroundRefresher
+from support import api_outputs, make_app, reset_processing
+
+
+@pytest.fixture(autouse=True)
+def stop_refresher():
+    yield
+    processing.stop_background_refresh(timeout=10)
+
+
+def _edit_catalog(paths):
+    catalog = pd.read_csv(paths['known_apps'], dtype=str, keep_default_na=False)
+    catalog['inherent_risk_score'] = '10'
+    catalog.to_csv(paths['known_apps'], index=False)
+    os.utime(paths['known_apps'], ns=(os.stat(paths['known_apps']).st_atime_ns, os.stat(paths['known_apps']).st_mtime_ns + 10**9))
+
+
+def _wait_for(condition, timeout_s=10):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+
+def test_refresher_picks_up_a_changed_source(data_copy):
+    app = make_app(data_copy, BACKGROUND_REFRESH=True, BACKGROUND_REFRESH_INTERVAL_S=0.05)
+    _wait_for(lambda: processing.get_data_status()['snapshot_version'] is not None)
+    before = processing.get_data_status()['data_version']
+
+    _edit_catalog(data_copy) # No request from here on: the thread alone loads and processes the change
+    _wait_for(lambda: processing.get_data_status()['snapshot_version'] > before)
+    assert processing.get_data_status()['data_version'] == processing.get_data_status()['snapshot_version']
+    refreshed = api_outputs(app)
+
+    processing.stop_background_refresh(timeout=10)
+    reset_processing()
+    assert api_outputs(app) == refreshed
+
+
+def test_requests_reload_once_the_snapshot_is_too_old(data_copy):
+    app = make_app(data_copy, BACKGROUND_REFRESH=True, BACKGROUND_REFRESH_INTERVAL_S=3600, MAX_SNAPSHOT_AGE_S=60)
+    _wait_for(lambda: processing.get_data_status()['snapshot_version'] is not None) # Its first refresh, then it sleeps
+    client = app.test_client()
+    before = client.get('/api/status').get_json()
+    assert before['background_refresh']
+
+    _edit_catalog(data_copy)
+    stale = api_outputs(app)
+    assert client.get('/api/status').get_json()['data_version'] == before['data_version'] # Served from the snapshot meanwhile
+
+    # As if the refresher had been stuck for longer than MAX_SNAPSHOT_AGE_S
+    processing._data_load_time -= datetime.timedelta(seconds=61)
+    reloaded = api_outputs(app)
+    status = client.get('/api/status').get_json()
+    assert status['data_version'] > before['data_version'] and status['snapshot_age_s'] < 60
+    assert reloaded != stale
+
+
+def test_refresher_keeps_going_after_a_failed_refresh(dataset):
+    app = make_app(dataset)
+    calls = []
+
+    def refresh():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise RuntimeError("source unavailable")
+    refresher = BackgroundRefresher(app, refresh, 0.01)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        refresher.start()
+        _wait_for(lambda: len(calls) >= 3)
+        refresher.stop(timeout=10)
+    assert not refresher.is_alive()
+    assert "Background refresh failed: source unavailable" in output.getvalue()
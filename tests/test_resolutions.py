@@ -0,0 +1,50 @@
+# tests/test_resolutions.py
+"""
+Checks of the resolution endpoints: bulk resolve filters and resolving single apps.
+"""
+import contextlib
+import io
+
+import pytest
+
+from app import processing
+from support import api_outputs, make_app, reset_processing
+
+
+@pytest.mark.parametrize('bad_filter', [{'status': {'a': 1}}, {'status': [1, None]}, {'status': True}, {'status': None}])
+def test_bulk_resolve_rejects_malformed_filter_values(dataset, tmp_path, bad_filter):
+    app = make_app(dataset, RESOLUTION_STORE_FILE=str(tmp_path / 'resolutions.sqlite3'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = app.test_client().post('/api/apps/resolve', json={'filter': bad_filter, 'resolution_status': 'Sanctioned'})
+    assert response.status_code == 400
+    assert 'filter' in response.get_json()['error']
+
+
+def test_bulk_resolve_accepts_numeric_filter_values(dataset, tmp_path):
+    app = make_app(dataset, RESOLUTION_STORE_FILE=str(tmp_path / 'resolutions.sqlite3'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = app.test_client().post('/api/apps/resolve', json={'filter': {'status': 5, 'min_upload_mb': 1e9},
+                                                                     'resolution_status': 'Sanctioned'})
+    assert response.status_code == 200
+    assert response.get_json()['updated'] == 0
+
+
+def test_single_resolve_rescores_only_its_app_and_matches_a_full_reload(dataset, tmp_path, monkeypatch):
+    app = make_app(dataset, RESOLUTION_STORE_FILE=str(tmp_path / 'resolutions.sqlite3'))
+    domain = next(app['domain'] for app in api_outputs(app, ['/api/apps'])['/api/apps'] if app['status'] != 'unknown')
+    rescored, rescore_changed_apps = [], processing._rescore_changed_apps
+
+    def spy(previous, rediscover, rescore, *args):
+        rescored.append((rediscover, rescore))
+        return rescore_changed_apps(previous, rediscover, rescore, *args)
+    monkeypatch.setattr(processing, '_rescore_changed_apps', spy)
+
+    response = app.test_client().post(f'/api/apps/{domain}/resolve', json={'resolution_status': 'Blocked'})
+    assert response.status_code == 200
+    assert rescored == [(set(), {domain})]
+    incremental = api_outputs(app)
+    assert next(a for a in incremental['/api/apps'] if a['domain'] == domain)['resolution_status'] == 'Blocked'
+
+    reset_processing() # The resolution store keeps the change
+    assert api_outputs(app) == incremental
+    assert len(rescored) == 1
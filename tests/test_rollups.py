@@ -0,0 +1,70 @@
+# tests/test_rollups.py
+"""
+Checks of the usage trend chart read from the usage rollups: its series against counts computed from
+the log rows, the default window and the window size limit.
+"""
+import math
+
+import pandas as pd
+import pytest
+
+from support import api_outputs, make_app
+
+TREND_URL = '/api/chart_data/usage_trend'
+
+
+def _reference_series(network_path, unit, domain=None):
+    """{bucket label: (access count, uploaded MB)} of the log rows with a valid domain, per day or hour."""
+    log = pd.read_csv(network_path, keep_default_na=False, dtype=str)
+    log['destination_domain'] = log['destination_domain'].str.strip()
+    log = log[log['destination_domain'] != '']
+    if domain is not None:
+        log = log[log['destination_domain'] == domain]
+    stamps = pd.to_datetime(log['timestamp'], utc=True).dt.tz_localize(None)
+    labels = stamps.dt.strftime('%Y-%m-%d' if unit == 'day' else '%Y-%m-%dT%H:00')
+    uploaded = log['data_uploaded_mb'].astype(float)
+    return {label: (len(group), uploaded[group.index].sum()) for label, group in log.groupby(labels)}
+
+
+def _assert_series(trend, reference):
+    for label, count, mb in zip(trend['labels'], trend['values'], trend['uploaded_mb']):
+        expected_count, expected_mb = reference.get(label, (0, 0.0))
+        assert count == expected_count, label
+        assert math.isclose(mb, round(expected_mb, 2), abs_tol=0.011), label
+
+
+@pytest.mark.parametrize('mode', ['frame', 'stream'])
+def test_daily_trend_matches_the_log(dataset, mode):
+    app = make_app(dataset, NETWORK_INGEST_MODE=mode)
+    trend = api_outputs(app, [f'{TREND_URL}?days=5'])[f'{TREND_URL}?days=5']
+    assert trend['granularity'] == 'day'
+    assert trend['labels'] == ['2023-10-01', '2023-10-02', '2023-10-03', '2023-10-04', '2023-10-05']
+    reference = _reference_series(dataset['network'], 'day')
+    _assert_series(trend, reference)
+    assert sum(trend['values']) == sum(count for count, _ in reference.values()) # Every valid row falls in the window
+
+
+@pytest.mark.parametrize('mode', ['frame', 'stream'])
+def test_hourly_trend_of_one_domain_matches_the_log(dataset, mode):
+    domain = pd.read_csv(dataset['network'])['destination_domain'].value_counts().index[0]
+    url = f'{TREND_URL}?granularity=hour&start=2023-10-02&end=2023-10-03&domain={domain}'
+    trend = api_outputs(make_app(dataset, NETWORK_INGEST_MODE=mode, SUBDOMAIN_ROLLUP=False), [url])[url]
+    assert len(trend['labels']) == 48
+    assert trend['labels'][0] == '2023-10-02T00:00' and trend['labels'][-1] == '2023-10-03T23:00'
+    assert sum(trend['values']) > 0
+    _assert_series(trend, _reference_series(dataset['network'], 'hour', domain))
+
+
+def test_trend_defaults_to_the_configured_days_up_to_the_latest_access(dataset):
+    trend = api_outputs(make_app(dataset, TREND_SIMULATION_DAYS=3), [TREND_URL])[TREND_URL]
+    assert trend['labels'] == ['2023-10-03', '2023-10-04', '2023-10-05']
+    _assert_series(trend, _reference_series(dataset['network'], 'day'))
+
+
+@pytest.mark.parametrize('query', ['days=11', 'start=2023-09-25&end=2023-10-05', 'granularity=hour&days=11'])
+def test_trend_rejects_windows_longer_than_the_limit(dataset, query):
+    client = make_app(dataset, TREND_MAX_DAYS=10).test_client()
+    response = client.get(f'{TREND_URL}?{query}')
+    assert response.status_code == 400
+    assert '10 days' in response.get_json()['error']
+    assert client.get(f'{TREND_URL}?days=10').status_code == 200
@@ -0,0 +1,11 @@
+# tests/test_scoring.py
+"""
+Checks of the risk scoring: the columnar scorer gives the same API outputs as scoring app by app.
+"""
+from support import api_outputs, make_app
+
+
+def test_columnar_scoring_matches_per_app(dataset):
+    columnar = api_outputs(make_app(dataset, RISK_SCORING_MODE='columnar'))
+    per_app = api_outputs(make_app(dataset, RISK_SCORING_MODE='per_app'))
+    assert columnar == per_app
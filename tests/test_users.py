@@ -0,0 +1,89 @@
+# tests/test_users.py
+"""
+Checks of the per-user drill-down (UserAppIndex, UserExpenseIndex) against the computation it replaces:
+grouping the log and expense rows by user, and scanning every app's user list.
+"""
+import math
+
+import pandas as pd
+import pytest
+
+from support import api_outputs, make_app
+
+
+def _reference_users(paths):
+    """({user: {domain: (count, uploaded, downloaded, first seen, last seen)}}, {user: [expense ids]}, {user: amount total})."""
+    log = pd.read_csv(paths['network'], keep_default_na=False, dtype=str)
+    log['destination_domain'] = log['destination_domain'].str.strip()
+    log = log[log['destination_domain'] != '']
+    log['timestamp'] = pd.to_datetime(log['timestamp'], utc=True).dt.tz_localize(None)
+    apps = {}
+    for (user, domain), rows in log.groupby(['user_id', 'destination_domain']):
+        apps.setdefault(user, {})[domain] = (len(rows), rows['data_uploaded_mb'].astype(float).sum(),
+                                             rows['data_downloaded_mb'].astype(float).sum(),
+                                             rows['timestamp'].min().isoformat(), rows['timestamp'].max().isoformat())
+    expenses = pd.read_csv(paths['expenses'], dtype={'user_id': str})
+    expense_ids = expenses.groupby('user_id')['expense_id'].apply(list).to_dict()
+    expense_totals = expenses.groupby('user_id')['amount'].sum().to_dict()
+    return apps, expense_ids, expense_totals
+
+
+def _users_of_apps(outputs):
+    """{user: set of app domains}, scanning every app's unique_users_network list."""
+    users = {}
+    for app in outputs['/api/apps']:
+        for user in app['unique_users_network']:
+            users.setdefault(user, set()).add(app['domain'])
+    return users
+
+
+@pytest.mark.parametrize('mode', ['frame', 'stream'])
+def test_user_detail_matches_the_log_and_expenses(dataset, mode):
+    app = make_app(dataset, NETWORK_INGEST_MODE=mode, SUBDOMAIN_ROLLUP=False)
+    apps, expense_ids, expense_totals = _reference_users(dataset)
+    users_of_apps = _users_of_apps(api_outputs(app, ['/api/apps']))
+    users = sorted(set(apps) | set(expense_ids))
+    details = api_outputs(app, [f'/api/users/{user}' for user in users])
+    for user in users:
+        detail = details[f'/api/users/{user}']
+        reference = apps.get(user, {})
+        assert [a['domain'] for a in detail['apps']] == sorted(reference, key=lambda domain: (-reference[domain][0], domain))
+        assert {a['domain'] for a in detail['apps']} == users_of_apps.get(user, set())
+        for a in detail['apps']:
+            count, uploaded, downloaded, first_seen, last_seen = reference[a['domain']]
+            assert (a['access_count'], a['first_seen'], a['last_seen']) == (count, first_seen, last_seen)
+            assert math.isclose(a['uploaded_mb'], uploaded, rel_tol=1e-9, abs_tol=1e-9)
+            assert math.isclose(a['downloaded_mb'], downloaded, rel_tol=1e-9, abs_tol=1e-9)
+        assert detail['app_count'] == len(reference)
+        assert detail['access_count'] == sum(r[0] for r in reference.values())
+        assert math.isclose(detail['uploaded_mb'], sum(r[1] for r in reference.values()), rel_tol=1e-9, abs_tol=1e-9)
+        assert [e['expense_id'] for e in detail['expenses']] == expense_ids.get(user, [])
+        assert detail['expense_count'] == len(expense_ids.get(user, []))
+        assert math.isclose(detail['expense_total'], round(expense_totals.get(user, 0.0), 2), abs_tol=1e-9)
+
+
+@pytest.mark.parametrize('mode', ['frame', 'stream'])
+def test_rolled_up_user_apps_match_the_app_user_lists(dataset, mode):
+    app = make_app(dataset, NETWORK_INGEST_MODE=mode, SUBDOMAIN_ROLLUP=True)
+    users_of_apps = _users_of_apps(api_outputs(app, ['/api/apps']))
+    details = api_outputs(app, [f'/api/users/{user}' for user in users_of_apps])
+    for user, domains in users_of_apps.items():
+        assert {a['domain'] for a in details[f'/api/users/{user}']['apps']} == domains
+
+
+@pytest.mark.parametrize('sort', ['access_count', 'uploaded_mb', 'app_count'])
+def test_top_users_match_the_grouped_log(dataset, sort):
+    app = make_app(dataset, SUBDOMAIN_ROLLUP=False)
+    apps, expense_ids, expense_totals = _reference_users(dataset)
+    url = f'/api/users?sort={sort}&limit=1000'
+    listing = api_outputs(app, [url])[url]
+    assert listing['total'] == len(apps) and listing['next_offset'] is None
+    totals = {user: {'access_count': sum(r[0] for r in rows.values()), 'uploaded_mb': sum(r[1] for r in rows.values()),
+                     'app_count': len(rows)} for user, rows in apps.items()}
+    assert [item['user_id'] for item in listing['items']] == sorted(totals, key=lambda user: (-totals[user][sort], user))
+    for item in listing['items']:
+        expected = totals[item['user_id']]
+        assert (item['access_count'], item['app_count']) == (expected['access_count'], expected['app_count'])
+        assert math.isclose(item['uploaded_mb'], expected['uploaded_mb'], rel_tol=1e-9)
+        assert item['expense_count'] == len(expense_ids.get(item['user_id'], []))
+        assert math.isclose(item['expense_total'], round(expense_totals.get(item['user_id'], 0.0), 2), abs_tol=1e-9)
@@ -0,0 +1,79 @@
+# tests/test_windows.py
+"""
+Checks of the since/until time windows: parsing the parameters, and the log rows a window covers.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.queries import QueryError
+from app.windows import TimeWindow
+from support import api_outputs, make_app
+
+LATEST = np.datetime64('2023-10-05T23:00:00', 'ns')
+
+
+# --- Parameters ---
+@pytest.mark.parametrize('args, since, until', [
+    ({'since': '24h'}, np.datetime64('2023-10-04T23:00:00', 'ns'), None),
+    ({'since': '2d', 'until': '1d'}, np.datetime64('2023-10-03T23:00:00', 'ns'), np.datetime64('2023-10-04T23:00:00', 'ns')),
+    ({'since': '2023-10-02', 'until': '2023-10-03'}, np.datetime64('2023-10-02', 'ns'), np.datetime64('2023-10-04', 'ns')),
+    ({'since': '2023-10-02T06:30:00'}, np.datetime64('2023-10-02T06:30:00', 'ns'), None),
+    ({'until': '2023-10-02T08:00:00+02:00'}, None, np.datetime64('2023-10-02T06:00:00', 'ns')),
+    ({'since': '0001-01-01', 'until': '9999-12-31'}, np.datetime64('1677-09-22', 'ns'), np.datetime64('2262-04-11', 'ns')),
+    ({'since': '999999d'}, np.datetime64('1677-09-22', 'ns'), None),
+])
+def test_window_bounds(args, since, until):
+    assert TimeWindow.from_args(args).bounds(LATEST) == (since, until)
+
+
+def test_no_window_without_parameters():
+    assert TimeWindow.from_args({'since': ' ', 'until': ''}) is None
+
+
+@pytest.mark.parametrize('args', [{'since': 'yesterday'}, {'since': '-1d'}, {'since': '2023-13-01'}, {'since': '99999999999d'},
+                                  {'until': '99999999999999999999h'}, {'since': '2023-10-03', 'until': '2023-10-02'},
+                                  {'since': '1d', 'until': '2d'}])
+def test_invalid_window_parameters(args):
+    with pytest.raises(QueryError):
+        TimeWindow.from_args(args)
+
+
+@pytest.mark.parametrize('query', ['since=99999999999d', 'until=99999999999999999999h', 'since=2023-10-02T25:00'])
+def test_api_rejects_invalid_window(dataset, query):
+    client = make_app(dataset).test_client()
+    for url in ['/api/apps', '/api/summary_stats', '/api/behavior_insights']:
+        response = client.get(f'{url}?{query}')
+        assert response.status_code == 400, url
+        assert 'error' in response.get_json()
+
+
+# --- Rows of a Window ---
+def _reference_counts(network_path, since, until):
+    """Access count per domain of the log rows logged in [since, until)."""
+    log = pd.read_csv(network_path, keep_default_na=False, dtype=str)
+    stamps = pd.to_datetime(log['timestamp'], utc=True).dt.tz_localize(None)
+    inside = log[(stamps >= since) & (stamps < until)]
+    domains = inside['destination_domain'].str.strip()
+    return domains[domains != ''].value_counts().to_dict()
+
+
+@pytest.mark.parametrize('mode', ['frame', 'stream'])
+def test_window_covers_the_rows_logged_inside_it(dataset, mode):
+    app = make_app(dataset, NETWORK_INGEST_MODE=mode, NETWORK_WINDOW_BUCKET_HOURS=1, SUBDOMAIN_ROLLUP=False)
+    url = '/api/apps?since=2023-10-02T06:00:00&until=2023-10-03' # Whole buckets, so stream mode is exact too
+    apps = api_outputs(app, [url])[url]
+    reference = _reference_counts(dataset['network'], datetime.datetime(2023, 10, 2, 6), datetime.datetime(2023, 10, 4))
+    assert reference and len(reference) < len(api_outputs(app, ['/api/apps'])['/api/apps'])
+    assert {app['domain']: app['network_access_count'] for app in apps} == reference
+
+
+def test_relative_window_counts_back_from_the_latest_access(dataset):
+    app = make_app(dataset, NETWORK_INGEST_MODE='frame', SUBDOMAIN_ROLLUP=False)
+    apps = api_outputs(app, ['/api/apps?since=36h'])['/api/apps?since=36h']
+    log = pd.read_csv(dataset['network'], keep_default_na=False, dtype=str)
+    latest = pd.to_datetime(log['timestamp'], utc=True).max().tz_localize(None)
+    reference = _reference_counts(dataset['network'], latest - pd.Timedelta(hours=36), latest + pd.Timedelta(seconds=1))
+    assert {app['domain']: app['network_access_count'] for app in apps} == reference